@@ -4,13 +4,14 @@ from tkinter import filedialog
 import threading
 
 import customtkinter as ctk
-from elevenlabs import voices
 import irsdk
 from PIL import Image
 
 from core import common
 from core import director
 from core import editor
+from core import transport
+from core import voices
 from utility import defaults
 
 
@@ -54,6 +55,12 @@ class App(ctk.CTk):
         # Set up the iRacing SDK
         common.ir = irsdk.IRSDK()
 
+        # Set up the shared HTTP transport
+        common.transport = transport.create_transport()
+
+        # Set up the ElevenLabs voice registry
+        common.voices = voices.create_voice_registry()
+
         # Set window properties
         ctk.set_appearance_mode("Dark")
         ctk.set_default_color_theme("blue")
@@ -117,6 +124,37 @@ class App(ctk.CTk):
         )
         self.btn_start_stop.pack(padx=20, pady=20)
 
+    def _check_capture_range(self):
+        """Check the capture range in the settings can be used.
+
+        Returns:
+            str: A message describing the problem, or None if the range is
+                fine.
+        """
+        general = common.settings["general"]
+        mode = general["capture_range"]
+
+        # Without a range, the start and end aren't used
+        if mode not in ("laps", "time"):
+            return None
+
+        # The start and end must be numbers, and whole numbers for laps
+        try:
+            start = float(general["range_start"])
+            end = float(general["range_end"])
+        except ValueError:
+            return "The capture range start and end must be numbers."
+        if mode == "laps" and not (start.is_integer() and end.is_integer()):
+            return "The capture range start and end must be whole laps."
+
+        # The range must go forwards
+        if start < 0:
+            return "The capture range can't start before 0."
+        if end > 0 and end <= start:
+            return "The capture range must end after it starts."
+
+        return None
+
     def _create_checkbox(self, master, name, text, default, variable={}):
         """Create a checkbox for the frame.
         
@@ -649,6 +687,37 @@ class App(ctk.CTk):
             self.current_settings
         )
 
+        # Create the capture range dropdown
+        default = common.settings["general"]["capture_range"]
+        self._create_dropdown(
+            self.frm_settings,
+            "capture_range",
+            "Capture Range",
+            ["session", "laps", "time"],
+            default,
+            self.current_settings
+        )
+
+        # Create the range start entry box
+        default = common.settings["general"]["range_start"]
+        self._create_entry(
+            self.frm_settings,
+            "range_start",
+            "Range Start (lap or seconds)",
+            default,
+            variable=self.current_settings
+        )
+
+        # Create the range end entry box
+        default = common.settings["general"]["range_end"]
+        self._create_entry(
+            self.frm_settings,
+            "range_end",
+            "Range End (lap or seconds, 0 for none)",
+            default,
+            variable=self.current_settings
+        )
+
         # Create commentary section
         self._create_section(
             self.frm_settings, 
@@ -658,7 +727,7 @@ class App(ctk.CTk):
         )
         
         # Get list of voices
-        voice_list = [voice.name for voice in voices()]
+        voice_list = common.voices.names()
 
         # Create play-by-play voice dropdown
         default = common.settings["commentary"]["pbp_voice"]
@@ -712,6 +781,16 @@ class App(ctk.CTk):
             variable=self.current_settings
         )
 
+        # Create replay deterministic mode checkbox
+        default = common.settings["commentary"]["replay_deterministic"]
+        self._create_checkbox(
+            self.frm_settings,
+            "replay_deterministic",
+            "Replay Deterministic Mode",
+            default,
+            variable=self.current_settings
+        )
+
         # Create save settings button
         self.btn_save_settings = ctk.CTkButton(
             master=self.frm_settings,
@@ -976,31 +1055,52 @@ class App(ctk.CTk):
                 self.add_message(error_message)
                 return
             
+            # Check the capture range can be used
+            error_message = self._check_capture_range()
+            if error_message is not None:
+                self.add_message(error_message)
+                return
+
             # Change button text
             self.btn_start_stop.configure(text="⏹ Stop Commentary")
 
             # Run editor's cleanup in case of crash during previous run
             self.editor.cleanup()
 
-            # Run the director in a separate thread
+            # Run the director in a separate thread (it says when the replay
+            # is ready)
             self.director.start()
 
             # Add message
-            self.add_message("Commentary started!")
+            self.add_message("Preparing the replay...")
 
         else:
-            # Change button text
-            self.btn_start_stop.configure(text="⏵ Start Commentary")
+            self.stop_commentary()
+
+    def stop_commentary(self):
+        """Stop the commentary and generate the video, if it is running.
+
+        This method changes the button text back to "Start Commentary", stops
+        the director and creates the video. It does nothing if the commentary
+        has already been stopped, so it is safe to schedule when the capture
+        range ends, even if the button was pressed at the same time.
+        """
+        # Do nothing if the commentary isn't running
+        if self.btn_start_stop.cget("text") == "⏵ Start Commentary":
+            return
 
-            # Stop the director
-            self.director.stop()
+        # Change button text
+        self.btn_start_stop.configure(text="⏵ Start Commentary")
 
-            # Add messages
-            self.add_message("Commentary stopped!")
-            self.add_message("Generating video...")
+        # Stop the director
+        self.director.stop()
 
-            # Create the video
-            threading.Thread(target=self.editor.create_video).start()
+        # Add messages
+        self.add_message("Commentary stopped!")
+        self.add_message("Generating video...")
 
-            # Add message
-            self.add_message("Video generated!")
\ No newline at end of file
+        # Create the video
+        threading.Thread(target=self.editor.create_video).start()
+
+        # Add message
+        self.add_message("Video generated!")
\ No newline at end of file
@@ -0,0 +1,395 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+from core import common
+
+
+class ResponseCache:
+    """An on-disk cache of chat completion responses.
+
+    Responses are stored in a SQLite database, keyed by a hash of the model
+    and the normalised prompt. When the database grows past its size limit,
+    the least recently used responses are evicted. This allows a replay to be
+    re-rendered without paying for the same completions again.
+    """
+
+    def __init__(self, file, max_size, deterministic=False):
+        """Initialize the ResponseCache class.
+
+        Args:
+            file (str): The path to the SQLite database file.
+            max_size (int): The maximum size of the cached responses in bytes.
+            deterministic (bool): Whether or not to mask the parts of a prompt
+                which change between runs of the same replay.
+
+        Attributes:
+            max_size (int): The maximum size of the cached responses in bytes.
+            deterministic (bool): Whether or not replay deterministic mode is
+                enabled.
+            hits (int): The number of lookups which found a response.
+            misses (int): The number of lookups which found nothing.
+        """
+        # Store the settings
+        self.max_size = max_size
+        self.deterministic = deterministic
+
+        # Create the hit and miss counters
+        self.hits = 0
+        self.misses = 0
+
+        # Create the folder for the database if needed
+        folder = os.path.dirname(file)
+        if folder != "":
+            os.makedirs(folder, exist_ok=True)
+
+        # Open the database (shared between the director and events threads)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, "
+                "model TEXT, "
+                "response TEXT, "
+                "size INTEGER, "
+                "last_used REAL)"
+            )
+
+    def _evict(self):
+        """Remove the least recently used responses until under the limit."""
+        # Get the total size of the cached responses
+        total = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+        # If the cache is within its limit, there is nothing to do
+        if total <= self.max_size:
+            return
+
+        # Go through the responses from least to most recently used
+        rows = self.connection.execute(
+            "SELECT key, size FROM responses ORDER BY last_used ASC"
+        ).fetchall()
+        for key, size in rows:
+            self.connection.execute(
+                "DELETE FROM responses WHERE key = ?",
+                (key,)
+            )
+            total -= size
+
+            # Stop once the cache is back within its limit
+            if total <= self.max_size:
+                break
+
+    def _normalise(self, messages):
+        """Normalise a list of messages into a single string.
+
+        Collapses whitespace so formatting changes do not affect the key. In
+        replay deterministic mode, the key is also narrowed to what the race
+        looked like. The "seconds ago" of each event and the race clock are
+        masked, since they depend on when the prompt was sent. Gaps, lap
+        times and lap percentages are rounded to one decimal place, since
+        they shift slightly with the timing of each update. Earlier
+        commentary is left out, since it depends on which earlier prompts
+        were cached.
+
+        Args:
+            messages (list): The messages sent to the API.
+
+        Returns:
+            str: The normalised prompt.
+        """
+        # Leave out earlier commentary in replay deterministic mode
+        if self.deterministic:
+            messages = [m for m in messages if m.get("role") != "assistant"]
+
+        # Flatten the messages into one string
+        prompt = json.dumps(messages, sort_keys=True)
+
+        # Collapse whitespace
+        prompt = re.sub(r"\s+", " ", prompt).strip()
+
+        # Mask and round values that change between runs of the same replay
+        if self.deterministic:
+            prompt = re.sub(
+                r"\d+(\.\d+)? seconds ago",
+                "# seconds ago",
+                prompt
+            )
+            prompt = re.sub(r"\d+:\d\d:\d\d of", "# of", prompt)
+            prompt = re.sub(
+                r"\d+\.\d+",
+                lambda match: f"{float(match.group()):.1f}",
+                prompt
+            )
+
+        return prompt
+
+    def key(self, model, messages):
+        """Get the cache key for a prompt.
+
+        Args:
+            model (str): The model the prompt is sent to.
+            messages (list): The messages sent to the API.
+
+        Returns:
+            str: The hexadecimal SHA-256 hash of the model and prompt.
+        """
+        prompt = self._normalise(messages)
+        return hashlib.sha256(f"{model}\n{prompt}".encode()).hexdigest()
+
+    def get(self, model, messages):
+        """Look up the cached response for a prompt.
+
+        Args:
+            model (str): The model the prompt is sent to.
+            messages (list): The messages sent to the API.
+
+        Returns:
+            str: The cached response, or None if there is no cached response.
+        """
+        key = self.key(model, messages)
+
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT response FROM responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+
+            # Count the miss if nothing was found
+            if row is None:
+                self.misses += 1
+                return None
+
+            # Otherwise, mark the response as recently used
+            self.connection.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?",
+                (time.time(), key)
+            )
+            self.hits += 1
+
+        return row[0]
+
+    def put(self, model, messages, response):
+        """Store the response for a prompt.
+
+        Args:
+            model (str): The model the prompt was sent to.
+            messages (list): The messages sent to the API.
+            response (str): The response returned by the API.
+        """
+        key = self.key(model, messages)
+        size = len(response.encode())
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, size, time.time())
+            )
+            self._evict()
+
+
+class AudioCache:
+    """An on-disk, content-addressed cache of synthesized audio.
+
+    Audio files are stored under the hash of the normalised text, voice and
+    model, alongside their duration and peak level. When the stored audio
+    grows past its size limit, the least recently used files are evicted.
+    This allows stock phrases and re-rendered lines to skip text-to-speech.
+    """
+
+    def __init__(self, folder, max_size):
+        """Initialize the AudioCache class.
+
+        Args:
+            folder (str): The folder to store the audio files and index in.
+            max_size (int): The maximum size of the cached audio in bytes.
+
+        Attributes:
+            folder (str): The folder the audio files are stored in.
+            max_size (int): The maximum size of the cached audio in bytes.
+            hits (int): The number of lookups which found audio.
+            misses (int): The number of lookups which found nothing.
+        """
+        # Store the settings
+        self.folder = folder
+        self.max_size = max_size
+
+        # Create the hit and miss counters
+        self.hits = 0
+        self.misses = 0
+
+        # Create the folder if needed
+        os.makedirs(folder, exist_ok=True)
+
+        # Open the index (shared between the director and worker threads)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            os.path.join(folder, "audio.db"),
+            check_same_thread=False
+        )
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS audio ("
+                "key TEXT PRIMARY KEY, "
+                "duration REAL, "
+                "peak REAL, "
+                "size INTEGER, "
+                "last_used REAL)"
+            )
+
+    def _evict(self):
+        """Remove the least recently used audio until under the limit."""
+        # Get the total size of the cached audio
+        total = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM audio"
+        ).fetchone()[0]
+
+        # If the cache is within its limit, there is nothing to do
+        if total <= self.max_size:
+            return
+
+        # Go through the audio from least to most recently used
+        rows = self.connection.execute(
+            "SELECT key, size FROM audio ORDER BY last_used ASC"
+        ).fetchall()
+        for key, size in rows:
+            self.connection.execute("DELETE FROM audio WHERE key = ?", (key,))
+            if os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+            total -= size
+
+            # Stop once the cache is back within its limit
+            if total <= self.max_size:
+                break
+
+    def _path(self, key):
+        """Get the path of the audio file for a key.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            str: The path of the audio file.
+        """
+        return os.path.join(self.folder, f"{key}.mp3")
+
+    def key(self, text, voice, model):
+        """Get the cache key for a line of speech.
+
+        Args:
+            text (str): The text that is spoken.
+            voice (str): The voice used to speak it.
+            model (str): The text-to-speech model used.
+
+        Returns:
+            str: The hexadecimal SHA-256 hash of the text, voice and model.
+        """
+        # Collapse whitespace so formatting changes do not affect the key
+        text = re.sub(r"\s+", " ", text).strip()
+
+        return hashlib.sha256(f"{model}\n{voice}\n{text}".encode()).hexdigest()
+
+    def get(self, text, voice, model, target):
+        """Copy the cached audio for a line of speech to a file.
+
+        Args:
+            text (str): The text that is spoken.
+            voice (str): The voice used to speak it.
+            model (str): The text-to-speech model used.
+            target (str): The path to copy the audio file to.
+
+        Returns:
+            tuple: The duration and peak level of the audio, or None if there
+                is no cached audio.
+        """
+        key = self.key(text, voice, model)
+
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                "SELECT duration, peak FROM audio WHERE key = ?",
+                (key,)
+            ).fetchone()
+
+            # Count the miss if nothing was found (or the file has vanished)
+            if row is None or not os.path.exists(self._path(key)):
+                self.misses += 1
+                return None
+
+            # Otherwise, mark the audio as recently used
+            self.connection.execute(
+                "UPDATE audio SET last_used = ? WHERE key = ?",
+                (time.time(), key)
+            )
+            self.hits += 1
+
+            # Copy the audio file before another thread can evict it
+            shutil.copyfile(self._path(key), target)
+
+        return row
+
+    def put(self, text, voice, model, source, duration, peak):
+        """Store the audio for a line of speech.
+
+        Args:
+            text (str): The text that is spoken.
+            voice (str): The voice used to speak it.
+            model (str): The text-to-speech model used.
+            source (str): The path of the audio file to store.
+            duration (float): The duration of the audio in seconds.
+            peak (float): The peak level of the audio.
+        """
+        key = self.key(text, voice, model)
+
+        # Copy the audio file into the cache
+        shutil.copyfile(source, self._path(key))
+        size = os.path.getsize(self._path(key))
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO audio VALUES (?, ?, ?, ?, ?)",
+                (key, duration, peak, size, time.time())
+            )
+            self._evict()
+
+
+def create_response_cache():
+    """Create a ResponseCache from the settings.
+
+    Returns:
+        ResponseCache: The response cache.
+    """
+    # Get the cache settings
+    folder = common.settings["system"]["cache_dir"]
+    max_size = float(common.settings["system"]["response_cache_size"])
+    deterministic = common.settings["commentary"]["replay_deterministic"]
+
+    # Create the cache (the size setting is in megabytes)
+    return ResponseCache(
+        os.path.join(folder, "responses.db"),
+        int(max_size * 1024 * 1024),
+        deterministic=deterministic == "1"
+    )
+
+
+def create_audio_cache():
+    """Create an AudioCache from the settings.
+
+    Returns:
+        AudioCache: The audio cache.
+    """
+    # Get the cache settings
+    folder = common.settings["system"]["cache_dir"]
+    max_size = float(common.settings["system"]["audio_cache_size"])
+
+    # Create the cache (the size setting is in megabytes)
+    return AudioCache(
+        os.path.join(folder, "audio"),
+        int(max_size * 1024 * 1024)
+    )
@@ -1,23 +1,98 @@
+from collections import deque
 import random
+import time
 
 from core import common
+from utility import stats
+
+
+# Cameras which aren't realistic for a broadcast
+UNREALISTIC_CAMERAS = (
+    "Nose",
+    "Gearbox",
+    "LF Susp",
+    "RF Susp",
+    "LR Susp",
+    "RR Susp",
+    "Cockpit",
+    "Chase",
+    "Far Chase",
+    "Rear Chase"
+)
+
+# Cameras which don't focus on a specific car
+BAD_ANGLES = ("Scenic", "Pit Lane", "Pit Lane 2")
 
 
 class Camera:
-    """Class for changing cameras in iRacing"""
+    """Class for changing cameras in iRacing
+
+    The cameras available, and the weighted choices between them, are only
+    worked out when iRacing's CameraInfo changes. Switches to the car and
+    camera already being shown are skipped, rather than sent to iRacing
+    again.
+    """
     
     def __init__(self):
         """Initializes the Camera class
 
         Attributes:
             cameras (dict): Dictionary of camera names and numbers
+            choices (dict): The cameras to choose between and their
+                cumulative weights, keyed by the camera being replaced
+            groups (list): The CameraInfo groups the tables were built from
+            session_info_update (int): The SessionInfoUpdate last checked
+            current_camera (str): The name of the camera being shown
+            current_car (int): The number of the car being shown
+            switches (int): The number of switches sent to iRacing
+            coalesced (int): The number of switches skipped as unchanged
+            dropped (int): The number of switches which couldn't be sent
+            latencies (deque): The most recent switch times in seconds
+            first_switch (float): The time of the first switch sent
         """
-
-        # Camera Dictionary
-        self.cameras = self._get_cameras()
+        # Camera tables, built from CameraInfo
+        self.cameras = {}
+        self.choices = {}
+        self.groups = None
+        self.session_info_update = None
+        self._refresh()
 
         # Store current camera
         self.current_camera = None
+        self.current_car = None
+
+        # Keep track of how switching is going
+        self.switches = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.latencies = deque(maxlen=1000)
+        self.first_switch = None
+
+    def _build_choices(self):
+        """Work out the weighted choices for every camera being replaced.
+
+        Returns:
+            dict: The camera names to choose between and their cumulative
+                weights, keyed by the camera being replaced (None for none).
+        """
+        # Remove angles that don't focus on a specific car
+        candidates = [c for c in self.cameras if c not in BAD_ANGLES]
+
+        choices = {}
+        for current in [None] + list(self.cameras):
+            # Never choose the camera already being shown
+            names = [c for c in candidates if c != current]
+
+            # Favour the TV cameras
+            cum_weights = []
+            total = 0
+            for name in names:
+                total += 10 if "TV" in name else 1
+                cum_weights.append(total)
+
+            choices[current] = (names, cum_weights)
+
+        return choices
 
     def _get_cameras(self):
         """Returns a dictionary of camera names and numbers
@@ -29,29 +104,33 @@ class Camera:
         cameras = {}
 
         # Populate the dictionary with the camera names and numbers
-        for camera in common.ir["CameraInfo"]["Groups"]:
+        for camera in self.groups:
             cameras[camera["GroupName"]] = camera["GroupNum"]
 
         # If realistic cameras is enabled, remove unrealistic cameras
         if common.settings["commentary"]["realistic_camera"] == "1":
-            cams_to_remove = (
-                "Nose",
-                "Gearbox",
-                "LF Susp",
-                "RF Susp",
-                "LR Susp",
-                "RR Susp",
-                "Cockpit",
-                "Chase",
-                "Far Chase",
-                "Rear Chase"
-            )
-            for cam in cams_to_remove:
+            for cam in UNREALISTIC_CAMERAS:
                 if cam in cameras:
                     del cameras[cam]
 
         # Return the dictionary
         return cameras
+
+    def _refresh(self):
+        """Rebuild the camera tables if CameraInfo has changed."""
+        # CameraInfo can only change when the session info is rewritten
+        update = common.ir["SessionInfoUpdate"]
+        if update == self.session_info_update:
+            return
+        self.session_info_update = update
+
+        # Only rebuild if the cameras themselves changed
+        groups = common.ir["CameraInfo"]["Groups"]
+        if groups == self.groups:
+            return
+        self.groups = groups
+        self.cameras = self._get_cameras()
+        self.choices = self._build_choices()
     
     def change_camera(self, car_idx, camera_name):
         """Changes the camera for a specific car
@@ -60,8 +139,33 @@ class Camera:
             car_idx (int): Index of the car
             camera_name (str): Name of the camera
         """
-        common.ir.cam_switch_num(car_idx, self.cameras[camera_name])
+        self._refresh()
+
+        # Skip switching to what is already being shown
+        if (car_idx, camera_name) == (self.current_car, self.current_camera):
+            self.coalesced += 1
+            return
+
+        # Drop switches to cameras this session doesn't have
+        if camera_name not in self.cameras:
+            self.dropped += 1
+            return
+
+        # Send the switch, timing how long iRacing takes to accept it
+        start = time.time()
+        try:
+            common.ir.cam_switch_num(car_idx, self.cameras[camera_name])
+        except Exception:
+            self.dropped += 1
+            return
+        self.latencies.append(time.time() - start)
+
+        # Keep track of what is being shown
         self.current_camera = camera_name
+        self.current_car = car_idx
+        self.switches += 1
+        if self.first_switch is None:
+            self.first_switch = start
 
     def choose_random_camera(self, car_idx):
         """Chooses a random camera for a specific car
@@ -69,29 +173,172 @@ class Camera:
         Args:
             car_idx (int): Index of the car
         """
-        # Get the cameras
-        cameras = list(self.cameras.keys())
+        self._refresh()
 
-        # Remove angles that don't focus on a specific car
-        bad_angles = ("Scenic", "Pit Lane", "Pit Lane 2")
-        for angle in bad_angles:
-            if angle in cameras:
-                cameras.remove(angle)
-
-        # Remove current camera
-        if self.current_camera in cameras:
-            cameras.remove(self.current_camera)
-
-        # Set the probability of the cameras
-        weights = []
-        for camera in cameras:
-            if "TV" in camera:
-                weights.append(10)
+        # Get the cameras to choose between, other than the current one
+        names, cum_weights = self.choices.get(
+            self.current_camera,
+            self.choices.get(None, ([], []))
+        )
+        # If there is no other camera, keep the current one on the new car
+        if names == []:
+            if self.current_camera in self.cameras:
+                self.change_camera(car_idx, self.current_camera)
             else:
-                weights.append(1)
+                self.dropped += 1
+            return
 
         # Choose a random camera
-        random_camera = random.choices(cameras, weights=weights, k=1)[0]
+        random_camera = random.choices(names, cum_weights=cum_weights)[0]
 
         # Change the camera
-        self.change_camera(car_idx, random_camera)
\ No newline at end of file
+        self.change_camera(car_idx, random_camera)
+
+    def summary(self):
+        """Describe how the camera switched.
+
+        Returns:
+            str: One line describing the camera switches.
+        """
+        # Work out the switches per minute since the first one
+        rate = 0.
+        if self.first_switch is not None:
+            minutes = (time.time() - self.first_switch) / 60
+            if minutes > 0:
+                rate = self.switches / minutes
+
+        line = (
+            f"Camera: {self.switches} switches ({rate:.1f} per minute), "
+            f"{self.coalesced} coalesced, {self.dropped} dropped"
+        )
+
+        # Add how long switches took to send
+        summary = stats.summarise(list(self.latencies))
+        if summary["count"] > 0:
+            line += (
+                f", latency p50 {summary['p50'] * 1000:.1f} ms, "
+                f"max {summary['max'] * 1000:.1f} ms"
+            )
+
+        return line
+
+
+class CameraController:
+    """Directs the camera from live race state, in its own thread.
+
+    Commentary can take several seconds to write and speak, so the camera
+    isn't switched by the commentary itself. Instead, the controller checks
+    the race at a fixed rate, cutting to each new event as soon as it is
+    detected and to any car commentary hints at. Every shot is held for at
+    least the minimum shot length, and once a shot reaches the maximum length
+    the same car is shown from another angle.
+    """
+
+    def __init__(self, camera, events, rate=4., min_shot=4., max_shot=15.):
+        """Initialize the CameraController class.
+
+        Args:
+            camera (Camera): The camera to switch.
+            events (Events): The events manager to watch for new events.
+            rate (float): How many times a second to check the race.
+            min_shot (float): The shortest time to hold a shot in seconds.
+            max_shot (float): The longest time to hold a shot in seconds.
+
+        Attributes:
+            camera (Camera): The camera to switch.
+            events (Events): The events manager to watch for new events.
+            rate (float): How many times a second to check the race.
+            min_shot (float): The shortest time to hold a shot in seconds.
+            max_shot (float): The longest time to hold a shot in seconds.
+            target (int): The car number currently being shown.
+            pending (int): The car number to cut to when allowed.
+            shot_started (float): The time the current shot started.
+            last_event_id (int): The id of the last event cut to.
+        """
+        self.camera = camera
+        self.events = events
+        self.rate = rate
+        self.min_shot = min_shot
+        self.max_shot = max_shot
+        self.target = None
+        self.pending = None
+        self.shot_started = 0.
+        self.last_event_id = None
+
+    def _cut(self, number):
+        """Cut to a car from a new angle, starting a new shot.
+
+        Args:
+            number (int): The car number to show.
+        """
+        self.camera.choose_random_camera(number)
+        self.target = number
+        self.pending = None
+        self.shot_started = time.time()
+
+    def _tick(self):
+        """Check the race once, switching the camera if the rules allow."""
+        # Leave the camera alone until the race starts
+        snapshot = common.snapshot
+        if snapshot is None or not snapshot.race_started:
+            return
+
+        # Cut to each new event as soon as it is detected
+        event = self.events.latest
+        if event is not None and event["id"] != self.last_event_id:
+            self.last_event_id = event["id"]
+            if event["focus"] is not None:
+                self.pending = event["focus"]
+
+        # Only show cars still in the session, falling back to the leader
+        numbers = [driver["number"] for driver in snapshot.drivers]
+        if numbers == []:
+            return
+        if self.pending is not None and self.pending not in numbers:
+            self.pending = None
+        if self.target not in numbers and self.pending is None:
+            self.pending = numbers[0]
+
+        # Hold every shot for at least the minimum length
+        length = time.time() - self.shot_started
+        if length < self.min_shot:
+            return
+
+        # Cut to the new target, or find a new angle on a long shot
+        if self.pending is not None:
+            self._cut(self.pending)
+        elif length >= self.max_shot:
+            self._cut(self.target)
+
+    def hint(self, number):
+        """Ask for a car to be shown next.
+
+        Args:
+            number (int): The car number to show.
+        """
+        self.pending = number
+
+    def run(self):
+        """Run the camera thread until told to stop."""
+        while common.running:
+            self._tick()
+            time.sleep(1 / self.rate)
+
+
+def create_camera_controller(camera, events):
+    """Create a CameraController from the settings.
+
+    Args:
+        camera (Camera): The camera to switch.
+        events (Events): The events manager to watch for new events.
+
+    Returns:
+        CameraController: The camera controller.
+    """
+    return CameraController(
+        camera,
+        events,
+        rate=float(common.settings["system"]["camera_update_freq"]),
+        min_shot=float(common.settings["commentary"]["min_shot_length"]),
+        max_shot=float(common.settings["commentary"]["max_shot_length"])
+    )
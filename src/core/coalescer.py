@@ -0,0 +1,198 @@
+from core import common
+
+
+class Coalescer:
+    """Groups related events into compound incidents.
+
+    A crash often produces several stopped cars and overtakes at the same
+    corner within a second or two. Rather than listing each one and asking
+    the LLM to work out which are related, events close together on track and
+    in time, or involving the same car, are merged into a single incident.
+
+    Events are sorted by lap percentage and swept once, so only neighbours
+    within the lap window are compared. Where the track has a corner map,
+    events in the same corner are also related, however far apart they are.
+    """
+
+    def __init__(self, lap_window=0.02, time_window=5.):
+        """Initialize the Coalescer class.
+
+        Args:
+            lap_window (float): How close together on track events must be to
+                be related, as a fraction of the lap.
+            time_window (float): How close together in time events must be to
+                be related, in seconds.
+
+        Attributes:
+            lap_window (float): How close together on track events must be.
+            time_window (float): How close together in time events must be.
+        """
+        self.lap_window = lap_window
+        self.time_window = time_window
+
+    def _cars(self, event):
+        """Get the cars involved in an event.
+
+        Args:
+            event (dict): The event.
+
+        Returns:
+            set: The focused car number and the names of the drivers involved.
+        """
+        cars = set()
+        if event["focus"] is not None:
+            cars.add(event["focus"])
+
+        # Add the names of the drivers in the event's data (other fields, like
+        # a pit action or a lap time, are not cars)
+        data = event.get("data") or {}
+        for key in ("driver", "overtaken"):
+            if data.get(key) is not None:
+                cars.add(data[key])
+        cars.update(data.get("drivers", []))
+
+        return cars
+
+    def _group(self, events):
+        """Find the groups of related events.
+
+        Args:
+            events (list): The events.
+
+        Returns:
+            list: Lists of the indexes of related events.
+        """
+        # Each event starts in its own group
+        parent = list(range(len(events)))
+
+        def find(i):
+            """Find the group an event belongs to."""
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def close_in_time(i, j):
+            """Check if two events happened close together."""
+            gap = abs(events[i]["timestamp"] - events[j]["timestamp"])
+            return gap <= self.time_window
+
+        # Sweep through the events in order around the lap
+        placed = [
+            i for i, event in enumerate(events)
+            if event["lap_percent"] is not None
+        ]
+        placed.sort(key=lambda i: events[i]["lap_percent"])
+        for a, i in enumerate(placed):
+            for j in placed[a + 1:]:
+                # Stop once the next event is too far around the lap
+                gap = events[j]["lap_percent"] - events[i]["lap_percent"]
+                if gap > self.lap_window:
+                    break
+                if close_in_time(i, j):
+                    parent[find(j)] = find(i)
+
+        # Check across the start/finish line
+        for i in placed:
+            if events[i]["lap_percent"] > self.lap_window:
+                break
+            for j in reversed(placed):
+                gap = events[i]["lap_percent"] + 1 - events[j]["lap_percent"]
+                if gap > self.lap_window:
+                    break
+                if close_in_time(i, j):
+                    parent[find(j)] = find(i)
+
+        # Group events in the same corner
+        seen = {}
+        for i, event in enumerate(events):
+            corner = event.get("corner")
+            if corner is None:
+                continue
+            if corner in seen and close_in_time(i, seen[corner]):
+                parent[find(i)] = find(seen[corner])
+            seen[corner] = i
+
+        # Group events involving the same car
+        seen = {}
+        for i, event in enumerate(events):
+            for car in self._cars(event):
+                if car in seen and close_in_time(i, seen[car]):
+                    parent[find(i)] = find(seen[car])
+                seen[car] = i
+
+        # Collect the groups, keeping the original order
+        groups = {}
+        for i in range(len(events)):
+            groups.setdefault(find(i), []).append(i)
+
+        return list(groups.values())
+
+    def _merge(self, events):
+        """Merge related events into one incident.
+
+        Args:
+            events (list): The related events, most recent first.
+
+        Returns:
+            dict: The incident.
+        """
+        # Describe every car stopped in the incident first
+        stopped = [e for e in events if e["type"] in ("stopped", "incident")]
+        others = [e for e in events if e not in stopped]
+        description = "; ".join(e["description"] for e in stopped + others)
+
+        # Focus on the first stopped car, or the most recent event
+        main = stopped[0] if stopped != [] else events[0]
+
+        return {
+            "id": min(e["id"] for e in events),
+            "type": "incident" if stopped != [] else "position scramble",
+            "description": description,
+            "lap_percent": main["lap_percent"],
+            "corner": main.get("corner"),
+            "focus": main["focus"],
+            "data": None,
+            "timestamp": max(e["timestamp"] for e in events),
+            "events": events
+        }
+
+    def coalesce(self, events):
+        """Merge related events into compound incidents.
+
+        Args:
+            events (list): The events, most recent first.
+
+        Returns:
+            list: The events and incidents, most recent first.
+        """
+        # Nothing to merge with fewer than two events
+        if len(events) < 2:
+            return events
+
+        # Replace each group of related events with an incident
+        coalesced = []
+        for group in self._group(events):
+            if len(group) == 1:
+                coalesced.append(events[group[0]])
+            else:
+                coalesced.append(self._merge([events[i] for i in group]))
+
+        # Keep the most recent first
+        coalesced.sort(key=lambda x: x["timestamp"], reverse=True)
+
+        return coalesced
+
+
+def create_coalescer():
+    """Create a Coalescer from the settings.
+
+    Returns:
+        Coalescer: The coalescer.
+    """
+    system = common.settings["system"]
+
+    return Coalescer(
+        lap_window=float(system["coalesce_lap_window"]),
+        time_window=float(system["coalesce_time_window"])
+    )
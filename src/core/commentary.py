@@ -1,11 +1,21 @@
+import itertools
 import os
+import queue
+import re
+import threading
 import time
 
-import elevenlabs
+from moviepy.audio.io.AudioFileClip import AudioFileClip
 from mutagen.mp3 import MP3
-import openai
 
+from core import cache
 from core import common
+from core import providers
+from core import quality
+from core import resilience
+from core import routing
+from core import templates
+from utility import mp3
 
 
 class Commentary:
@@ -20,18 +30,204 @@ class Commentary:
     def __init__(self):
         """Initialize the Commentary class.
 
-        Initializes the TextGenerator and VoiceGenerator classes.
+        Initializes the TextGenerator and VoiceGenerator classes, and the
+        template engine used for routine events.
 
         Attributes:
             text_generator (TextGenerator): The TextGenerator class.
             voice_generator (VoiceGenerator): The VoiceGenerator class.
+            template_engine (TemplateEngine): The template engine.
+            policy (CommentaryPolicy): Decides when to use the templates.
+            quality (QualityController): Lowers quality when commentary falls
+                behind the race.
+            last_started (float): The time the last play-by-play started.
+            speech_started (float): The time the audio of the current
+                commentary started, or None if it hasn't yet.
         """
+        # Create the quality controller
+        self.quality = quality.create_quality_controller()
+
         # Create the text generator
-        self.text_generator = TextGenerator()
+        self.text_generator = TextGenerator(self.quality)
 
         # Create the voice generator
         self.voice_generator = VoiceGenerator()
 
+        # Create the template engine and the policy for when to use it
+        self.template_engine = templates.TemplateEngine()
+        self.policy = templates.CommentaryPolicy(
+            self.template_engine,
+            self.text_generator.routes["pbp"].hedger.tracker,
+            self.text_generator.routes["pbp"].hedger.breaker,
+            self.quality
+        )
+
+        # Keep track of how far behind the race commentary is
+        self.last_started = 0.
+        self.speech_started = None
+
+    def _announce(self, role, text):
+        """Show a line of commentary in the app as its audio starts.
+
+        Args:
+            role (str): The role of the commentator.
+            text (str): The commentary.
+        """
+        # Remember when the first audio of this commentary started
+        if self.speech_started is None:
+            self.speech_started = time.time()
+
+        common.app.add_message(f"{role.title()}: {text}")
+
+    def _fall_back(self, events, role, voice, timestamp, error):
+        """Keep commentary going after the text or speech provider failed.
+
+        Routine events are described from templates instead. If the audio
+        can't be generated either, the commentary is only shown in the app.
+
+        Args:
+            events (list): A list of events that have occurred.
+            role (str): The role of the commentator.
+            voice (str): The voice to use for the audio.
+            timestamp (int): The timestamp of the commentary in milliseconds.
+            error (Exception): The error which stopped the commentary.
+        """
+        common.app.add_message(f"Commentary unavailable: {error}")
+
+        # Only play-by-play events can be described from templates
+        if role != "play-by-play":
+            return
+
+        # Fill the templates, or read out the descriptions of events without
+        # one
+        text = self.template_engine.generate(events)
+        if text == "":
+            return
+        self.text_generator.remember(text, role)
+
+        # Generate the audio, or just show the text if that fails too
+        try:
+            self.voice_generator.generate(
+                text=text,
+                timestamp=timestamp,
+                gpt_time=0,
+                voice=voice,
+                on_first_chunk=lambda: self._announce(role, text)
+            )
+        except Exception:
+            self._announce(role, text)
+
+    def _generate_template(self, events, role, voice, timestamp, camera=None):
+        """Generate commentary for routine events from templates.
+
+        The camera is pointed straight at the focus of the most recent event,
+        instead of asking the LLM which car to focus on.
+
+        Args:
+            events (list): A list of events that have occurred.
+            role (str): The role of the commentator.
+            voice (str): The voice to use for the audio.
+            timestamp (int): The timestamp of the commentary in milliseconds.
+            camera (CameraController): The camera controller.
+        """
+        # Fill the templates, stopping if there is nothing new to describe
+        text = self.template_engine.generate(events)
+        if text == "":
+            return
+
+        # Keep the LLM aware of what has been said
+        self.text_generator.remember(text, role)
+
+        # Point the camera at the car involved
+        if camera is not None and events[0]["focus"] is not None:
+            camera.hint(events[0]["focus"])
+
+        # Generate the audio
+        self.voice_generator.generate(
+            text=text,
+            timestamp=timestamp,
+            gpt_time=0,
+            voice=voice,
+            on_first_chunk=lambda: self._announce(role, text)
+        )
+
+    def _generate_streamed(
+            self,
+            events,
+            role,
+            voice,
+            timestamp,
+            start_time,
+            camera=None
+        ):
+        """Generate commentary, speaking each sentence as soon as it is written.
+
+        The text generator hands each finished sentence to a queue, and a
+        separate thread synthesizes the queued sentences in order. This allows
+        the first sentence to be spoken while later ones are still being
+        written. Each sentence is placed directly after the one before it.
+
+        Args:
+            events (list): A list of events that have occurred.
+            role (str): The role of the commentator.
+            voice (str): The voice to use for the audio.
+            timestamp (int): The timestamp of the commentary in milliseconds.
+            start_time (float): The time commentary generation started.
+            camera (CameraController): The camera controller.
+        """
+        # Create the queue of sentences waiting to be spoken
+        sentences = queue.Queue()
+
+        # Keep track of the total length of the audio
+        total_length = 0.
+
+        def speak():
+            """Synthesize the queued sentences until told to stop."""
+            nonlocal total_length
+
+            while True:
+                # Get the next sentence (None means there are no more)
+                sentence = sentences.get()
+                if sentence is None:
+                    break
+
+                # Place this sentence after the ones before it
+                offset = int(total_length * 1000)
+
+                # Generate the audio, or just show the text if that fails
+                try:
+                    total_length += self.voice_generator.synthesize(
+                        text=sentence,
+                        timestamp=timestamp + offset,
+                        voice=voice,
+                        on_first_chunk=lambda: self._announce(role, sentence)
+                    )
+                except Exception:
+                    self._announce(role, sentence)
+
+        # Start speaking sentences as they arrive
+        speaker = threading.Thread(target=speak)
+        speaker.start()
+
+        # Generate the commentary text, queueing each finished sentence
+        try:
+            self.text_generator.generate(
+                events=events,
+                role=role,
+                camera=camera,
+                on_sentence=sentences.put
+            )
+
+        # Always let the speaker thread finish
+        finally:
+            sentences.put(None)
+            speaker.join()
+
+        # Wait for the length of the audio minus the time it took to generate
+        elapsed = time.time() - start_time
+        if total_length - elapsed > 0:
+            time.sleep(total_length - elapsed)
+
     def generate(
             self, 
             events,
@@ -64,32 +260,101 @@ class Commentary:
         # Convert the timestamp to milliseconds
         timestamp = int(timestamp * 1000)
 
-        # Generate the commentary text
-        text = self.text_generator.generate(
-            events=events,
-            role=role,
-            camera=camera
-        )
-
-        # Add the message to the message box
-        common.app.add_message(f"{role.title()}: {text}")
-
         # Pick the correct voice for the role
         if role == "play-by-play":
             voice = common.settings["commentary"]["pbp_voice"]
         elif role == "color":
             voice = common.settings["commentary"]["color_voice"]
 
-        # Calculate how long it took to generate the text
-        gpt_time = time.time() - start_time
-
-        # Generate the audio
-        self.voice_generator.generate(
-            text=text,
-            timestamp=timestamp,
-            gpt_time=gpt_time,
-            voice=voice
-        )
+        # Find the events which arrived since the last play-by-play started
+        self.speech_started = None
+        if role == "play-by-play":
+            new_events = [
+                event for event in events
+                if event["timestamp"] > self.last_started
+            ]
+            self.last_started = start_time
+
+        # Never let a failing provider stop the director
+        try:
+            # Describe routine events from templates, without calling the LLM
+            mode = self.policy.choose(events, role)
+            if mode == "template":
+                self._generate_template(events, role, voice, timestamp, camera)
+
+            # If text streaming is enabled, speak each sentence as it is
+            # written
+            elif common.settings["system"]["stream_text"] == "1":
+                self._generate_streamed(
+                    events,
+                    role,
+                    voice,
+                    timestamp,
+                    start_time,
+                    camera
+                )
+
+            # Otherwise, generate the text, then the audio
+            else:
+                text = self.text_generator.generate(
+                    events=events,
+                    role=role,
+                    camera=camera
+                )
+
+                # Calculate how long it took to generate the text
+                gpt_time = time.time() - start_time
+
+                # Generate the audio
+                self.voice_generator.generate(
+                    text=text,
+                    timestamp=timestamp,
+                    gpt_time=gpt_time,
+                    voice=voice,
+                    on_first_chunk=lambda: self._announce(role, text)
+                )
+
+            # Never repeat what the LLM has covered from templates later
+            if role == "play-by-play" and mode != "template":
+                self.template_engine.mark_reported(events)
+
+        # Fall back to templates or text only
+        except Exception as error:
+            self._fall_back(events, role, voice, timestamp, error)
+
+        # Let the quality controller know how far behind the race this was
+        if role == "play-by-play" and new_events != []:
+            if self.speech_started is not None:
+                oldest = min(event["timestamp"] for event in new_events)
+                self.quality.record(
+                    self.speech_started - oldest,
+                    len(new_events)
+                )
+
+    def warm_up(self):
+        """Prepare the API clients before commentary starts.
+
+        Resolves the commentator voices and opens connections to the OpenAI
+        and ElevenLabs APIs in a separate thread, so the first line of
+        commentary does not pay for either.
+        """
+        def run():
+            """Resolve the voices and open the connection."""
+            try:
+                common.voices.resolve(
+                    common.settings["commentary"]["pbp_voice"]
+                )
+                common.voices.resolve(
+                    common.settings["commentary"]["color_voice"]
+                )
+                self.text_generator.provider.warm_up()
+                self.voice_generator.provider.warm_up()
+
+            # Failures will show up again on the first line of commentary
+            except Exception:
+                pass
+
+        threading.Thread(target=run, daemon=True).start()
 
 class TextGenerator:
     """Handles text generation for race commentary.
@@ -99,28 +364,135 @@ class TextGenerator:
     to use as context for future commentary.
     """
 
-    def __init__(self):
+    def __init__(self, quality=None):
         """Initialize the TextGenerator class.
     
-        Initializes the OpenAI API key and sets up an empty list to hold
-        previous responses generated for commentary.
+        Initializes the OpenAI API key, opens the response cache, and sets up
+        an empty list to hold previous responses generated for commentary.
+
+        Args:
+            quality (QualityController): Chooses the model and length of the
+                commentary. If None, full quality is always used.
 
         Attributes:
+            quality (QualityController): Chooses the model and length of the
+                commentary.
+            provider (TextProvider): The chat completion provider.
+            routes (dict): The model, length and deadline of each task, keyed
+                by task.
+            cache (ResponseCache): The on-disk cache of previous responses.
             previous_responses (list): A list of previous responses generated
             for commentary.
         """
 
-        # Create the OpenAI client
-        self.client = openai.OpenAI(
-            api_key=common.settings["keys"]["openai_api_key"]
-        )
-        
-        # Set the GPT model to use
-        self.model = "gpt-4-turbo-preview"
+        # Keep the quality controller
+        self.quality = quality
+
+        # Create the text provider
+        self.provider = providers.create_text_provider()
+
+        # Route each task to its own model, with its own deadline
+        self.routes = routing.create_routes(probe=self.provider.warm_up)
+
+        # Open the response cache
+        self.cache = cache.create_response_cache()
 
         # Create an empty list to hold previous responses
         self.previous_responses = []
 
+    def _complete(
+            self,
+            messages,
+            route,
+            on_sentence=None,
+            model=None,
+            max_tokens=None
+        ):
+        """Get a chat completion, using the response cache if possible.
+
+        If a sentence callback is given, the completion is streamed and each
+        sentence is passed to the callback as soon as it is finished, so it
+        can be spoken while the rest of the response is still being written.
+
+        Args:
+            messages (list): The messages to send to the API.
+            route (Route): The route of the task.
+            on_sentence (function): Called with each finished sentence.
+            model (str): The model to use. If None, the route's model is used.
+            max_tokens (int): The maximum number of tokens to generate. If
+                None, the route's maximum is used.
+
+        Returns:
+            str: The content of the response.
+        """
+        # Use the route's model and length unless told otherwise
+        if model is None:
+            model = route.model
+        if max_tokens is None:
+            max_tokens = route.max_tokens
+
+        # Return the cached response if there is one
+        answer = self.cache.get(model, messages)
+        if answer is not None:
+            if on_sentence is not None:
+                sentences, remainder = self._split_sentences(answer)
+                for sentence in sentences + [remainder]:
+                    if sentence != "":
+                        on_sentence(sentence)
+            return answer
+
+        # If there is no sentence callback, wait for the complete response
+        # (a request which loses the hedge race has already been read, so it
+        # holds no connection and is simply dropped)
+        if on_sentence is None:
+            response = route.hedger.call(
+                lambda: self.provider.open_completion(
+                    model,
+                    messages,
+                    max_tokens
+                )
+            )
+            answer = self.provider.read_completion(
+                response,
+                on_usage=route.record_usage
+            )
+
+        # Otherwise, stream the response one sentence at a time
+        else:
+            # Wait for the first token (the part of the stream that's hedged)
+            first, stream = route.hedger.call(
+                lambda: resilience.start_stream(
+                    self.provider.stream(
+                        model,
+                        messages,
+                        max_tokens,
+                        on_usage=route.record_usage
+                    )
+                ),
+                discard=lambda started: started[1].close()
+            )
+            if first is not None:
+                stream = itertools.chain([first], stream)
+
+            answer = ""
+            remainder = ""
+            for token in stream:
+                answer += token
+
+                # Pass on any sentences finished by this token
+                sentences, remainder = self._split_sentences(remainder + token)
+                for sentence in sentences:
+                    on_sentence(sentence)
+
+            # Pass on the last sentence
+            if remainder.strip() != "":
+                on_sentence(remainder.strip())
+
+        # Add the response to the cache
+        self.cache.put(model, messages, answer)
+
+        return answer
+
     def _get_camera_focus(self, event):
         """Get the camera for the given event.
         
@@ -133,6 +505,10 @@ class TextGenerator:
         Returns:
             int: The car number to focus on.
         """
+        # Read from one snapshot, so the names asked about and matched agree
+        snapshot = common.snapshot
+        drivers = snapshot.drivers if snapshot is not None else ()
+
         # Create an empty list of messages
         messages = []
 
@@ -143,7 +519,7 @@ class TextGenerator:
         content += "list, exactly as it appears in this list, "
         content += "and nothing else.\n\n"
         content += "The drivers are:\n"
-        for driver in common.drivers:
+        for driver in drivers:
             content += f"{driver["name"]}"
             content += "\n"
         instruction = {
@@ -160,18 +536,11 @@ class TextGenerator:
         }
         messages.append(event_msg)
 
-        # Call the API
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            max_tokens=100
-        )
-
-        # Extract the response
-        answer = response.choices[0].message.content
+        # Get the response
+        answer = self._complete(messages, self.routes["focus"])
 
         # Pick the driver number which matches the answer
-        for driver in common.drivers:
+        for driver in drivers:
             if driver["name"].lower() in answer.lower():
                 return driver["number"]
             
@@ -196,10 +565,13 @@ class TextGenerator:
         # Add the description
         event_str += f"{event['description']} - "
 
-        # Add the lap percentage
-        adjusted_percent = event["lap_percent"] * 100.
-        adjusted_percent = round(adjusted_percent, 3)
-        event_str += f"{adjusted_percent}% of the way through the lap - "
+        # Add the corner if the track has a corner map, or the lap percentage
+        if event.get("corner") is not None:
+            event_str += f"at {event['corner']} - "
+        elif event["lap_percent"] is not None:
+            adjusted_percent = event["lap_percent"] * 100.
+            adjusted_percent = round(adjusted_percent, 3)
+            event_str += f"{adjusted_percent}% of the way through the lap - "
 
         # Get the amount of time ago it occurred
         time_ago = time.time() - event["timestamp"]
@@ -210,7 +582,25 @@ class TextGenerator:
 
         return event_str
 
-    def generate(self, events, role, camera=None):
+    def _split_sentences(self, text):
+        """Split the finished sentences off the front of some text.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            tuple: A list of the finished sentences, and the unfinished text
+                after them.
+        """
+        # A sentence is finished by punctuation followed by whitespace
+        parts = re.split(r"(?<=[.!?])\s+", text)
+
+        # Everything but the last part is a finished sentence
+        sentences = [part.strip() for part in parts[:-1] if part.strip()]
+
+        return sentences, parts[-1]
+
+    def generate(self, events, role, camera=None, on_sentence=None):
         """Generate text commentary for the given event.
         
         Generates text commentary for the given event based on the provided
@@ -221,7 +611,10 @@ class TextGenerator:
         Args:
             events (list): A list of events that have occurred.
             role (str): The role of the commentator.
-            camera (int): The car number to focus on.
+            camera (CameraController): The camera controller to send the
+                focus to.
+            on_sentence (function): If given, the response is streamed and
+                this is called with each sentence as soon as it is finished.
         
         Returns:
             str: The generated commentary.
@@ -334,13 +727,33 @@ class TextGenerator:
             """
             nonlocal messages
 
-            # Add the gaps to leader message (from common.drivers)
-            message = "Here are the gaps to the leader:\n"
-            for driver in common.drivers:
-                driver_name = common.remove_numbers(driver["name"])
-                rounded_gap = round(driver["gap_to_leader"], 3)
-                message += f"- {driver_name}: +{rounded_gap}"
-                message += "\n"
+            # Read from one snapshot, so every gap is from the same moment
+            snapshot = common.snapshot
+            drivers = snapshot.drivers if snapshot is not None else ()
+
+            # In a multiclass race, give the gaps to each class leader
+            classes = set(driver["car_class"] for driver in drivers)
+            if len(classes) > 1:
+                message = "This is a multiclass race. Only drivers in the "
+                message += "same class race each other for position. "
+                message += "Here are the class positions and gaps to the "
+                message += "class leader:\n"
+                for driver in drivers:
+                    driver_name = driver["display_name"]
+                    rounded_gap = round(driver["class_gap"], 3)
+                    message += f"- {driver_name} "
+                    message += f"({driver['class_name']} "
+                    message += f"P{driver['class_position']}): "
+                    message += f"+{rounded_gap}\n"
+
+            # Otherwise, add the gaps to leader message (from the snapshot)
+            else:
+                message = "Here are the gaps to the leader:\n"
+                for driver in drivers:
+                    driver_name = driver["display_name"]
+                    rounded_gap = round(driver["gap_to_leader"], 3)
+                    message += f"- {driver_name}: +{rounded_gap}"
+                    message += "\n"
             message += "Only use this information if it is relevant to the "
             message += "event. If gaps have been mentioned recently, do not "
             message += "mention them again."
@@ -373,13 +786,29 @@ class TextGenerator:
                     message += f"- {parsed_event}"
                     message += "\n"
                 message += "Report on the most exciting events. "
-                message += "If two events are related, mention them together. "
-                message += "Determine if events are related by type, "
-                message += "lap percentage, and/or time. "
+                message += "Related events have already been grouped into "
+                message += "one incident. "
+
+                # Add the instructions for each type of event reported
+                types = set(event["type"] for event in events)
+                for type, instruction in common.instructions.items():
+                    if type in types:
+                        message += f"{instruction} "
                 message += "DO NOT mention the exact time of the event. "
-                message += "Use lap distance to estimate the corner "
-                message += "name/number. NEVER repeat events that have already "
-                message += "been reported. "
+
+                # Only ask for corners to be estimated where none were given
+                named = sum(1 for event in events if event.get("corner"))
+                if named == 0:
+                    message += "Use lap distance to estimate the corner "
+                    message += "name/number. "
+                elif named == len(events):
+                    message += "Refer to corners only by the names given. "
+                else:
+                    message += "Refer to corners by the names given. For "
+                    message += "events without a corner, use lap distance "
+                    message += "to estimate the corner name/number. "
+                message += "NEVER repeat events that have already been "
+                message += "reported. "
 
             # Otherwise, create an empty message
             else:
@@ -432,16 +861,44 @@ class TextGenerator:
         previous_responses_message()
         new_message()
 
-        # Call the API for the main response
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            max_tokens=300
+        # Get the route for the role
+        route = self.routes["pbp" if role == "play-by-play" else "color"]
+
+        # Use a shorter response or faster model if commentary is behind
+        step = quality.STEPS[0]
+        if self.quality is not None:
+            step = self.quality.current()
+        max_tokens = max(int(route.max_tokens * step["token_scale"]), 1)
+
+        # Get the main response
+        answer = self._complete(
+            messages,
+            route,
+            on_sentence=on_sentence,
+            model=step["model"],
+            max_tokens=max_tokens
         )
 
-        # Extract the response
-        answer = response.choices[0].message.content
+        # Add the response to the list of previous responses
+        self.remember(answer, role)
 
+        # Get the camera focus target
+        next_camera = self._get_camera_focus(answer)
+
+        # Point the camera at the new target
+        if next_camera is not None:
+            camera.hint(next_camera)
+
+        # Return the answer
+        return answer
+
+    def remember(self, answer, role):
+        """Add commentary to the list of previous responses.
+
+        Args:
+            answer (str): The commentary.
+            role (str): The role of the commentator.
+        """
         # Add the response to the list of previous responses
         formatted_answer = {
             "role": "assistant",
@@ -450,67 +907,206 @@ class TextGenerator:
         }
         self.previous_responses.append(formatted_answer)
 
-        # Get the camera focus target
-        next_camera = self._get_camera_focus(answer)
-
-        # Switch the camera to the new target
-        if next_camera is not None:
-            camera.choose_random_camera(next_camera)
-
         # If the list is too long, remove the two oldest responses
         length = int(common.settings["commentary"]["memory_limit"]) * 2
         if len(self.previous_responses) > length:
             self.previous_responses.pop(0)
             self.previous_responses.pop(0)
-
-        # Return the answer
-        return answer
     
 class VoiceGenerator:
     """Handles text-to-speech functionality for race commentary.
 
     Utilizes the ElevenLabs API to convert text into audio. Handles the
-    generation and saving of audio files.
+    generation and saving of audio files. Previously generated audio is reused
+    from the audio cache.
     """
 
     def __init__(self):
         """Initialize the VoiceGenerator class with the given settings.
 
-        Sets up the API key for the ElevenLabs service, enabling text-to-speech
-        capabilities for the application.
+        Sets up the speech provider, enabling text-to-speech capabilities for
+        the application, and opens the audio cache.
+
+        Attributes:
+            provider (SpeechProvider): The text-to-speech provider.
+            hedger (Hedger): Applies deadlines and hedging to the provider.
+            model (str): The ElevenLabs model to use.
+            cache (AudioCache): The on-disk cache of previous audio.
         """
 
-        # Set the API key
-        elevenlabs.set_api_key(common.settings["keys"]["elevenlabs_api_key"])
+        # Create the speech provider
+        self.provider = providers.create_speech_provider()
 
-    def generate(self, text, timestamp, gpt_time, voice="Harry"):
-        """Generate and save audio for the provided text.
+        # Give the provider a deadline, retries and hedged requests
+        self.hedger = resilience.create_hedger(
+            "speech",
+            "speech",
+            probe=self.provider.warm_up
+        )
 
-        Calls the ElevenLabs API to create audio from the text using the
-        specified voice, then saves the audio.
+        # Set the ElevenLabs model to use
+        self.model = "eleven_monolingual_v1"
+
+        # Open the audio cache
+        self.cache = cache.create_audio_cache()
+
+    def _store(self, text, voice, file, length):
+        """Measure the peak level of new audio and add it to the audio cache.
+
+        This decodes the whole file, so it is run in a separate thread to keep
+        it off the commentary path.
+
+        Args:
+            text (str): The text that was spoken.
+            voice (str): The voice used to speak it.
+            file (str): The path of the audio file.
+            length (float): The duration of the audio in seconds.
+        """
+        # A line which can't be measured or stored just isn't cached
+        try:
+            # Measure the peak level of the audio
+            clip = AudioFileClip(file)
+            peak = clip.max_volume()
+            clip.close()
+
+            # Make the peak level available to the editor
+            common.audio_peaks[os.path.basename(file)] = peak
+
+            # Add the audio to the cache
+            self.cache.put(text, voice, self.model, file, length, peak)
+        except Exception as e:
+            common.app.add_message(f"Could not cache audio {file}: {e}")
+
+    def _synthesize(self, text, voice, file):
+        """Generate audio for the text and save it once it is complete.
 
         Args:
             text (str): The text to convert to audio.
-            timestamp (str): The timestamp of the event.
-            yelling (bool): Whether or not to convert the text to yelling.
             voice (str): The voice to use for the audio.
+            file (str): The path to save the audio to.
+
+        Returns:
+            float: The duration of the audio in seconds.
+        """
+        # Generate the audio, closing any request which loses the hedge race
+        voice_id = common.voices.resolve(voice)
+        response = self.hedger.call(
+            lambda: self.provider.open_synthesis(text, voice_id, self.model),
+            discard=lambda response: response.close()
+        )
+        audio = self.provider.read_synthesis(response)
+
+        # Save the audio to a file
+        with open(file, "wb") as audio_file:
+            audio_file.write(audio)
+
+        # Get the length of the audio file
+        mp3_file = MP3(file)
+        return mp3_file.info.length
+
+    def _synthesize_stream(self, text, voice, file, on_first_chunk=None):
+        """Generate audio for the text, saving it as it arrives.
+
+        The duration is counted from the frames received, so the file does not
+        need to be read again once it is complete.
+
+        Args:
+            text (str): The text to convert to audio.
+            voice (str): The voice to use for the audio.
+            file (str): The path to save the audio to.
+            on_first_chunk (function): Called when the first chunk arrives,
+                or once the stream ends if no audio arrived.
+
+        Returns:
+            float: The duration of the audio in seconds.
+        """
+        # Start streaming the audio (the first chunk is what's hedged)
+        voice_id = common.voices.resolve(voice)
+        first, stream = self.hedger.call(
+            lambda: resilience.start_stream(
+                self.provider.stream(text, voice_id, self.model)
+            ),
+            discard=lambda started: started[1].close()
+        )
+        if first is not None:
+            stream = itertools.chain([first], stream)
+
+        # Write each chunk to the file as it arrives, counting its frames
+        counter = mp3.FrameCounter()
+        with open(file, "wb") as audio_file:
+            for chunk in stream:
+                audio_file.write(chunk)
+                counter.feed(chunk)
+
+                # Let the caller know audio has started arriving
+                if on_first_chunk is not None and counter.frames > 0:
+                    on_first_chunk()
+                    on_first_chunk = None
+
+        # Let the caller know anyway if no audio frames arrived
+        if on_first_chunk is not None:
+            on_first_chunk()
+
+        return counter.duration
+
+    def generate(
+            self,
+            text,
+            timestamp,
+            gpt_time,
+            voice="Harry",
+            on_first_chunk=None
+        ):
+        """Generate and save audio for the provided text, then wait for it.
+
+        Waits until the audio would have finished playing, so that the next
+        line of commentary does not talk over it.
+
+        Args:
+            text (str): The text to convert to audio.
+            timestamp (int): The timestamp of the audio in milliseconds.
+            gpt_time (float): How long it took to generate the text.
+            voice (str): The voice to use for the audio.
+            on_first_chunk (function): Called as soon as the audio can start
+                playing.
         """
         # Get the start time of this method
         start_time = time.time()
 
+        # Generate the audio
+        length = self.synthesize(text, timestamp, voice, on_first_chunk)
+
+        # Calculate how long it took to generate the audio
+        gen_time = time.time() - start_time
+
+        # Wait for the length of the audio minus the time it took to generate
+        if length - gen_time - gpt_time > 0:
+            time.sleep(length - gen_time - gpt_time)
+
+    def synthesize(self, text, timestamp, voice="Harry", on_first_chunk=None):
+        """Generate and save audio for the provided text without waiting.
+
+        Calls the ElevenLabs API to create audio from the text using the
+        specified voice, then saves the audio. If the same text has been spoken
+        in the same voice before, the cached audio is used instead. If audio
+        streaming is enabled, the audio is saved as it arrives.
+
+        Args:
+            text (str): The text to convert to audio.
+            timestamp (int): The timestamp of the audio in milliseconds.
+            voice (str): The voice to use for the audio.
+            on_first_chunk (function): Called as soon as the audio can start
+                playing.
+
+        Returns:
+            float: The duration of the audio in seconds.
+        """
         # Replace "P" with "P-" to avoid issues with the API
-        for i in range(len(text)):
+        for i in range(len(text) - 1):
             if text[i] == "P" and text[i + 1].isdigit():
                 # Replace the P with "P-"
                 text = text[:i] + "P-" + text[i + 1:]
 
-        # Generate and play audio
-        audio = elevenlabs.generate(
-            text=text,
-            voice=voice,
-            model="eleven_monolingual_v1"
-        )
-
         # Get the iRacing videos folder
         path = os.path.join(
             common.settings["general"]["iracing_path"],
@@ -520,20 +1116,49 @@ class VoiceGenerator:
         # Create the file name
         file_name = f"commentary_{timestamp}.mp3"
 
-        # Save the audio to a file
-        elevenlabs.save(audio, os.path.join(path, file_name))
+        # Use the cached audio if there is any
+        cached = self.cache.get(
+            text,
+            voice,
+            self.model,
+            os.path.join(path, file_name)
+        )
+        if cached is not None:
+            length, peak = cached
+            common.audio_peaks[file_name] = peak
+
+        # Otherwise, stream new audio if enabled
+        elif common.settings["system"]["stream_audio"] == "1":
+            length = self._synthesize_stream(
+                text,
+                voice,
+                os.path.join(path, file_name),
+                on_first_chunk
+            )
+            on_first_chunk = None
+
+        # Otherwise, wait for the complete audio
+        else:
+            length = self._synthesize(
+                text,
+                voice,
+                os.path.join(path, file_name)
+            )
+
+        # Add newly generated audio to the cache in the background
+        if cached is None:
+            threading.Thread(
+                target=self._store,
+                args=(text, voice, os.path.join(path, file_name), length),
+                daemon=True
+            ).start()
+
+        # If the audio was not streamed, it can start playing now
+        if on_first_chunk is not None:
+            on_first_chunk()
 
         # Add the new audio file to intellicaster.tmp
         with open(os.path.join(path, "intellicaster.tmp"), "a") as file:
             file.write(f"{file_name}\n")
 
-        # Get the length of the audio file
-        mp3_file = MP3(os.path.join(path, file_name))
-        length = mp3_file.info.length
-
-        # Calculate how long it took to generate the audio
-        gen_time = time.time() - start_time
-
-        # Wait for the length of the audio minus the time it took to generate
-        if length - gen_time - gpt_time > 0:
-            time.sleep(length - gen_time - gpt_time)
\ No newline at end of file
+        return length
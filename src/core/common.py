@@ -66,9 +66,15 @@ context = None
 # The IRSDK object
 ir = None
 
-# Dictionaries to track the status of the drivers
-drivers = []
-prev_drivers = []
+# The Transport object which all API requests are sent through
+transport = None
+
+# The VoiceRegistry object which resolves ElevenLabs voice names
+voices = None
+
+# The latest Snapshot of the race, replaced whole by the events thread each
+# update. Take one reference and read from that, never from common twice.
+snapshot = None
 
 # Race status variables
 race_started = False
@@ -79,11 +85,17 @@ all_cars_started = False
 # Recording start time
 recording_start_time = None
 
+# Peak levels of the commentary audio files, keyed by file name
+audio_peaks = {}
+
 # Flag to track whether or not commentary is running
 running = False
 
 # Additional instructions to give to commentary generation depending on event
 instructions = {
     "stopped": "Don't assume the reason for the stoppage.",
-    "overtake": "Be sure to include the position of the driver."
+    "overtake": "Be sure to include the position of the driver.",
+    "battle": "Describe the fight for position. Don't say a pass has happened.",
+    "pit": "Don't assume the reason for the pit stop.",
+    "off track": "Don't assume the driver has crashed."
 }
\ No newline at end of file
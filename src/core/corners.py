@@ -0,0 +1,133 @@
+from bisect import bisect_right
+import json
+import os
+
+from core import common
+
+
+class CornerMap:
+    """The corners of one track, by how far through the lap they are.
+
+    Corner maps are JSON files named after the track's iRacing TrackID, in
+    the track folder set in the settings, such as:
+
+        {
+            "track": "Lime Rock Park",
+            "corners": [
+                {"name": "Big Bend", "start": 0.05, "end": 0.17},
+                {"name": "the Left Hander", "start": 0.22, "end": 0.27}
+            ]
+        }
+
+    A corner whose end is before its start runs across the start/finish line.
+    Corners may touch but not overlap.
+    """
+
+    def __init__(self, corners):
+        """Initialize the CornerMap class.
+
+        Args:
+            corners (list): The corners, as dicts with a name and the lap
+                percentages the corner starts and ends at.
+
+        Raises:
+            ValueError: If two corners overlap.
+
+        Attributes:
+            starts (list): The lap percentage each range starts at, in order.
+            ranges (list): The end and name of each range, in the same order.
+        """
+        # Split corners across the line into one range either side of it
+        ranges = []
+        for corner in corners:
+            start, end = float(corner["start"]), float(corner["end"])
+            if end < start:
+                ranges.append((start, 1., corner["name"]))
+                ranges.append((0., end, corner["name"]))
+            else:
+                ranges.append((start, end, corner["name"]))
+        ranges.sort()
+
+        # A point can only be in one corner, so corners can't overlap
+        for (_, end, name), (start, _, other) in zip(ranges, ranges[1:]):
+            if start < end:
+                raise ValueError(f"{name} and {other} overlap")
+
+        self.starts = [start for start, _, _ in ranges]
+        self.ranges = [(end, name) for _, end, name in ranges]
+
+    def lookup(self, lap_percent):
+        """Find the corner at a point on the lap.
+
+        Args:
+            lap_percent (float): How far through the lap, from 0 to 1.
+
+        Returns:
+            str: The name of the corner, or None if it isn't in a corner.
+        """
+        if lap_percent is None:
+            return None
+
+        # Find the last range starting at or before this point
+        i = bisect_right(self.starts, lap_percent) - 1
+        if i < 0:
+            return None
+
+        # Check the point is before the end of that range
+        end, name = self.ranges[i]
+        if lap_percent > end:
+            return None
+
+        return name
+
+
+# The loaded corner maps, keyed by TrackID (None if the track has no map)
+maps = {}
+
+
+def load_corner_map(folder, track_id):
+    """Load the corner map of a track.
+
+    Args:
+        folder (str): The folder the corner maps are in.
+        track_id (int): The iRacing TrackID of the track.
+
+    Returns:
+        CornerMap: The corner map, or None if the track doesn't have one.
+    """
+    path = os.path.join(folder, f"{track_id}.json")
+    if not os.path.exists(path):
+        return None
+
+    # A broken corner map shouldn't stop the broadcast
+    try:
+        with open(path, "r") as f:
+            return CornerMap(json.load(f)["corners"])
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        common.app.add_message(f"Could not load corner map {path}: {e}")
+        return None
+
+
+def corner_at(lap_percent):
+    """Find the corner at a point on the lap of the current track.
+
+    Args:
+        lap_percent (float): How far through the lap, from 0 to 1.
+
+    Returns:
+        str: The name of the corner, or None if it isn't in a corner or the
+            track has no corner map.
+    """
+    # Load the track's corner map the first time it's needed
+    track_id = common.ir["WeekendInfo"]["TrackID"]
+    if track_id not in maps:
+        maps[track_id] = load_corner_map(
+            common.settings["system"]["track_dir"],
+            track_id
+        )
+
+    corner_map = maps[track_id]
+    if corner_map is None:
+        return None
+
+    return corner_map.lookup(lap_percent)
@@ -0,0 +1,711 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from core import common
+from core import snapshot
+
+
+def join_names(names):
+    """Join a list of names into a readable string.
+
+    Args:
+        names (list): The names to join.
+
+    Returns:
+        str: The names, separated by commas and "and".
+    """
+    if len(names) == 1:
+        return names[0]
+    return ", ".join(names[:-1]) + f" and {names[-1]}"
+
+def format_lap_time(seconds):
+    """Format a lap time as minutes, seconds and milliseconds.
+
+    Args:
+        seconds (float): The lap time in seconds.
+
+    Returns:
+        str: The lap time, like 1:32.456.
+    """
+    minutes = int(seconds // 60)
+    return f"{minutes}:{seconds - minutes * 60:06.3f}"
+
+
+class Detector(ABC):
+    """The interface for event detectors.
+
+    A detector compares the current snapshot of the race to the previous one
+    and returns the events it finds. Detectors work on whole arrays at once
+    rather than looping over the drivers list.
+    """
+
+    # The name the detector's timings are reported under
+    name = "detector"
+
+    def _event(self, type, description, focus, data=None):
+        """Build an event to be added to the events list.
+
+        Args:
+            type (str): The type of event.
+            description (str): A description of the event.
+            focus (int): The number of the car to focus on.
+            data (dict): The names and positions involved in the event.
+
+        Returns:
+            dict: The arguments to add the event with.
+        """
+        return {
+            "type": type,
+            "description": description,
+            "focus": int(focus),
+            "data": data
+        }
+
+    def _position_label(self, current, i):
+        """Describe a car's position, within its class if there are several.
+
+        Args:
+            current (Snapshot): The current snapshot.
+            i (int): The index of the car in the snapshot.
+
+        Returns:
+            str: The position, like P3 or P3 in GT3.
+        """
+        label = f"P{int(current.class_position[i])}"
+        if current.multiclass and current.class_names[i] != "":
+            label += f" in {current.class_names[i]}"
+        return label
+
+    def _racing(self, current):
+        """Find the cars which are racing.
+
+        Args:
+            current (Snapshot): The current snapshot.
+
+        Returns:
+            ndarray: True for each car out on track and not retired (laps
+                completed is negative after a DNF, and lap percent is exactly
+                0 when a car is likely not on track).
+        """
+        return (
+            ~current.in_pits
+            & (current.laps_completed >= 0)
+            & (current.lap_percent != 0)
+        )
+
+    @abstractmethod
+    def detect(self, current, previous):
+        """Detect events.
+
+        Args:
+            current (Snapshot): The current snapshot.
+            previous (Snapshot): The previous snapshot.
+
+        Returns:
+            list: The events found.
+        """
+
+
+class BattleDetector(Detector):
+    """Detects cars battling nose to tail for position.
+
+    The interval between each car and the one ahead in the same class is found
+    from their gaps to the class leader. Runs of cars within the battle gap of
+    each other form a battle, which is reported once it has lasted long
+    enough. A battle already reported is reported again as intensifying if the
+    interval halves, at most once per report interval.
+    """
+
+    name = "battles"
+
+    def __init__(self, gap=1., min_duration=10., interval=30.):
+        """Initialize the BattleDetector class.
+
+        Args:
+            gap (float): The interval in seconds under which two cars are
+                battling.
+            min_duration (float): How long a battle must last before it is
+                reported.
+            interval (float): The minimum time between reports of the same
+                battle.
+
+        Attributes:
+            gap (float): The interval under which two cars are battling.
+            min_duration (float): How long a battle must last.
+            interval (float): The minimum time between reports.
+            battles (dict): When each battle started and was last reported,
+                keyed by the CarIdx of the pair of cars involved.
+        """
+        self.gap = gap
+        self.min_duration = min_duration
+        self.interval = interval
+        self.battles = {}
+
+    def detect(self, current, previous):
+        """Detect battles.
+
+        Args:
+            current (Snapshot): The current snapshot.
+            previous (Snapshot): The previous snapshot.
+
+        Returns:
+            list: The events found.
+        """
+        # If the race hasn't started, don't detect battles
+        if not current.race_started or not current.all_cars_started:
+            return []
+
+        # Sort the field by class, then by position within the class
+        order = np.lexsort((current.class_position, current.car_class))
+        gaps = np.nan_to_num(current.class_gap[order])
+        racing = (~current.in_pits & (current.laps_completed >= 0))[order]
+        classes = current.car_class[order]
+
+        # Find the pairs of cars in the same class close together, where both
+        # are racing
+        intervals = np.diff(gaps)
+        close = (
+            racing[1:]
+            & racing[:-1]
+            & (classes[1:] == classes[:-1])
+            & (intervals >= 0)
+            & (intervals < self.gap)
+        )
+
+        # Split the close pairs into runs of cars nose to tail
+        pairs = np.flatnonzero(close)
+        runs = np.split(pairs, np.flatnonzero(np.diff(pairs) > 1) + 1)
+
+        now = current.session_time
+        seen = set()
+        found = []
+        for run in runs:
+            if len(run) == 0:
+                continue
+
+            # Update how long each pair in the run has been battling
+            keys = [
+                frozenset((current.idx[order[i]], current.idx[order[i + 1]]))
+                for i in run
+            ]
+            starting = False
+            intensifying = False
+            start = now
+            for i, key in zip(run, keys):
+                seen.add(key)
+                battle = self.battles.setdefault(
+                    key,
+                    {"start": now, "reported": None, "gap": None}
+                )
+                start = min(start, battle["start"])
+
+                # Report a battle once it has lasted long enough
+                if battle["reported"] is None:
+                    if now - battle["start"] >= self.min_duration:
+                        starting = True
+
+                # Report it again if the gap has halved since then
+                elif (
+                    intervals[i] < battle["gap"] / 2
+                    and now - battle["reported"] >= self.interval
+                ):
+                    intensifying = True
+
+            if not starting and not intensifying:
+                continue
+
+            # Remember when the battle was reported, and how close it was
+            for i, key in zip(run, keys):
+                self.battles[key]["reported"] = now
+                self.battles[key]["gap"] = intervals[i]
+
+            # Describe the battle
+            cars = order[run[0]:run[-1] + 2]
+            names = [current.names[i] for i in cars]
+            position = int(current.class_position[cars[0]])
+            gap = round(float(intervals[run].min()), 1)
+            if len(cars) == 2:
+                description = f"{names[1]} is battling {names[0]} for "
+            else:
+                description = f"{join_names(names)} are in a train for "
+            description += f"{self._position_label(current, cars[0])}, "
+            description += f"{gap} seconds apart"
+            stage = "intensifying" if not starting else "started"
+            if stage == "intensifying":
+                description += ", and the gap is closing"
+            else:
+                description += f" for the last {int(now - start)} seconds"
+            data = {
+                "drivers": names,
+                "position": position,
+                "gap": gap,
+                "stage": stage
+            }
+
+            # Focus on the car attacking for the position
+            attacker = current.number[cars[1]]
+            found.append(self._event("battle", description, attacker, data))
+
+        # Forget battles which have split up
+        for key in list(self.battles):
+            if key not in seen:
+                del self.battles[key]
+
+        return found
+
+
+class FastestLapDetector(Detector):
+    """Detects the fastest lap of each class and personal bests.
+
+    A new fastest lap of the race in a class is always reported. Personal
+    bests are only reported for cars running near the front of their class,
+    so they don't flood the events list every lap.
+    """
+
+    name = "fastest laps"
+
+    def __init__(self, personal_best_positions=5):
+        """Initialize the FastestLapDetector class.
+
+        Args:
+            personal_best_positions (int): The positions for which personal
+                bests are reported.
+
+        Attributes:
+            personal_best_positions (int): The positions for which personal
+                bests are reported.
+        """
+        self.personal_best_positions = personal_best_positions
+
+    def detect(self, current, previous):
+        """Detect fastest laps.
+
+        Args:
+            current (Snapshot): The current snapshot.
+            previous (Snapshot): The previous snapshot.
+
+        Returns:
+            list: The events found.
+        """
+        # Lap times can only be compared once the race is under way
+        if previous is None or not current.race_started:
+            return []
+
+        # Find the cars which have just finished a lap
+        last = current.last_lap_time
+        new_lap = (
+            ~np.isnan(last)
+            & (last > 0)
+            & (last != current.lookup(previous, "last_lap_time"))
+        )
+        if not new_lap.any():
+            return []
+
+        # Find the fastest lap of each class so far
+        classes, group = np.unique(current.car_class, return_inverse=True)
+        fastest = current.lookup(previous, "fastest_lap")
+        known = ~np.isnan(fastest)
+        class_best = np.full(len(classes), np.inf)
+        np.minimum.at(class_best, group[known], fastest[known])
+
+        # Find the laps faster than the fastest of their class so far, once
+        # the class has one to beat
+        has_best = np.isfinite(class_best[group])
+        record = new_lap & has_best & (last < class_best[group])
+
+        # Only the quickest of those in each class is the new fastest lap
+        overall = np.zeros_like(record)
+        for c in np.unique(group[record]):
+            in_class = np.flatnonzero(record & (group == c))
+            overall[in_class[np.argmin(last[in_class])]] = True
+
+        # Find the personal bests near the front of each class, including
+        # laps beaten to the fastest lap in the same update
+        personal = (
+            new_lap
+            & ~overall
+            & ((last < fastest) | record)
+            & (current.class_position <= self.personal_best_positions)
+        )
+
+        found = []
+        for i in np.flatnonzero(overall | personal):
+            name = current.names[i]
+            lap_time = format_lap_time(last[i])
+            if overall[i] and current.multiclass:
+                description = f"{name} set the fastest "
+                description += f"{current.class_names[i]} lap of the race, "
+            elif overall[i]:
+                description = f"{name} set the fastest lap of the race, "
+            else:
+                description = f"{name} set a personal best lap, "
+            description += lap_time
+            data = {
+                "driver": name,
+                "time": lap_time,
+                "overall": bool(overall[i])
+            }
+            car = current.number[i]
+            found.append(self._event("fastest lap", description, car, data))
+
+        return found
+
+
+class OffTrackDetector(Detector):
+    """Detects cars leaving the track.
+
+    A car is off track when its track surface changes from the track itself
+    to off track. Each car is reported at most once per cooldown.
+    """
+
+    name = "off track"
+
+    def __init__(self, cooldown=10.):
+        """Initialize the OffTrackDetector class.
+
+        Args:
+            cooldown (float): The minimum time between reports for a car.
+
+        Attributes:
+            cooldown (float): The minimum time between reports for a car.
+            last_reported (ndarray): The session time each car was last
+                reported, by CarIdx.
+        """
+        self.cooldown = cooldown
+        self.last_reported = np.full(snapshot.MAX_CARS, -np.inf)
+
+    def detect(self, current, previous):
+        """Detect cars leaving the track.
+
+        Args:
+            current (Snapshot): The current snapshot.
+            previous (Snapshot): The previous snapshot.
+
+        Returns:
+            list: The events found.
+        """
+        # If the race hasn't started, don't detect excursions
+        if previous is None or not current.all_cars_started:
+            return []
+
+        # Find the cars which were on track and now aren't
+        was_on_track = current.lookup(previous, "track_surface")
+        off = (
+            (current.track_surface == snapshot.OFF_TRACK)
+            & (was_on_track == snapshot.ON_TRACK)
+        )
+
+        # Don't report the same car twice in quick succession
+        now = current.session_time
+        off &= now - self.last_reported[current.idx] >= self.cooldown
+
+        found = []
+        for i in np.flatnonzero(off):
+            self.last_reported[current.idx[i]] = now
+            name = current.names[i]
+            found.append(
+                self._event(
+                    "off track",
+                    f"{name} has gone off track",
+                    current.number[i],
+                    {"driver": name}
+                )
+            )
+
+        return found
+
+
+class OvertakeDetector(Detector):
+    """Detects overtakes.
+
+    A car whose position in its class has decreased since the last snapshot
+    has overtaken the car of the same class now one position behind it, so
+    cars lapping other classes aren't reported. Overtakes involving a car
+    which isn't racing are ignored.
+    """
+
+    name = "overtakes"
+
+    def detect(self, current, previous):
+        """Detect overtakes.
+
+        Args:
+            current (Snapshot): The current snapshot.
+            previous (Snapshot): The previous snapshot.
+
+        Returns:
+            list: The events found.
+        """
+        if previous is None or len(current.idx) == 0:
+            return []
+
+        # Find the cars which have gained positions in their class
+        previous_position = current.lookup(previous, "class_position")
+        gained = current.class_position < previous_position
+        if not gained.any():
+            return []
+
+        # Find the car in each position of each class
+        positions = np.nan_to_num(current.class_position).astype(int)
+        classes, group = np.unique(current.car_class, return_inverse=True)
+        width = positions.max() + 2
+        keys = group * width + positions
+        at_position = np.full(len(classes) * width, -1)
+        at_position[keys] = np.arange(len(positions))
+
+        # Find the car in the same class each gaining car has overtaken
+        overtaken = np.full(len(positions), -1)
+        overtaken[gained] = at_position[keys[gained] + 1]
+
+        # Only report overtakes between two cars which are racing
+        racing = self._racing(current)
+        valid = gained & (overtaken >= 0)
+        valid[valid] &= racing[valid] & racing[overtaken[valid]]
+
+        found = []
+        for i in np.flatnonzero(valid):
+            driver_name = current.names[i]
+            overtaken_name = current.names[overtaken[i]]
+            position = positions[i]
+            description = (
+                f"{driver_name} overtook "
+                f"{overtaken_name} for "
+                f"{self._position_label(current, i)}"
+            )
+            data = {
+                "driver": driver_name,
+                "overtaken": overtaken_name,
+                "position": int(position)
+            }
+            found.append(
+                self._event("overtake", description, current.number[i], data)
+            )
+
+        return found
+
+
+class PitDetector(Detector):
+    """Detects cars entering and leaving pit road."""
+
+    name = "pits"
+
+    def detect(self, current, previous):
+        """Detect pit entries and exits.
+
+        Args:
+            current (Snapshot): The current snapshot.
+            previous (Snapshot): The previous snapshot.
+
+        Returns:
+            list: The events found.
+        """
+        # If the race hasn't started, cars are expected to be in the pits
+        if previous is None or not current.all_cars_started:
+            return []
+
+        # Find the cars which have just entered or left pit road
+        was_on_pit_road = current.lookup(previous, "on_pit_road")
+        entered = current.on_pit_road & (was_on_pit_road == 0)
+        left = ~current.on_pit_road & (was_on_pit_road == 1)
+
+        # Don't report retired cars
+        entered &= current.laps_completed >= 0
+        left &= current.laps_completed >= 0
+
+        found = []
+        for i in np.flatnonzero(entered | left):
+            name = current.names[i]
+            action = "entered" if entered[i] else "left"
+            found.append(
+                self._event(
+                    "pit",
+                    f"{name} has {action} the pits",
+                    current.number[i],
+                    {"driver": name, "action": action}
+                )
+            )
+
+        return found
+
+
+class StoppedDetector(Detector):
+    """Detects stopped and slow cars, grouped into incidents.
+
+    The speed of every car is estimated from the change in its total distance
+    since the last snapshot, divided by the session time passed. Stopped and
+    slow cars close together on track are grouped into one incident, so a
+    multi-car crash is reported as a single event rather than one car at a
+    time. An incident is only reported if it has a car which has stopped, and
+    hasn't been reported as stopped within the cooldown.
+    """
+
+    name = "stopped"
+
+    def __init__(
+            self,
+            stopped_speed=1.,
+            slow_speed=10.,
+            incident_window=0.01,
+            cooldown=10.
+        ):
+        """Initialize the StoppedDetector class.
+
+        Args:
+            stopped_speed (float): The speed below which a car is stopped, in
+                metres per second.
+            slow_speed (float): The speed below which a car is slow, in metres
+                per second.
+            incident_window (float): How close together on track stopped cars
+                must be to be part of the same incident, as a fraction of the
+                lap.
+            cooldown (float): The minimum time between reports for a car.
+
+        Attributes:
+            stopped_speed (float): The speed below which a car is stopped.
+            slow_speed (float): The speed below which a car is slow.
+            incident_window (float): How close together stopped cars must be.
+            cooldown (float): The minimum time between reports for a car.
+            last_stopped (ndarray): The session time each car was last
+                reported as stopped, by CarIdx.
+        """
+        self.stopped_speed = stopped_speed
+        self.slow_speed = slow_speed
+        self.incident_window = incident_window
+        self.cooldown = cooldown
+        self.last_stopped = np.full(snapshot.MAX_CARS, -np.inf)
+
+    def _incidents(self, current, candidates):
+        """Group stopped and slow cars by where they are on track.
+
+        Args:
+            current (Snapshot): The current snapshot.
+            candidates (ndarray): The stopped and slow cars.
+
+        Returns:
+            list: The cars in each incident.
+        """
+        # Sort the cars by track position
+        lap_percent = current.lap_percent
+        candidates = candidates[np.argsort(lap_percent[candidates])]
+
+        # Split them into incidents wherever there's a gap on track
+        gaps = np.diff(lap_percent[candidates]) > self.incident_window
+        incidents = np.split(candidates, np.flatnonzero(gaps) + 1)
+
+        # Join the incidents either side of the start/finish line
+        if len(incidents) > 1:
+            first = lap_percent[incidents[0][0]]
+            last = lap_percent[incidents[-1][-1]]
+            if first + 1 - last <= self.incident_window:
+                incidents[0] = np.concatenate([incidents[-1], incidents[0]])
+                incidents.pop()
+
+        return incidents
+
+    def detect(self, current, previous):
+        """Detect stopped and slow cars.
+
+        Args:
+            current (Snapshot): The current snapshot.
+            previous (Snapshot): The previous snapshot.
+
+        Returns:
+            list: The events found.
+        """
+        # If not all cars have started, don't detect stopped cars
+        if previous is None or not current.all_cars_started:
+            return []
+
+        # If the replay is paused or went backwards, speeds can't be estimated
+        elapsed = current.session_time - previous.session_time
+        if elapsed <= 0:
+            return []
+
+        # Estimate each car's speed since the last snapshot
+        distance = current.total_dist - current.lookup(previous, "total_dist")
+        speed = distance / elapsed
+
+        # Only consider racing cars with a known previous distance
+        racing = self._racing(current) & ~np.isnan(speed)
+        stopped = racing & (speed < self.stopped_speed)
+        slow = racing & ~stopped & (speed < self.slow_speed)
+
+        # Stop if no car has stopped
+        if not stopped.any():
+            return []
+
+        now = current.session_time
+        found = []
+        candidates = np.flatnonzero(stopped | slow)
+        for incident in self._incidents(current, candidates):
+            # Only report incidents with a newly stopped car
+            cars = current.idx[incident]
+            recent = now - self.last_stopped[cars] < self.cooldown
+            new = incident[stopped[incident] & ~recent]
+            if len(new) == 0:
+                continue
+
+            # Describe the incident
+            stopped_cars = incident[stopped[incident]]
+            stopped_names = [current.names[i] for i in stopped_cars]
+            slow_names = [current.names[i] for i in incident[slow[incident]]]
+            focus = current.number[new[0]]
+
+            # A single stopped car is a simple stopped event
+            if len(stopped_names) == 1 and slow_names == []:
+                found.append(
+                    self._event(
+                        "stopped",
+                        f"{stopped_names[0]} is stopped on track",
+                        focus,
+                        {"driver": stopped_names[0]}
+                    )
+                )
+
+            # Otherwise, report everyone involved in one incident
+            else:
+                description = f"{join_names(stopped_names)} "
+                if len(stopped_names) == 1:
+                    description += "is stopped on track"
+                else:
+                    description += "are stopped on track"
+                if slow_names != []:
+                    description += f", {join_names(slow_names)} slowing"
+                data = {"drivers": stopped_names + slow_names}
+                found.append(
+                    self._event("incident", description, focus, data)
+                )
+
+            # Update the stopped cars' last stopped time
+            self.last_stopped[current.idx[stopped_cars]] = now
+
+        return found
+
+
+def create_detectors():
+    """Create the event detectors from the settings.
+
+    Returns:
+        list: The detectors, in the order they are run.
+    """
+    system = common.settings["system"]
+
+    return [
+        StoppedDetector(
+            stopped_speed=float(system["stopped_speed"]),
+            slow_speed=float(system["slow_speed"]),
+            incident_window=float(system["incident_lap_window"])
+        ),
+        OvertakeDetector(),
+        BattleDetector(
+            gap=float(system["battle_gap"]),
+            min_duration=float(system["battle_min_duration"]),
+            interval=float(system["battle_report_interval"])
+        ),
+        PitDetector(),
+        OffTrackDetector(),
+        FastestLapDetector(
+            personal_best_positions=int(system["personal_best_positions"])
+        )
+    ]
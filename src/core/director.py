@@ -4,9 +4,12 @@ import threading
 import time
 
 from core import camera
+from core import coalescer
 from core import common
 from core import commentary
 from core import events
+from core import grid
+from core import resilience
 
 
 class Director:
@@ -24,8 +27,20 @@ class Director:
         Attributes:
             recording_start_time (float): Stores the time recording starts.
             events (Events): The events manager.
+            coalescer (Coalescer): Groups related events into incidents.
+            grid (Grid): The starting grid, for the pre-race camera.
             commentary (Commentary): The commentary generator.
+            existing_videos (set): The video files which existed before
+                capture started.
             camera (Camera): The camera manager.
+            camera_controller (CameraController): Directs the camera once
+                the race has started.
+            cancelled (Event): Set when the director is stopped, so preparing
+                the replay gives up.
+            preparing (Thread): The thread preparing the replay, or None if
+                the director hasn't been started.
+            race_start (float): The session time of the green flag, if the
+                replay started after it, or None.
         """
 
         # Reset race status variables
@@ -40,15 +55,63 @@ class Director:
         # Create the events manager
         self.events = events.Events()
 
+        # Create the coalescer for related events
+        self.coalescer = coalescer.create_coalescer()
+
+        # Create the index of the starting grid
+        self.grid = grid.Grid()
+
         # Create the commentary generator
         self.commentary = commentary.Commentary()
 
-        # Create a variable for the camera manager (initialized when run)
+        # Keep track of the videos captured before this run
+        self.existing_videos = set()
+
+        # Create variables for the camera manager and its controller
+        # (initialized when run)
         self.camera = None
+        self.camera_controller = None
+
+        # Create the variables for preparing the replay off the main thread
+        self.cancelled = threading.Event()
+        self.preparing = None
+        self.race_start = None
 
         # Set running to False
         common.running = False
 
+    def _bisect_time(self, session_num, low, high, reached, description):
+        """Find when something first happens in the replay.
+
+        The session time is halved between a time before it happens and a
+        time after it until it is found to within a second.
+
+        Args:
+            session_num (int): The session to search in.
+            low (float): A session time before it happens.
+            high (float): A session time after it happens.
+            reached (callable): Returns True once it has happened at the
+                current point of the replay.
+            description (str): What is being waited for, for the message
+                shown if a search times out.
+
+        Returns:
+            float: The first session time found where it has happened.
+        """
+        while high - low > 1:
+            # Give up if the director has been stopped
+            if self.cancelled.is_set():
+                break
+
+            middle = (low + high) / 2
+            self._search_time(session_num, middle, description)
+            if reached():
+                high = middle
+            else:
+                low = middle
+
+        return high
+
     def _check_all_cars_started(self):
         """Check if all cars in the race have started.
 
@@ -59,14 +122,17 @@ class Director:
         Returns:
             bool: True if all cars have started, False otherwise.
         """
+        # Read from one snapshot, so every car is checked at the same moment
+        snapshot = common.snapshot
+
         # If drivers list is empty, return False
-        if common.drivers == []:
+        if snapshot is None or snapshot.drivers == ():
             return False
 
         # Check if race recently started
         if common.race_time <= 20:
             # Check if each car has crossed the line
-            for driver in common.drivers:           
+            for driver in snapshot.drivers:
                 d = driver["laps_completed"] + driver["lap_percent"]
                 # If between 0.8 and 1, car hasn't started first lap
                 if 0.8 < d < 1:
@@ -79,6 +145,39 @@ class Director:
         # If all cars have started, return True
         return True
 
+    def _find_race_start(self, session_num):
+        """Find when the green flag fell, if the replay is past it.
+
+        When the capture range starts during the race, the race start is
+        never seen live, so the replay is searched back for it and then
+        returned to where it was.
+
+        Args:
+            session_num (int): The session to search in.
+
+        Returns:
+            float: The session time of the green flag, or None if the replay
+                is before the race (or after it).
+        """
+        # The race start will be seen live if the replay is before it
+        if common.ir["SessionState"] != 4:
+            return None
+
+        description = "the replay to find the race start"
+        landed = common.ir["ReplaySessionTime"]
+        start = self._bisect_time(
+            session_num,
+            0.,
+            landed,
+            lambda: common.ir["SessionState"] == 4,
+            description
+        )
+
+        # Go back to the start of the capture range
+        self._search_time(session_num, landed, description)
+
+        return start
+
     def _generate_color_commentary(self):
         """Generate color commentary.
 
@@ -86,8 +185,10 @@ class Director:
         generated. If the chance is met, the commentary generator is called to
         generate color commentary.
         """
-        # Get the chance of generating color commentary
+        # Get the chance of generating color commentary, lowered if
+        # commentary is behind the race
         chance = float(common.settings["commentary"]["color_chance"])
+        chance *= self.commentary.quality.current()["color_chance"]
 
         # Generate color commentary with the specified chance
         if random.random() < chance:
@@ -95,7 +196,7 @@ class Director:
                 "Add color commentary to the previous commentary.",
                 "color",
                 rec_start_time=common.recording_start_time,
-                camera=self.camera
+                camera=self.camera_controller
             )
 
     def _generate_event_commentary(self, events):
@@ -109,9 +210,260 @@ class Director:
             events,
             "play-by-play",
             rec_start_time=common.recording_start_time,
-            camera=self.camera
+            camera=self.camera_controller
+        )
+
+    def _leader_lap(self):
+        """Get the lap the leader is on at the current point of the replay.
+
+        Returns:
+            int: The leader's lap, or -1 if no car is leading yet.
+        """
+        positions = common.ir["CarIdxPosition"]
+        laps = common.ir["CarIdxLap"]
+        for idx, position in enumerate(positions):
+            if position == 1:
+                return laps[idx]
+
+        return -1
+
+    def _prepare(self):
+        """Prepare the replay, then start capturing and commentating.
+
+        Runs on its own thread, since the replay searches can take a while
+        and would otherwise freeze the window. Gives up if the director is
+        stopped before the replay is ready.
+        """
+        # Jump to the start of the capture range
+        self._seek()
+        if self.cancelled.is_set():
+            return
+
+        # Hide UI
+        common.ir.cam_set_state(8)
+
+        # Start replay, waiting for it to play
+        timeout = float(common.settings["system"]["replay_timeout"])
+        common.ir.replay_set_play_speed(1)
+        self._wait_for(
+            lambda: common.ir["IsReplayPlaying"],
+            timeout,
+            "the replay to play"
+        )
+        if self.cancelled.is_set():
+            return
+
+        # Remember the existing videos, so the new capture can be found
+        self.existing_videos = self._video_files()
+
+        # Start iRacing video capture
+        common.ir.video_capture(1)
+
+        # Set recording start time
+        common.recording_start_time = time.time()
+
+        # Set running to True
+        common.running = True
+
+        # Start the events thread
+        threading.Thread(target=self.events.run).start()
+
+        # Start the director thread
+        threading.Thread(target=self.run).start()
+
+        # Let the user know on the main thread
+        common.app.after(0, common.app.add_message, "Commentary started!")
+
+    def _range_finished(self):
+        """Check if the replay has reached the end of the capture range.
+
+        Returns:
+            bool: True if the end of the range has been reached, False if
+                there is no range or it hasn't been reached yet.
+        """
+        mode = common.settings["general"]["capture_range"]
+
+        # Without a range, capture until stopped
+        if mode not in ("laps", "time"):
+            return False
+
+        # An end of 0 means capture until stopped
+        end = float(common.settings["general"]["range_end"])
+        if end <= 0:
+            return False
+
+        # In lap mode, finish once the leader completes the last lap
+        if mode == "laps":
+            snapshot = common.snapshot
+            if snapshot is None or snapshot.drivers == ():
+                return False
+            laps = max(driver["laps_completed"] for driver in snapshot.drivers)
+            return laps >= end
+
+        # In time mode, finish at the end session time
+        elif mode == "time":
+            return common.ir["SessionTime"] >= end
+
+        return False
+
+    def _search(self, search, arrived, description):
+        """Search the replay, waiting for iRacing to get there.
+
+        iRacing searches in the background, so the search is finished once
+        the replay is where it should be and its frame has held still for a
+        moment. A replay which is already there never moves, so if the frame
+        doesn't change at all, the search is finished after a short grace
+        period instead of waiting for a change that never comes.
+
+        Args:
+            search (callable): Sends the replay search to iRacing.
+            arrived (callable): Returns True once the replay is where the
+                search should take it.
+            description (str): What is being waited for, for the message
+                shown if it times out.
+        """
+        timeout = float(common.settings["system"]["replay_timeout"])
+        settle_time = 0.25
+        grace_time = 1.
+        # Don't send any more searches once the director has been stopped
+        if self.cancelled.is_set():
+            return
+
+        start_frame = common.ir["ReplayFrameNum"]
+        search()
+
+        # Note when the frame last changed
+        last = {"frame": start_frame, "changed": time.time(), "moved": False}
+
+        def settled():
+            """Check if the replay has arrived and stopped moving."""
+            frame = common.ir["ReplayFrameNum"]
+            if frame != last["frame"]:
+                last["frame"] = frame
+                last["changed"] = time.time()
+                last["moved"] = True
+
+            # Wait longer if the replay hasn't moved, in case iRacing is slow
+            # to start the search
+            wait = settle_time if last["moved"] else grace_time
+            still = time.time() - last["changed"] >= wait
+            return still and arrived()
+
+        self._wait_for(settled, timeout, description)
+
+    def _search_time(self, session_num, session_time, description):
+        """Jump the replay to a session time, waiting for iRacing to get there.
+
+        Args:
+            session_num (int): The session to search in.
+            session_time (float): The session time to jump to in seconds.
+            description (str): What is being waited for, for the message
+                shown if it times out.
+        """
+        self._search(
+            lambda: common.ir.replay_search_session_time(
+                session_num,
+                int(session_time * 1000)
+            ),
+            lambda: (
+                common.ir["ReplaySessionNum"] == session_num
+                and (
+                    abs(common.ir["ReplaySessionTime"] - session_time) < 1
+                    or common.ir["ReplayFrameNumEnd"] == 0
+                )
+            ),
+            description
         )
 
+    def _seek(self):
+        """Jump the replay to the start of the capture range.
+
+        The replay is paused first, so its frame holds still once each search
+        finishes. With no range, the replay jumps to the beginning of the
+        current session. In lap mode, it then searches forward by session
+        time for the moment the leader starts the first lap in the range. In
+        time mode, it jumps straight to the start session time. If the range
+        starts during the race, the green flag is then found, so race time is
+        counted from the real start.
+        """
+        mode = common.settings["general"]["capture_range"]
+        session_num = common.ir["SessionNum"]
+
+        # Pause the replay while searching
+        common.ir.replay_set_play_speed(0)
+
+        # Jump straight to a session time
+        if mode == "time":
+            start = float(common.settings["general"]["range_start"])
+            self._search_time(
+                session_num,
+                start,
+                f"the replay to reach {start} seconds"
+            )
+            self.race_start = self._find_race_start(session_num)
+            return
+
+        # Jump to beginning of current session
+        self._search(
+            lambda: common.ir.replay_search(2),
+            lambda: common.ir["ReplaySessionNum"] == session_num,
+            "the replay to rewind"
+        )
+
+        # Search forward to the first lap in the range
+        if mode == "laps":
+            start = int(float(common.settings["general"]["range_start"]))
+            if start > 0:
+                self._seek_lap(session_num, start)
+                self.race_start = self._find_race_start(session_num)
+
+    def _seek_lap(self, session_num, lap):
+        """Jump the replay to the moment the leader starts a lap.
+
+        The replay is searched forward in growing steps of session time until
+        the leader is on the lap, then the last step is halved until the
+        start of the lap is found to within a second.
+
+        Args:
+            session_num (int): The session to search in.
+            lap (int): The lap to jump to the start of.
+        """
+        description = f"the replay to reach lap {lap}"
+        low = common.ir["ReplaySessionTime"]
+        step = 60.
+
+        # Step forward until the leader is on the lap
+        high = low + step
+        self._search_time(session_num, high, description)
+        while self._leader_lap() < lap:
+            # Give up if the director has been stopped
+            if self.cancelled.is_set():
+                return
+
+            # Stop at the end of the replay
+            if common.ir["ReplayFrameNumEnd"] == 0:
+                common.app.after(
+                    0,
+                    common.app.add_message,
+                    f"The replay ends before lap {lap}, starting at the end"
+                )
+                return
+            low, step = high, step * 2
+            high = low + step
+            self._search_time(session_num, high, description)
+
+        # Narrow down to when the leader started the lap
+        high = self._bisect_time(
+            session_num,
+            low,
+            high,
+            lambda: self._leader_lap() >= lap,
+            description
+        )
+
+        # Finish at the start of the lap
+        self._search_time(session_num, high, description)
+
     def _update_iracing_settings(self):
         """Update iRacing settings to enable video capture.
 
@@ -174,6 +526,53 @@ class Director:
         with open(os.path.join(path, "app.ini"), "w") as f:
             f.write(app_ini)
 
+    def _video_files(self):
+        """Get the video files in the iRacing videos folder.
+
+        Returns:
+            set: The paths of the video files.
+        """
+        path = os.path.join(
+            common.settings["general"]["iracing_path"],
+            "videos"
+        )
+        files = set()
+        for file in os.listdir(path):
+            if file.endswith(common.settings["general"]["video_format"]):
+                files.add(os.path.join(path, file))
+
+        return files
+
+    def _wait_for(self, condition, timeout, description):
+        """Wait until iRacing is ready, checking frequently.
+
+        Args:
+            condition (callable): Returns True once iRacing is ready.
+            timeout (float): The longest time to wait in seconds.
+            description (str): What is being waited for, for the message
+                shown if it times out.
+
+        Returns:
+            bool: Whether or not iRacing became ready in time.
+        """
+        deadline = time.time() + timeout
+        while not condition():
+            # Stop waiting if the director has been stopped
+            if self.cancelled.is_set():
+                return False
+
+            # Carry on anyway if iRacing takes too long
+            if time.time() > deadline:
+                common.app.after(
+                    0,
+                    common.app.add_message,
+                    f"Timed out waiting for {description}, continuing anyway"
+                )
+                return False
+            time.sleep(0.05)
+
+        return True
+
     def run(self):
         """The main loop for the Director class.
 
@@ -182,9 +581,6 @@ class Director:
         temporary file that keeps track of the files used by Intellicaster in
         the iRacing videos folder if it doesn't already exist.
         """
-        # Wait one second to ensure video capture is started
-        time.sleep(2)
-        
         # Create a file in the videos folder called intellicaster.tmp if needed
         path = os.path.join(
             common.settings["general"]["iracing_path"],
@@ -195,15 +591,25 @@ class Director:
             with open(path, "w") as f:
                 f.write("intellicaster.tmp\n")
 
-        # Get the video file with the most recent timestamp in the videos folder
+        # Wait for video capture to create its file
         path = os.path.join(
             common.settings["general"]["iracing_path"],
             "videos"
         )
         files = []
-        for file in os.listdir(path):
-            if file.endswith(common.settings["general"]["video_format"]):
-                files.append(os.path.join(path, file))
+
+        def capture_started():
+            """Check if a new video file has appeared."""
+            nonlocal files
+            files = list(self._video_files() - self.existing_videos)
+            return files != []
+
+        # If it doesn't appear in time, fall back to every video file
+        timeout = float(common.settings["system"]["capture_timeout"])
+        if not self._wait_for(capture_started, timeout, "video capture"):
+            files = list(self._video_files())
+
+        # Get the video file with the most recent timestamp
         files.sort(key=os.path.getmtime)
         latest_video = files[-1]
 
@@ -214,51 +620,38 @@ class Director:
         # Create the camera manager
         self.camera = camera.Camera()
 
+        # Start the camera thread, which takes over once the race starts
+        self.camera_controller = camera.create_camera_controller(
+            self.camera,
+            self.events
+        )
+        threading.Thread(target=self.camera_controller.run).start()
+
         # Keep running until told to stop
         while common.running:
+            # Stop on the main thread once the capture range is over
+            if self._range_finished():
+                common.app.add_message("Reached the end of the capture range")
+                common.app.after(0, common.app.stop_commentary)
+                break
+
             # Detect if the race has started
             if common.ir["SessionState"] == 4 and not common.race_started:
                 common.race_started = True
                 common.start_time = common.ir["SessionTime"]
 
+                # Count from the green flag if the replay started after it
+                if self.race_start is not None:
+                    common.start_time = self.race_start
+
             # If the race has already started, update the race length
             elif common.race_started:
                 common.race_time = common.ir["SessionTime"] - common.start_time
 
             # If the race hasn't started yet, focus on the front of the grid
             if not common.race_started:
-                # Get all the current track positions
-                positions = common.ir["CarIdxLapDistPct"]
-
-                # Get the quali results
-                for session in common.ir["SessionInfo"]["Sessions"]:
-                    if session["SessionName"] == "QUALIFY":
-                        quali = session["ResultsPositions"]
-                
-                # Get driver numbers and add them to quali results
-                for driver in common.ir["DriverInfo"]["Drivers"]:
-                    for car in quali:
-                        if car["CarIdx"] == driver["CarIdx"]:
-                            car["Number"] = int(driver["CarNumber"])
-
-                focus = 999
-                driver = 0
-                for i, pos in enumerate(positions):
-                    # Skip the first position (pace car)
-                    if i == 0:
-                        continue
-                    # If car is in pits, skip
-                    if common.ir["CarIdxOnPitRoad"][i] == True:
-                        continue
-                    # If position is less than 0 (haven't gridded yet), skip
-                    if pos < 0:
-                        continue
-                    # Find the gridded car with the best qualifying position
-                    for car in quali:
-                        if car["CarIdx"] == i:
-                            if car["Position"] < focus:
-                                focus = car["Position"]
-                                driver = car["Number"]
+                # Find the gridded car with the best qualifying position
+                driver = self.grid.front_car()
 
                 # Switch to the first car that's not in the pits
                 self.camera.change_camera(driver, "TV1")
@@ -273,8 +666,8 @@ class Director:
 
             # If the race has started, generate commentary
             if common.race_started and common.all_cars_started:
-                # Get the list of recent events
-                events = self.events.get_events()
+                # Get the list of recent events, grouping related ones
+                events = self.coalescer.coalesce(self.events.get_events())
 
                 # If an event was found, report it
                 if len(events) > 0:
@@ -289,41 +682,33 @@ class Director:
     def start(self):
         """Start the director.
 
-        This method starts the director by updating iRacing settings, jumping
-        to the beginning of the current session, hiding the UI, starting the
-        replay, and starting iRacing video capture. It then sets the running
-        flag to True and starts the director thread.
+        This method starts the director by updating iRacing settings, then
+        prepares the replay on a separate thread: jumping to the start of the
+        capture range (the beginning of the current session by default),
+        hiding the UI, starting the replay, and starting iRacing video
+        capture. It then sets the running flag to True and starts the
+        director thread.
         """
         # Update iRacing settings
         self._update_iracing_settings()
 
-        # Jump to beginning of current session, wait for iRacing to catch up
-        common.ir.replay_search(2)
-        time.sleep(1)
+        # Forget the audio levels from any previous run
+        common.audio_peaks = {}
 
-        # Hide UI
-        common.ir.cam_set_state(8)
+        # Forget the provider latencies and outcomes from any previous run
+        resilience.reset()
 
-        # Start replay
-        common.ir.replay_set_play_speed(1)
+        # Forget the drivers and events from any previous run
+        self.events.reset()
 
-        # Start iRacing video capture
-        common.ir.video_capture(1)
+        # Warm up the commentary clients while the replay is prepared
+        self.commentary.warm_up()
 
-        # Set recording start time
-        common.recording_start_time = time.time()
-
-        # Wait for iRacing to catch up
-        time.sleep(1)
-
-        # Set running to True
-        common.running = True
-
-        # Start the events thread
-        threading.Thread(target=self.events.run).start()
-
-        # Start the director thread
-        threading.Thread(target=self.run).start()
+        # Prepare the replay without blocking the main thread
+        self.race_start = None
+        self.cancelled.clear()
+        self.preparing = threading.Thread(target=self._prepare, daemon=True)
+        self.preparing.start()
 
     def stop(self):
         """Stop the director.
@@ -331,6 +716,11 @@ class Director:
         This method stops the director by setting the running flag to False,
         stopping iRacing video capture, and stopping the replay.
         """
+        # Stop preparing the replay, waiting for its current check to finish
+        self.cancelled.set()
+        if self.preparing is not None:
+            self.preparing.join()
+
         # Set running to False
         common.running = False
 
@@ -341,4 +731,46 @@ class Director:
         common.ir.replay_set_play_speed(0)
 
         # Shut down the IRSDK object
-        common.ir.shutdown()
\ No newline at end of file
+        common.ir.shutdown()
+
+        # Report how often the caches were used
+        text_cache = self.commentary.text_generator.cache
+        audio_cache = self.commentary.voice_generator.cache
+        common.app.add_message(
+            f"Response cache: {text_cache.hits} hits, "
+            f"{text_cache.misses} misses"
+        )
+        common.app.add_message(
+            f"Audio cache: {audio_cache.hits} hits, "
+            f"{audio_cache.misses} misses"
+        )
+
+        # Report how the API connections were used
+        for line in common.transport.summary():
+            common.app.add_message(line)
+
+        # Report the latency of each provider
+        for tracker in resilience.trackers.values():
+            common.app.add_message(tracker.summary())
+
+        # Report the tokens used by each route
+        for route in self.commentary.text_generator.routes.values():
+            common.app.add_message(route.summary())
+
+        # Report how often each provider was unavailable
+        for breaker in resilience.breakers.values():
+            common.app.add_message(breaker.summary())
+
+        # Report how the drivers in the session changed
+        common.app.add_message(self.events.roster.summary())
+
+        # Report how long event detection takes
+        for line in self.events.summary():
+            common.app.add_message(line)
+
+        # Report how the camera switched
+        if self.camera is not None:
+            common.app.add_message(self.camera.summary())
+
+        # Report how the commentary quality changed
+        common.app.add_message(self.commentary.quality.summary())
@@ -94,8 +94,12 @@ class Editor:
             # Cut end of audio to avoid glitch
             audio = audio.subclip(0, audio.duration - 0.05)
 
-            # Normalize the audio
-            audio = audio_normalize(audio)
+            # Normalize the audio, using the known peak level if there is one
+            peak = common.audio_peaks.get(file_name)
+            if peak:
+                audio = audio.fx(volumex, 1 / peak)
+            else:
+                audio = audio_normalize(audio)
 
             # Add the audio clip to the list
             audio_clips.append(audio)
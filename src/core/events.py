@@ -1,7 +1,14 @@
-from copy import deepcopy
+from collections import deque
 import time
 
+import numpy as np
+
 from core import common
+from core import corners
+from core import detectors
+from core import roster
+from core import snapshot
+from utility import stats
 
 
 class Events:
@@ -9,7 +16,8 @@ class Events:
     
     This class is used to detect and report events such as overtakes and
     incidents. It is run in a separate thread from the main thread and is
-    responsible for updating the drivers list and the previous drivers list.
+    responsible for updating the drivers list. Each update, a snapshot of the
+    race is taken and passed to every detector along with the previous one.
     """
     def __init__(self):
         """Initialize the Events object.
@@ -20,27 +28,48 @@ class Events:
         Attributes:
             events (list): A list of events
             id_counter (int): The id of the next event to be added
+            latest (dict): The most recently added event
+            roster (Roster): The drivers in the session, keyed by CarIdx
+            detectors (list): The event detectors, in the order they are run
+            previous (Snapshot): The snapshot taken at the last update
+            timings (dict): The most recent run times of each detector in
+                seconds, keyed by detector name
         """
         # Initialize the events list and id counter
         self.events = []
         self.id_counter = 0
+        self.latest = None
+
+        # Track who is in the session as drivers join and leave
+        self.roster = roster.Roster()
+
+        # Create the detectors
+        self.detectors = detectors.create_detectors()
+
+        # Keep the last snapshot to compare the next one to
+        self.previous = None
+
+        # Time each detector, so the cost of each update stays visible
+        self.timings = {
+            detector.name: deque(maxlen=1000) for detector in self.detectors
+        }
 
-    def _add(self, type, description, focus=None):
+    def _add(self, type, description, focus=None, data=None):
         """Add a new event to the list.
         
         Args:
             type (str): The type of event
             description (str): A description of the event
             focus (int): The number of the driver to focus on
+            data (dict): The names and positions involved in the event
         """
         # Get the lap percent of the focused driver
+        lap_percent = None
         if focus != None:
-            for driver in common.drivers:
+            for driver in common.snapshot.drivers:
                 if driver["number"] == focus:
                     lap_percent = driver["lap_percent"]
                     break
-        else:
-            lap_percent = None
 
         # Create a new event
         new_event = {
@@ -48,198 +77,43 @@ class Events:
             "type": type,
             "description": description,
             "lap_percent": lap_percent,
+            "corner": corners.corner_at(lap_percent),
             "focus": focus,
+            "data": data,
             "timestamp": time.time()
         }
 
         # Add the event to the list
         self.events.append(new_event)
+        self.latest = new_event
 
         # Increment the id counter
         self.id_counter += 1
 
-    def _create_drivers(self):
-        """Create a list of drivers.
-
-        This method creates a list of drivers from the iRacing SDK. It is called
-        when the Events object's run method is called.
-
-        Returns:
-            list: A list of dictionaries containing driver data.
-        """
-        # Create an empty list to track drivers
-        driver_dict = []
-
-        # Get driver data from iRacing SDK
-        driver_data = common.ir["DriverInfo"]["Drivers"]
-
-        # Get quali results
-        for session in common.ir["SessionInfo"]["Sessions"]:
-            if session["SessionName"] == "QUALIFY":
-                quali = session["ResultsPositions"]
-
-        # Create a dictionary for each driver
-        for driver in driver_data:
-            # Skip the pace car
-            if driver["CarIdx"] == 0:
-                continue
-
-            # Get the driver's quali position
-            for car in quali:
-                if car["CarIdx"] == driver["CarIdx"]:
-                    quali_pos = car["Position"]
-
-            # Add the driver to the list
-            driver_dict.append(
-                {
-                    "car_name": driver["CarScreenNameShort"],
-                    "current_lap_time": 0,
-                    "fastest_lap": None,
-                    "gap_to_leader": None,
-                    "grid_position": quali_pos,
-                    "idx": driver["CarIdx"],
-                    "in_pits": False,
-                    "irating": driver["IRating"],
-                    "lap_distance": 0,
-                    "lap_percent": 0,
-                    "laps_completed": 0,
-                    "laps_started": 0,
-                    "lap_times": [],
-                    "last_lap_time": None,
-                    "last_stopped": None,
-                    "license": driver["LicString"],
-                    "name": driver["UserName"],
-                    "number": driver["CarNumberRaw"],
-                    "on_track": False,
-                    "position": quali_pos,
-                    "total_dist": 0
-                }
-            )
-
-        # Sort the list by grid position
-        driver_dict.sort(key=lambda x: x["grid_position"])
-
-        # Return the list of drivers
-        return driver_dict
+    def _detect(self):
+        """Run every detector on a snapshot of the race.
 
-    def _detect_overtakes(self):
-        """Detect overtakes and add them to the events list.
-        
-        This method detects overtakes by comparing the current drivers list to
-        the previous drivers list. If a driver's position has decreased, they
-        have overtaken someone. If this is the case, the driver who was
-        overtaken is found and an overtake event is added to the events list.
-        This method also checks a few other conditions to make sure the overtake
-        is legitimate.
+        Each detector compares the same snapshot to the one from the last
+        update, and the events found are added to the events list. The
+        snapshot is also published as common.snapshot.
         """
-        # Go through all the drivers
-        for driver in common.drivers:
-            # Get this driver's previous information
-            prev_d = None
-            for d in common.prev_drivers:
-                if d["name"] == driver["name"]:
-                    prev_d = d
-                    break
-
-            # If a driver's position has decreased, they have overtaken someone
-            if prev_d and driver["position"] < prev_d["position"]:
-                # Find the driver whose position is 1 higher than this driver's
-                overtaken = None
-                for item in common.drivers:
-                    if item["position"] == driver["position"] + 1:
-                        overtaken = item
-                        break
-                
-                # If no driver was found, don't report overtake
-                if not overtaken:
-                    continue
+        # Take one snapshot for all the detectors to share, and publish it for
+        # the other threads
+        current = snapshot.take_snapshot(self.roster.drivers)
+        common.snapshot = current
 
-                # If either driver is in the pits, don't report overtake
-                if driver["in_pits"] or overtaken["in_pits"]:
-                    continue
+        # Run each detector, timing it
+        for detector in self.detectors:
+            start = time.perf_counter()
+            found = detector.detect(current, self.previous)
+            self.timings[detector.name].append(time.perf_counter() - start)
 
-                # If laps completed is negative (DNF), don't report overtake
-                if driver["laps_completed"] < 0:
-                    continue
-                if overtaken["laps_completed"] < 0:
-                    continue
+            # Add the events found
+            for event in found:
+                self._add(**event)
 
-                # If lap percent is exactly 0, driver is likely not on track
-                if driver["lap_percent"] == 0:
-                    continue
-                if overtaken["lap_percent"] == 0:
-                    continue
-
-                # If an legitimate overtake was found, add it to the events list
-                driver_name = common.remove_numbers(driver["name"])
-                overtaken_name = common.remove_numbers(overtaken["name"])
-                description = (
-                    f"{driver_name} overtook "
-                    f"{overtaken_name} for "
-                    f"P{driver['position']}"
-                )
-                self._add("overtake", description, driver["number"])
-
-                # End this iteration of the loop
-                break
-
-    def _detect_stopped(self):
-        """Detect stopped cars and add them to the events list.
-        
-        This method detects stopped cars by comparing the current drivers list
-        to the previous drivers list. If a driver's lap distance has not
-        increased enough, they have stopped. If this is the case, an incident
-        event is added to the events list.
-        """
-        # If the race hasn't started, don't detect stopped cars
-        if not common.race_started:
-            return
-        
-        # If not all cars have started, don't detect stopped cars
-        if not common.all_cars_started:
-            return
-        
-        # Go through all the drivers
-        for driver in common.drivers:
-            # Get this driver's previous information
-            prev_d = None
-            for d in common.prev_drivers:
-                if d["name"] == driver["name"]:
-                    prev_d = d
-                    break
-
-            # If total distance not increased by at least 1m, they are stopped
-            if prev_d and driver["total_dist"] - prev_d["total_dist"] < 1:
-                # If the driver is in the pits, don't report it
-                if driver["in_pits"]:
-                    continue
-
-                # If laps completed is negative (DNF), don't report it
-                if driver["laps_completed"] < 0:
-                    continue
-
-                # If lap percent is exactly 0, driver is likely not on track
-                if driver["lap_percent"] == 0:
-                    continue
-
-                # If driver last stopped less than 10 seconds ago, don't report
-                if driver["last_stopped"]:
-                    if time.time() - driver["last_stopped"] < 10:
-                        continue
-
-                # If a legitimate stopped car was found, add it to events list
-                driver_name = common.remove_numbers(driver["name"])
-                description = f"{driver_name} is stopped on track"
-                self._add("stopped", description, driver["number"])
-
-                # Update the driver's last stopped time
-                for i, d in enumerate(common.drivers):
-                    if d["name"] == driver["name"]:
-                        common.drivers[i]["last_stopped"] = time.time()
-                        break
-
-                # End this iteration of the loop
-                break
+        # Keep the snapshot for the next update
+        self.previous = current
 
     def _remove(self, id):
         """Remove an event from the list.
@@ -277,120 +151,148 @@ class Events:
         # Return the new list
         return new_events
 
+    def _update_classes(self):
+        """Update each driver's position and gap within their car class.
+
+        The drivers list is already in overall order, so sorting it by class
+        (keeping that order within each class) puts every class together, best
+        first. Each driver's class position is then their place in that
+        group, and their class gap is their gap to the leader minus the class
+        leader's.
+        """
+        # If there are no drivers, there is nothing to rank
+        if self.roster.drivers == []:
+            return
+
+        # Group the drivers by class, keeping the overall order in each class
+        classes = np.array([d["car_class"] for d in self.roster.drivers])
+        gaps = np.array(
+            [d["gap_to_leader"] or 0. for d in self.roster.drivers],
+            dtype=float
+        )
+        order = np.lexsort((np.arange(len(classes)), classes))
+
+        # Find where each class starts in the grouped order
+        grouped = classes[order]
+        starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+        sizes = np.diff(np.r_[starts, len(order)])
+        group_start = np.repeat(starts, sizes)
+
+        # Rank each driver within their class and find their class gap
+        class_position = np.empty(len(order), dtype=int)
+        class_position[order] = np.arange(len(order)) - group_start + 1
+        class_gap = np.empty(len(order))
+        class_gap[order] = gaps[order] - gaps[order][group_start]
+
+        # Update the drivers list
+        for i, driver in enumerate(self.roster.drivers):
+            driver["class_position"] = int(class_position[i])
+            driver["class_gap"] = float(class_gap[i])
+
     def _update_drivers(self):
         """Update the drivers list.
 
         This method updates the drivers list by getting the latest data from the
         iRacing SDK and updating the drivers list accordingly.
         """
-        # Get driver data from iRacing SDK
-        driver_data = common.ir["DriverInfo"]["Drivers"]
+        # Add drivers who have joined and retire those who have left
+        self.roster.sync()
 
-        # Update the drivers list
+        # Update each driver in the roster from their CarIdx
         if common.ir["CarIdxPosition"] != []:
-            for i, pos in enumerate(common.ir["CarIdxPosition"]):
-                # Exclude the pace car and cars that don't exist
-                if pos == 0: 
-                    continue
-                # Exclude disconnected drivers
-                try:
-                    if not driver_data[i]["UserName"]:
-                        continue
-                # If i is out of range, continue
-                except:
+            for idx, driver in self.roster.by_idx.items():
+                # Exclude cars that don't have a position yet
+                if common.ir["CarIdxPosition"][idx] == 0:
                     continue
 
-                # Find the driver in the drivers list at this index
-                for j, driver in enumerate(common.drivers):
-                    if driver["idx"] == i:
-                        # Get old last lap for later comparison
-                        old_last_lap = driver["last_lap_time"]
-
-                        # Get the driver's last lap time if it exists
-                        last_lap_time = common.ir["CarIdxLastLapTime"][i]
-                        if last_lap_time > 0: 
-                            common.drivers[j]["last_lap_time"] = last_lap_time
-
-                        # If there's no fastest lap, set it to the last lap
-                        if driver["fastest_lap"] == None:
-                            if last_lap_time > 0:
-                                common.drivers[j]["fastest_lap"] = last_lap_time
-                        
-                        # If the last lap is faster than the fastest lap, update
-                        elif last_lap_time < driver["fastest_lap"]:
-                            if last_lap_time > 0:
-                                common.drivers[j]["fastest_lap"] = last_lap_time
-                        
-                        # If new last lap different than old, append to lap list
-                        if last_lap_time != old_last_lap and last_lap_time > 0:
-                            common.drivers[j]["lap_times"].append(last_lap_time)
-
-                        # Update the current lap time
-                        current_lap_time = common.ir["CarIdxEstTime"][i]
-                        common.drivers[j]["current_lap_time"] = current_lap_time
-
-                        # Update percentage of lap completed
-                        lap_percent = common.ir["CarIdxLapDistPct"][i]
-                        common.drivers[j]["lap_percent"] = lap_percent
-
-                        # Update laps started and completed
-                        started = common.ir["CarIdxLap"][i]
-                        completed = common.ir["CarIdxLapCompleted"][i]
-                        common.drivers[j]["laps_started"] = started
-                        common.drivers[j]["laps_completed"] = completed
-
-                        # Update lap and total distance completed
-                        track_length = common.ir["WeekendInfo"]["TrackLength"]
-                        track_length = float(track_length.split(" ")[0])
-                        track_length = track_length * 1000
-                        lap_distance = lap_percent * track_length
-                        common.drivers[j]["lap_distance"] = lap_distance
-                        dist_comp = (completed * track_length) + lap_distance
-                        common.drivers[j]["total_dist"] = dist_comp
-
-                        # Update gap to leader
-                        gap_to_leader = common.ir["CarIdxF2Time"][i]
-                        common.drivers[j]["gap_to_leader"] = gap_to_leader
-
-                        # Update pits status
-                        track_surface = common.ir["CarIdxTrackSurface"][i]
-                        if track_surface == 1 or track_surface == 2:
-                            in_pits = True
-                        else:
-                            in_pits = False
-                        common.drivers[j]["in_pits"] = in_pits
-
-                        # Update on track status
-                        if common.ir["CarIdxLapDistPct"][i] > 0:
-                            common.drivers[j]["on_track"] = True
-                        else:
-                            common.drivers[j]["on_track"] = False
+                # Get old last lap for later comparison
+                old_last_lap = driver["last_lap_time"]
+
+                # Get the driver's last lap time if it exists
+                last_lap_time = common.ir["CarIdxLastLapTime"][idx]
+                if last_lap_time > 0: 
+                    driver["last_lap_time"] = last_lap_time
+
+                # If there's no fastest lap, set it to the last lap
+                if driver["fastest_lap"] == None:
+                    if last_lap_time > 0:
+                        driver["fastest_lap"] = last_lap_time
+                
+                # If the last lap is faster than the fastest lap, update
+                elif last_lap_time < driver["fastest_lap"]:
+                    if last_lap_time > 0:
+                        driver["fastest_lap"] = last_lap_time
+                
+                # If new last lap different than old, append to lap list
+                if last_lap_time != old_last_lap and last_lap_time > 0:
+                    driver["lap_times"].append(last_lap_time)
+
+                # Update the current lap time
+                current_lap_time = common.ir["CarIdxEstTime"][idx]
+                driver["current_lap_time"] = current_lap_time
+
+                # Update percentage of lap completed
+                lap_percent = common.ir["CarIdxLapDistPct"][idx]
+                driver["lap_percent"] = lap_percent
+
+                # Update laps started and completed
+                started = common.ir["CarIdxLap"][idx]
+                completed = common.ir["CarIdxLapCompleted"][idx]
+                driver["laps_started"] = started
+                driver["laps_completed"] = completed
+
+                # Update lap and total distance completed
+                track_length = common.ir["WeekendInfo"]["TrackLength"]
+                track_length = float(track_length.split(" ")[0])
+                track_length = track_length * 1000
+                lap_distance = lap_percent * track_length
+                driver["lap_distance"] = lap_distance
+                dist_comp = (completed * track_length) + lap_distance
+                driver["total_dist"] = dist_comp
+
+                # Update gap to leader
+                gap_to_leader = common.ir["CarIdxF2Time"][idx]
+                driver["gap_to_leader"] = gap_to_leader
+
+                # Update pits status
+                track_surface = common.ir["CarIdxTrackSurface"][idx]
+                if track_surface == 1 or track_surface == 2:
+                    in_pits = True
+                else:
+                    in_pits = False
+                driver["in_pits"] = in_pits
+
+                # Update on track status
+                if common.ir["CarIdxLapDistPct"][idx] > 0:
+                    driver["on_track"] = True
+                else:
+                    driver["on_track"] = False
 
         # Sort the list by current position if race has started
         if common.race_started:
-            common.drivers.sort(
+            self.roster.drivers.sort(
                 key=lambda x: x["laps_completed"] + x["lap_percent"],
                 reverse=True
             )
 
             # Update the positions
-            for i, driver in enumerate(common.drivers):
-                common.drivers[i]["position"] = i + 1
+            for i, driver in enumerate(self.roster.drivers):
+                self.roster.drivers[i]["position"] = i + 1
                 
         # Otherwise, sort by grid position
         else:
-            common.drivers.sort(key=lambda x: x["grid_position"])
+            self.roster.drivers.sort(key=lambda x: x["grid_position"])
 
         # After sorting by position, update the gaps
-        for i, driver in enumerate(common.drivers):
+        for i, driver in enumerate(self.roster.drivers):
             # If the driver is the leader, gap to leader is 0
             if i == 0:
-                common.drivers[i]["gap_to_leader"] = 0.
+                self.roster.drivers[i]["gap_to_leader"] = 0.
 
             # Otherwise, calculate the gap to leader
             else:
                 # Get the leader car
-                leader = common.drivers[0]
+                leader = self.roster.drivers[0]
                 
                 # Get the leader's current lap time plus all previous laps
                 leader_current = leader["current_lap_time"]
@@ -406,7 +308,10 @@ class Events:
                 gap_to_leader = leader_total - driver_total
 
                 # Update the driver's gap to leader
-                common.drivers[i]["gap_to_leader"] = gap_to_leader
+                self.roster.drivers[i]["gap_to_leader"] = gap_to_leader
+
+        # Rank the drivers within their classes
+        self._update_classes()
 
     def get_events(self):
         """Get the events list.
@@ -426,6 +331,43 @@ class Events:
         # Return the events list
         return self.events
     
+    def summary(self):
+        """Describe how long each detector takes to run.
+
+        Returns:
+            list: One line describing each detector.
+        """
+        lines = []
+        for name, timings in self.timings.items():
+            summary = stats.summarise(list(timings))
+            if summary["count"] == 0:
+                continue
+            lines.append(
+                f"{name} detector: "
+                f"mean {summary['mean'] * 1000:.2f} ms, "
+                f"p95 {summary['p95'] * 1000:.2f} ms, "
+                f"max {summary['max'] * 1000:.2f} ms"
+            )
+
+        return lines
+
+    def reset(self):
+        """Forget the drivers, events and snapshots of any previous run.
+
+        The roster only rebuilds when the session info changes, and the
+        detectors and the previous snapshot describe where the last run left
+        off, so they are all started afresh for the rewound replay.
+        """
+        self.events = []
+        self.latest = None
+        self.roster = roster.Roster()
+        self.detectors = detectors.create_detectors()
+        self.previous = None
+        self.timings = {
+            detector.name: deque(maxlen=1000) for detector in self.detectors
+        }
+        common.snapshot = None
+
     def run(self):
         """Run the events thread.
 
@@ -433,20 +375,13 @@ class Events:
         to the events list. It also updates the drivers list and the previous
         drivers list.
         """
-        # Create the drivers dict
-        common.drivers = self._create_drivers()
-
         # Keep running until told to stop
         while common.running:
             # Update the drivers list
             self._update_drivers()
 
             # Detect events
-            self._detect_stopped()
-            self._detect_overtakes()
-
-            # Update the previous drivers list
-            common.prev_drivers = deepcopy(common.drivers)
+            self._detect()
 
             # Remove old events
             max_hist_len = float(common.settings["system"]["event_hist_len"])
@@ -0,0 +1,70 @@
+import numpy as np
+
+from core import common
+from core.snapshot import MAX_CARS
+
+
+class Grid:
+    """The starting grid, indexed by CarIdx.
+
+    Before the green flag, the camera shows the car highest on the grid which
+    has taken its grid slot. The grid order and car numbers only change when
+    the session info does, so they are kept as arrays and only rebuilt then,
+    leaving a single masked argmin to do on each update.
+    """
+
+    def __init__(self):
+        """Initialize the Grid class.
+
+        Attributes:
+            grid_position (ndarray): The qualifying position of each car, by
+                CarIdx, or infinity for cars not on the grid.
+            number (ndarray): The car number of each car, by CarIdx.
+            session_info_update (int): The SessionInfoUpdate last built from.
+        """
+        self.grid_position = np.full(MAX_CARS, np.inf)
+        self.number = np.zeros(MAX_CARS, dtype=int)
+        self.session_info_update = None
+
+    def _refresh(self):
+        """Rebuild the grid if the session info has changed."""
+        update = common.ir["SessionInfoUpdate"]
+        if update == self.session_info_update:
+            return
+        self.session_info_update = update
+
+        # Get the quali results
+        self.grid_position = np.full(MAX_CARS, np.inf)
+        for session in common.ir["SessionInfo"]["Sessions"]:
+            if session["SessionName"] == "QUALIFY":
+                for car in session["ResultsPositions"] or []:
+                    self.grid_position[car["CarIdx"]] = car["Position"]
+
+        # Get the driver numbers
+        self.number = np.zeros(MAX_CARS, dtype=int)
+        for driver in common.ir["DriverInfo"]["Drivers"]:
+            self.number[driver["CarIdx"]] = int(driver["CarNumber"])
+
+        # Never focus on the pace car
+        self.grid_position[0] = np.inf
+
+    def front_car(self):
+        """Find the car highest on the grid which has taken its grid slot.
+
+        Returns:
+            int: The car number, or 0 if no car has gridded yet.
+        """
+        self._refresh()
+
+        # Skip cars in the pits and cars which haven't gridded yet
+        on_pit_road = np.asarray(common.ir["CarIdxOnPitRoad"], dtype=bool)
+        lap_percent = np.asarray(common.ir["CarIdxLapDistPct"], dtype=float)
+        gridded = ~on_pit_road[:MAX_CARS] & (lap_percent[:MAX_CARS] >= 0)
+
+        # Find the best qualifying position among the gridded cars
+        positions = np.where(gridded, self.grid_position, np.inf)
+        best = int(np.argmin(positions))
+        if positions[best] == np.inf:
+            return 0
+
+        return int(self.number[best])
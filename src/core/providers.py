@@ -0,0 +1,398 @@
+from abc import ABC, abstractmethod
+import json
+
+import openai
+
+from core import common
+
+
+class TextProvider(ABC):
+    """The interface for chat completion providers.
+
+    A text provider takes a list of chat messages and returns the response,
+    either all at once or as a stream of text as it is generated. Complete
+    responses are sent and parsed separately, so only the winner of a hedge
+    race is parsed.
+    """
+
+    def complete(self, model, messages, max_tokens, on_usage=None):
+        """Get a complete chat completion.
+
+        Args:
+            model (str): The model to use.
+            messages (list): The messages to send.
+            max_tokens (int): The maximum number of tokens to generate.
+            on_usage (function): Called with the number of prompt and
+                completion tokens used.
+
+        Returns:
+            str: The content of the response.
+        """
+        response = self.open_completion(model, messages, max_tokens)
+        return self.read_completion(response, on_usage)
+
+    @abstractmethod
+    def open_completion(self, model, messages, max_tokens):
+        """Send a chat completion request, without parsing the response.
+
+        Args:
+            model (str): The model to use.
+            messages (list): The messages to send.
+            max_tokens (int): The maximum number of tokens to generate.
+
+        Returns:
+            The response, which holds no connection once returned.
+        """
+
+    @abstractmethod
+    def read_completion(self, response, on_usage=None):
+        """Parse a response from open_completion.
+
+        Args:
+            response: The response from open_completion.
+            on_usage (function): Called with the number of prompt and
+                completion tokens used.
+
+        Returns:
+            str: The content of the response.
+        """
+
+    @abstractmethod
+    def stream(self, model, messages, max_tokens, on_usage=None):
+        """Stream a chat completion.
+
+        Args:
+            model (str): The model to use.
+            messages (list): The messages to send.
+            max_tokens (int): The maximum number of tokens to generate.
+            on_usage (function): Called with the number of prompt and
+                completion tokens used, once the stream is finished.
+
+        Yields:
+            str: Each new piece of text in the response.
+        """
+
+    @abstractmethod
+    def warm_up(self):
+        """Open a connection to the provider before it is needed."""
+
+
+class SpeechProvider(ABC):
+    """The interface for text-to-speech providers.
+
+    A speech provider turns text into MP3 audio, either all at once or as a
+    stream of chunks as it is generated, and lists the voices available.
+    Complete audio is opened and read separately, so a request which loses a
+    hedge race can be closed without downloading it.
+    """
+
+    @abstractmethod
+    def open_synthesis(self, text, voice_id, model):
+        """Send a text-to-speech request, without reading the audio.
+
+        Args:
+            text (str): The text to speak.
+            voice_id (str): The ID of the voice to use.
+            model (str): The model to use.
+
+        Returns:
+            The response, which must be read or closed.
+        """
+
+    @abstractmethod
+    def read_synthesis(self, response):
+        """Read the audio from open_synthesis, then close the response.
+
+        Args:
+            response: The response from open_synthesis.
+
+        Returns:
+            bytes: The MP3 audio.
+        """
+
+    @abstractmethod
+    def stream(self, text, voice_id, model):
+        """Stream the audio for some text.
+
+        Args:
+            text (str): The text to speak.
+            voice_id (str): The ID of the voice to use.
+            model (str): The model to use.
+
+        Yields:
+            bytes: Each chunk of MP3 audio.
+        """
+
+    def synthesize(self, text, voice_id, model):
+        """Get the complete audio for some text.
+
+        Args:
+            text (str): The text to speak.
+            voice_id (str): The ID of the voice to use.
+            model (str): The model to use.
+
+        Returns:
+            bytes: The MP3 audio.
+        """
+        response = self.open_synthesis(text, voice_id, model)
+        return self.read_synthesis(response)
+
+    @abstractmethod
+    def voices(self):
+        """Get the voices available.
+
+        Returns:
+            dict: The voice IDs, keyed by voice name.
+        """
+
+    @abstractmethod
+    def warm_up(self):
+        """Open a connection to the provider before it is needed."""
+
+
+class OpenAIText(TextProvider):
+    """A text provider for the OpenAI chat completions API."""
+
+    def __init__(self, api_key, base_url):
+        """Initialize the OpenAIText class.
+
+        Args:
+            api_key (str): The OpenAI API key.
+            base_url (str): The URL of the API.
+
+        Attributes:
+            client (openai.OpenAI): The OpenAI client.
+        """
+        # Create the OpenAI client on the shared transport
+        self.client = openai.OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=common.transport.client
+        )
+
+    def open_completion(self, model, messages, max_tokens):
+        """Send a chat completion request, without parsing the response.
+
+        The raw response API reads the whole body, so the connection goes
+        back to the pool as soon as this returns.
+
+        Args:
+            model (str): The model to use.
+            messages (list): The messages to send.
+            max_tokens (int): The maximum number of tokens to generate.
+
+        Returns:
+            openai.LegacyAPIResponse: The raw response.
+        """
+        create = self.client.chat.completions.with_raw_response.create
+        return create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens
+        )
+
+    def read_completion(self, response, on_usage=None):
+        """Parse a response from open_completion.
+
+        Args:
+            response (openai.LegacyAPIResponse): The response from
+                open_completion.
+            on_usage (function): Called with the number of prompt and
+                completion tokens used.
+
+        Returns:
+            str: The content of the response.
+        """
+        completion = response.parse()
+
+        # Report the tokens used
+        if on_usage is not None and completion.usage is not None:
+            on_usage(
+                completion.usage.prompt_tokens,
+                completion.usage.completion_tokens
+            )
+
+        return completion.choices[0].message.content
+
+    def stream(self, model, messages, max_tokens, on_usage=None):
+        """Stream a chat completion.
+
+        Streamed responses don't include their usage, so the prompt tokens are
+        estimated at four characters per token, and each chunk of text is
+        counted as one completion token.
+
+        Args:
+            model (str): The model to use.
+            messages (list): The messages to send.
+            max_tokens (int): The maximum number of tokens to generate.
+            on_usage (function): Called with the number of prompt and
+                completion tokens used, once the stream is finished.
+
+        Yields:
+            str: Each new piece of text in the response.
+        """
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True
+        )
+
+        # Close the response even if the stream is abandoned part way
+        chunks = 0
+        with stream:
+            for chunk in stream:
+                # Skip chunks without any new text
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+
+                chunks += 1
+                yield chunk.choices[0].delta.content
+
+        # Report the estimated tokens used
+        if on_usage is not None:
+            on_usage(len(json.dumps(messages)) // 4, chunks)
+
+    def warm_up(self):
+        """Open a connection to the provider before it is needed."""
+        self.client.models.list()
+
+
+class ElevenLabsSpeech(SpeechProvider):
+    """A speech provider for the ElevenLabs text-to-speech API."""
+
+    def __init__(self, api_key, base_url):
+        """Initialize the ElevenLabsSpeech class.
+
+        Args:
+            api_key (str): The ElevenLabs API key.
+            base_url (str): The URL of the API.
+
+        Attributes:
+            headers (dict): The headers sent with every request.
+            base_url (str): The URL of the API.
+        """
+        self.headers = {"xi-api-key": api_key}
+        self.base_url = base_url.rstrip("/")
+
+    def stream(self, text, voice_id, model):
+        """Stream the audio for some text.
+
+        Args:
+            text (str): The text to speak.
+            voice_id (str): The ID of the voice to use.
+            model (str): The model to use.
+
+        Yields:
+            bytes: Each chunk of MP3 audio.
+        """
+        with common.transport.client.stream(
+            "POST",
+            f"{self.base_url}/text-to-speech/{voice_id}/stream",
+            headers=self.headers,
+            json={"text": text, "model_id": model}
+        ) as response:
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                # Skip keep-alive chunks
+                if chunk:
+                    yield chunk
+
+    def open_synthesis(self, text, voice_id, model):
+        """Send a text-to-speech request, without reading the audio.
+
+        Args:
+            text (str): The text to speak.
+            voice_id (str): The ID of the voice to use.
+            model (str): The model to use.
+
+        Returns:
+            httpx.Response: The response, which must be read or closed.
+        """
+        client = common.transport.client
+        request = client.build_request(
+            "POST",
+            f"{self.base_url}/text-to-speech/{voice_id}",
+            headers=self.headers,
+            json={"text": text, "model_id": model}
+        )
+        response = client.send(request, stream=True)
+
+        # Don't leave failed responses open
+        try:
+            response.raise_for_status()
+        except Exception:
+            response.close()
+            raise
+
+        return response
+
+    def read_synthesis(self, response):
+        """Read the audio from open_synthesis, then close the response.
+
+        Args:
+            response (httpx.Response): The response from open_synthesis.
+
+        Returns:
+            bytes: The MP3 audio.
+        """
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+    def voices(self):
+        """Get the voices available.
+
+        Returns:
+            dict: The voice IDs, keyed by voice name.
+        """
+        response = common.transport.client.get(
+            f"{self.base_url}/voices",
+            headers=self.headers
+        )
+        response.raise_for_status()
+
+        voices = {}
+        for voice in response.json()["voices"]:
+            voices[voice["name"]] = voice["voice_id"]
+
+        return voices
+
+    def warm_up(self):
+        """Open a connection to the provider before it is needed."""
+        common.transport.warm_up(f"{self.base_url}/models", self.headers)
+
+
+def create_speech_provider():
+    """Create the speech provider chosen in the settings.
+
+    Returns:
+        SpeechProvider: The speech provider.
+    """
+    system = common.settings["system"]
+
+    if system["speech_provider"] == "elevenlabs":
+        return ElevenLabsSpeech(
+            common.settings["keys"]["elevenlabs_api_key"],
+            system["elevenlabs_base_url"]
+        )
+
+    raise ValueError(f"Unknown speech provider: {system['speech_provider']}")
+
+
+def create_text_provider():
+    """Create the text provider chosen in the settings.
+
+    Returns:
+        TextProvider: The text provider.
+    """
+    system = common.settings["system"]
+
+    if system["text_provider"] == "openai":
+        return OpenAIText(
+            common.settings["keys"]["openai_api_key"],
+            system["openai_base_url"]
+        )
+
+    raise ValueError(f"Unknown text provider: {system['text_provider']}")
@@ -0,0 +1,197 @@
+from collections import deque
+import threading
+
+from core import common
+
+
+# The steps the controller moves between, from full quality to the fastest
+# output. A model of None means the route's own model and "fallback" means the
+# fallback_model setting, the token scale multiplies the route's max tokens,
+# and a template mode of None means the template_mode setting.
+STEPS = (
+    {
+        "model": None,
+        "token_scale": 1.,
+        "color_chance": 1.,
+        "template_mode": None
+    },
+    {
+        "model": None,
+        "token_scale": 0.5,
+        "color_chance": 0.5,
+        "template_mode": None
+    },
+    {
+        "model": "fallback",
+        "token_scale": 0.33,
+        "color_chance": 0.25,
+        "template_mode": None
+    },
+    {
+        "model": "fallback",
+        "token_scale": 0.2,
+        "color_chance": 0.,
+        "template_mode": "always"
+    }
+)
+
+
+class QualityController:
+    """Trades commentary quality for speed when commentary falls behind.
+
+    After each line of play-by-play, the time from the oldest new event to the
+    start of its audio and the number of new events waiting are recorded. If
+    commentary is falling behind the race, the controller steps down to
+    shorter responses, a faster model, less color commentary and finally
+    template commentary. Once there is plenty of headroom again, it steps back
+    up, one step at a time.
+    """
+
+    def __init__(
+            self,
+            target_latency=5.,
+            max_backlog=3,
+            min_step=0,
+            max_step=len(STEPS) - 1,
+            enabled=True,
+            window=5,
+            min_samples=3,
+            fallback_model="gpt-3.5-turbo"
+        ):
+        """Initialize the QualityController class.
+
+        Args:
+            target_latency (float): The event to speech latency to stay under
+                in seconds.
+            max_backlog (int): The number of new events which can be waiting
+                before stepping down.
+            min_step (int): The highest quality step allowed.
+            max_step (int): The lowest quality step allowed.
+            enabled (bool): Whether or not to change steps at all.
+            window (int): The number of recent latencies to judge by.
+            min_samples (int): The number of latencies needed at a step
+                before stepping down from it.
+            fallback_model (str): The faster model used by the lowest steps.
+
+        Attributes:
+            target_latency (float): The latency to stay under in seconds.
+            max_backlog (int): The number of events allowed to be waiting.
+            min_step (int): The highest quality step allowed.
+            max_step (int): The lowest quality step allowed.
+            enabled (bool): Whether or not to change steps at all.
+            min_samples (int): The latencies needed before stepping down.
+            fallback_model (str): The faster model used by the lowest steps.
+            latencies (deque): The most recent latencies in seconds.
+            step (int): The current step.
+            step_downs (int): The number of times quality was lowered.
+            step_ups (int): The number of times quality was raised.
+        """
+        self.target_latency = target_latency
+        self.max_backlog = max_backlog
+        self.min_step = max(min_step, 0)
+        self.max_step = min(max_step, len(STEPS) - 1)
+        self.enabled = enabled
+        self.min_samples = min(min_samples, window)
+        self.fallback_model = fallback_model
+        self.latencies = deque(maxlen=window)
+        self.step = self.min_step
+        self.step_downs = 0
+        self.step_ups = 0
+        self.lock = threading.Lock()
+
+    def _change_step(self, change):
+        """Move to another step and start judging it afresh.
+
+        Args:
+            change (int): 1 to lower quality, -1 to raise it.
+        """
+        self.step += change
+        self.latencies.clear()
+
+        if change > 0:
+            self.step_downs += 1
+            common.app.add_message(
+                f"Commentary is falling behind, lowering quality to step "
+                f"{self.step}"
+            )
+        else:
+            self.step_ups += 1
+            common.app.add_message(
+                f"Commentary has caught up, raising quality to step "
+                f"{self.step}"
+            )
+
+    def current(self):
+        """Get the settings of the current step.
+
+        Returns:
+            dict: The model, max tokens multiplier, color chance multiplier
+                and template mode to use.
+        """
+        step = STEPS[self.step]
+        if step["model"] == "fallback":
+            step = dict(step, model=self.fallback_model)
+
+        return step
+
+    def record(self, latency, backlog):
+        """Record how far behind the race commentary is, changing step if
+        needed.
+
+        Args:
+            latency (float): The time from the oldest new event to the start
+                of its audio in seconds.
+            backlog (int): The number of new events which were waiting.
+        """
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.latencies.append(latency)
+            mean = sum(self.latencies) / len(self.latencies)
+
+            # Step down if commentary is behind, or events are piling up, once
+            # this step has been judged on enough lines
+            behind = mean > self.target_latency or backlog > self.max_backlog
+            judged = len(self.latencies) >= self.min_samples
+            if behind and judged and self.step < self.max_step:
+                self._change_step(1)
+
+            # Step up once every recent line had plenty of headroom
+            elif (
+                len(self.latencies) == self.latencies.maxlen
+                and max(self.latencies) < self.target_latency / 2
+                and backlog <= 1
+                and self.step > self.min_step
+            ):
+                self._change_step(-1)
+
+    def summary(self):
+        """Describe how the quality changed.
+
+        Returns:
+            str: One line describing the quality steps.
+        """
+        return (
+            f"Quality: step {self.step}, lowered {self.step_downs} times, "
+            f"raised {self.step_ups} times"
+        )
+
+
+def create_quality_controller():
+    """Create a QualityController from the settings.
+
+    Returns:
+        QualityController: The quality controller.
+    """
+    settings = common.settings["commentary"]
+    routing = common.settings["routing"]
+
+    return QualityController(
+        target_latency=float(settings["target_latency"]),
+        max_backlog=int(settings["max_backlog"]),
+        min_step=int(settings["quality_min_step"]),
+        max_step=int(settings["quality_max_step"]),
+        enabled=settings["adaptive_quality"] == "1",
+        fallback_model=routing["fallback_model"]
+    )
@@ -0,0 +1,585 @@
+from collections import deque
+import queue
+import threading
+import time
+
+import httpx
+import openai
+
+from core import common
+from utility import stats
+
+
+class LatencyTracker:
+    """Records the recent latencies of one provider.
+
+    Keeps a window of the most recent latencies to estimate percentiles from,
+    along with counters for hedged requests, timeouts, retries and errors.
+    """
+
+    def __init__(self, name, window=200):
+        """Initialize the LatencyTracker class.
+
+        Args:
+            name (str): The name of the provider.
+            window (int): The number of recent latencies to keep.
+
+        Attributes:
+            name (str): The name of the provider.
+            latencies (deque): The most recent latencies in seconds.
+            calls (int): The number of calls made.
+            hedges (int): The number of duplicate requests sent.
+            hedge_wins (int): The number of calls won by a duplicate request.
+            timeouts (int): The number of attempts which missed the deadline.
+            retries (int): The number of attempts which were retried.
+            errors (int): The number of calls which failed.
+        """
+        self.name = name
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def count(self, counter):
+        """Add one to a counter.
+
+        Hedged requests finish on their own threads, so counters are only
+        changed while holding the lock.
+
+        Args:
+            counter (str): The name of the counter, such as "hedges".
+        """
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def percentile(self, percent, min_samples=1):
+        """Get a percentile of the recent latencies.
+
+        Args:
+            percent (float): The percentile to get, from 0 to 100.
+            min_samples (int): The number of latencies needed.
+
+        Returns:
+            float: The percentile in seconds, or None if there are fewer
+                latencies than needed.
+        """
+        with self.lock:
+            if len(self.latencies) < max(min_samples, 1):
+                return None
+            return stats.percentile(list(self.latencies), percent)
+
+    def record(self, latency):
+        """Record the latency of a successful call.
+
+        Args:
+            latency (float): The latency in seconds.
+        """
+        with self.lock:
+            self.latencies.append(latency)
+
+    def reset(self):
+        """Forget the recent latencies and counters."""
+        with self.lock:
+            self.latencies.clear()
+            self.calls = 0
+            self.hedges = 0
+            self.hedge_wins = 0
+            self.timeouts = 0
+            self.retries = 0
+            self.errors = 0
+
+    def summary(self):
+        """Describe the recent latencies and counters.
+
+        Returns:
+            str: One line describing the provider's latency.
+        """
+        with self.lock:
+            summary = stats.summarise(list(self.latencies))
+
+            # Describe the percentiles if there are any latencies
+            line = f"{self.name}: {self.calls} calls"
+            if summary["count"] > 0:
+                line += (
+                    f", p50 {round(summary['p50'], 3)} s"
+                    f", p95 {round(summary['p95'], 3)} s"
+                    f", p99 {round(summary['p99'], 3)} s"
+                )
+
+            # Describe the counters
+            line += (
+                f", {self.hedges} hedged ({self.hedge_wins} won)"
+                f", {self.timeouts} timeouts"
+                f", {self.retries} retries"
+                f", {self.errors} errors"
+            )
+
+        return line
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is refused because a provider's circuit is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a provider which is failing or too slow.
+
+    Keeps a window of the outcomes of recent calls. If too many of them failed,
+    or the median latency is over the limit, the circuit opens and calls are
+    refused straight away instead of waiting for the deadline. While it is
+    open, the provider is probed in a separate thread, and the circuit closes
+    again once a probe succeeds.
+    """
+
+    def __init__(
+            self,
+            name,
+            error_rate=0.5,
+            latency=10.,
+            min_calls=4,
+            probe_interval=10.,
+            probe=None,
+            window=20
+        ):
+        """Initialize the CircuitBreaker class.
+
+        Args:
+            name (str): The name of the provider.
+            error_rate (float): The fraction of recent calls which must fail
+                for the circuit to open.
+            latency (float): The median latency in seconds over which the
+                circuit opens.
+            min_calls (int): The number of recent calls needed before the
+                circuit can open.
+            probe_interval (float): The time between probes in seconds.
+            probe (function): A cheap call to the provider, used to check if
+                it has recovered. If None, the circuit closes again after one
+                interval.
+            window (int): The number of recent outcomes to keep.
+
+        Attributes:
+            name (str): The name of the provider.
+            error_rate (float): The error rate at which the circuit opens.
+            latency (float): The median latency at which the circuit opens.
+            min_calls (int): The number of calls needed to open the circuit.
+            probe_interval (float): The time between probes in seconds.
+            probe (function): A cheap call to the provider.
+            outcomes (deque): Whether each recent call succeeded, and its
+                latency in seconds.
+            is_open (bool): Whether or not calls are being refused.
+            trips (int): The number of times the circuit has opened.
+            refused (int): The number of calls refused.
+        """
+        self.name = name
+        self.error_rate = error_rate
+        self.latency = latency
+        self.min_calls = min_calls
+        self.probe_interval = probe_interval
+        self.probe = probe
+        self.outcomes = deque(maxlen=window)
+        self.is_open = False
+        self.trips = 0
+        self.refused = 0
+        self.lock = threading.Lock()
+
+    def _open(self):
+        """Open the circuit and start probing the provider."""
+        self.is_open = True
+        self.trips += 1
+        self.outcomes.clear()
+
+        threading.Thread(target=self._probe_until_recovered, daemon=True).start()
+
+    def _probe_until_recovered(self):
+        """Probe the provider until it responds, then close the circuit."""
+        while True:
+            time.sleep(self.probe_interval)
+
+            # Without a probe, just try the provider again
+            if self.probe is None:
+                break
+
+            # Stop probing once the provider responds
+            try:
+                self.probe()
+                break
+            except Exception:
+                continue
+
+        with self.lock:
+            self.is_open = False
+
+    def allow(self):
+        """Check if a call to the provider may be made.
+
+        Returns:
+            bool: True if the circuit is closed, False otherwise.
+        """
+        with self.lock:
+            if self.is_open:
+                self.refused += 1
+            return not self.is_open
+
+    def record(self, success, latency=None):
+        """Record the outcome of a call, opening the circuit if needed.
+
+        Args:
+            success (bool): Whether or not the call succeeded.
+            latency (float): The latency of the call in seconds.
+        """
+        with self.lock:
+            # Calls which finish after the circuit opened don't count
+            if self.is_open:
+                return
+
+            self.outcomes.append((success, latency))
+
+            # Wait for enough calls to judge the provider by
+            if len(self.outcomes) < self.min_calls:
+                return
+
+            # Open the circuit if too many calls failed
+            failures = sum(1 for ok, _ in self.outcomes if not ok)
+            if failures / len(self.outcomes) >= self.error_rate:
+                self._open()
+                return
+
+            # Open the circuit if the provider is too slow
+            latencies = [t for ok, t in self.outcomes if ok and t is not None]
+            median = stats.percentile(latencies, 50)
+            if median is not None and median > self.latency:
+                self._open()
+
+    def reset(self):
+        """Forget the recent outcomes and counters.
+
+        An open circuit stays open until its probe succeeds.
+        """
+        with self.lock:
+            self.outcomes.clear()
+            self.trips = 0
+            self.refused = 0
+
+    def summary(self):
+        """Describe how often the circuit opened.
+
+        Returns:
+            str: One line describing the circuit.
+        """
+        state = "open" if self.is_open else "closed"
+        return (
+            f"{self.name} circuit: {state}, opened {self.trips} times, "
+            f"{self.refused} calls refused"
+        )
+
+
+class Hedger:
+    """Makes provider calls with a deadline, retries and hedged requests.
+
+    Each attempt must finish before the deadline. If an attempt is still
+    running once it has taken longer than the given percentile of recent
+    latencies, a duplicate request is sent and whichever finishes first wins.
+    The loser's result is discarded. Attempts which time out, fail to connect,
+    are rate limited or hit a server error are retried a limited number of
+    times. Other errors, such as a bad API key, are raised straight away.
+    """
+
+    def __init__(
+            self,
+            tracker,
+            deadline,
+            retries=1,
+            hedge_percentile=95,
+            min_samples=10,
+            breaker=None
+        ):
+        """Initialize the Hedger class.
+
+        Args:
+            tracker (LatencyTracker): The tracker for the provider.
+            deadline (float): The time each attempt is allowed in seconds.
+            retries (int): The number of times to retry a failed attempt.
+            hedge_percentile (float): The percentile of recent latencies after
+                which to send a duplicate request. 0 disables hedging.
+            min_samples (int): The number of latencies needed before hedging.
+            breaker (CircuitBreaker): The circuit breaker for the provider, if
+                any.
+
+        Attributes:
+            tracker (LatencyTracker): The tracker for the provider.
+            deadline (float): The time each attempt is allowed in seconds.
+            retries (int): The number of times to retry a failed attempt.
+            hedge_percentile (float): The percentile of recent latencies after
+                which to send a duplicate request.
+            min_samples (int): The number of latencies needed before hedging.
+            breaker (CircuitBreaker): The circuit breaker for the provider.
+        """
+        self.tracker = tracker
+        self.deadline = deadline
+        self.retries = retries
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.breaker = breaker
+
+    def _attempt(self, function, discard):
+        """Make one attempt, hedging it if it is slow.
+
+        Args:
+            function (function): The call to make. Takes no arguments.
+            discard (function): Called with the result of a losing request.
+
+        Returns:
+            The result of the first request to finish.
+        """
+        start = time.time()
+        results = queue.Queue()
+
+        # Keep track of whether a winner has been chosen
+        state = {"done": False}
+        lock = threading.Lock()
+
+        def run(hedge):
+            """Make the call and hand its result back."""
+            try:
+                result = function()
+            except Exception as error:
+                results.put((hedge, False, error))
+                return
+
+            # Hand the result back unless another request already won
+            with lock:
+                lost = state["done"]
+                if not lost:
+                    results.put((hedge, True, result))
+
+            # Otherwise, throw this result away
+            if lost and discard is not None:
+                discard(result)
+
+        def finish():
+            """Stop accepting results and throw away any already waiting."""
+            with lock:
+                state["done"] = True
+                waiting = []
+                while not results.empty():
+                    waiting.append(results.get())
+
+            for hedge, success, result in waiting:
+                if success and discard is not None:
+                    discard(result)
+
+        # Send the first request
+        threading.Thread(target=run, args=(False,), daemon=True).start()
+        running = 1
+
+        # Work out when to send a duplicate request
+        hedge_at = None
+        if self.hedge_percentile > 0:
+            delay = self.tracker.percentile(
+                self.hedge_percentile,
+                self.min_samples
+            )
+            if delay is not None:
+                hedge_at = start + delay
+
+        # Wait for a result, hedging or giving up as needed
+        while True:
+            # Wait until the next thing that could happen
+            wake_at = start + self.deadline
+            if hedge_at is not None:
+                wake_at = min(wake_at, hedge_at)
+            try:
+                hedge, success, result = results.get(
+                    timeout=max(wake_at - time.time(), 0)
+                )
+
+            # Nothing finished in time
+            except queue.Empty:
+                # If the deadline has passed, give up
+                if time.time() >= start + self.deadline:
+                    finish()
+                    self.tracker.count("timeouts")
+                    raise TimeoutError(
+                        f"{self.tracker.name} took longer than "
+                        f"{self.deadline} seconds"
+                    )
+
+                # Otherwise, it's time to send a duplicate request
+                threading.Thread(target=run, args=(True,), daemon=True).start()
+                running += 1
+                hedge_at = None
+                self.tracker.count("hedges")
+                continue
+
+            # If the request failed, wait for any other request still running
+            if not success:
+                running -= 1
+                if running > 0:
+                    continue
+                raise result
+
+            # Otherwise, this request wins
+            finish()
+            if hedge:
+                self.tracker.count("hedge_wins")
+            self.tracker.record(time.time() - start)
+
+            return result
+
+    def call(self, function, discard=None):
+        """Make a call with a deadline, retries and hedged requests.
+
+        Args:
+            function (function): The call to make. Takes no arguments.
+            discard (function): Called with the result of a losing request,
+                so it can be closed.
+
+        Returns:
+            The result of the first request to finish.
+
+        Raises:
+            CircuitOpenError: If the provider's circuit is open.
+        """
+        # Refuse the call straight away if the provider is down
+        if self.breaker is not None and not self.breaker.allow():
+            raise CircuitOpenError(f"{self.tracker.name} is unavailable")
+
+        self.tracker.count("calls")
+        start = time.time()
+
+        for attempt in range(self.retries + 1):
+            try:
+                result = self._attempt(function, discard)
+                break
+
+            # Retry if the error is temporary and there are retries left
+            except Exception as error:
+                if attempt == self.retries or not is_retryable(error):
+                    self.tracker.count("errors")
+                    if self.breaker is not None:
+                        self.breaker.record(False)
+                    raise
+                self.tracker.count("retries")
+
+        # Let the circuit breaker know the call succeeded, and how slowly
+        if self.breaker is not None:
+            self.breaker.record(True, time.time() - start)
+
+        return result
+
+
+def create_hedger(name, stage, probe=None, deadline=None, provider=None):
+    """Create a Hedger and its circuit breaker from the settings.
+
+    Args:
+        name (str): The name of the provider, or of the route to it.
+        stage (str): The pipeline stage, "text" or "speech", whose deadline
+            to use.
+        probe (function): A cheap call to the provider, used to check if it
+            has recovered after its circuit opens.
+        deadline (float): The time each attempt is allowed in seconds. If
+            None, the stage's deadline is used.
+        provider (str): The name of the provider, if several routes share its
+            circuit breaker. If None, the name is used.
+
+    Returns:
+        Hedger: The hedger.
+    """
+    system = common.settings["system"]
+
+    # Use the stage's deadline unless told otherwise
+    if deadline is None:
+        deadline = float(system[f"{stage}_deadline"])
+
+    # Routes to the same provider share its circuit breaker
+    if provider is None:
+        provider = name
+
+    # Create the tracker for the provider if there isn't one yet
+    if name not in trackers:
+        trackers[name] = LatencyTracker(name)
+
+    # Create the circuit breaker for the provider if there isn't one yet
+    if provider not in breakers:
+        breakers[provider] = CircuitBreaker(
+            provider,
+            error_rate=float(system["breaker_error_rate"]),
+            latency=float(system["breaker_latency"]),
+            min_calls=int(system["breaker_min_calls"]),
+            probe_interval=float(system["breaker_probe_interval"]),
+            probe=probe
+        )
+
+    return Hedger(
+        trackers[name],
+        deadline=deadline,
+        retries=int(system["max_retries"]),
+        hedge_percentile=float(system["hedge_percentile"]),
+        min_samples=int(system["hedge_min_samples"]),
+        breaker=breakers[provider]
+    )
+
+
+def is_retryable(error):
+    """Check if a failed call might succeed if it is tried again.
+
+    Args:
+        error (Exception): The error the call raised.
+
+    Returns:
+        bool: True for timeouts, connection errors, rate limits and server
+            errors, False otherwise.
+    """
+    # Timeouts and connection failures may not happen again
+    if isinstance(
+        error,
+        (TimeoutError, httpx.TransportError, openai.APIConnectionError)
+    ):
+        return True
+
+    # Get the status code of a failed response
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+    elif isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+    else:
+        return False
+
+    # Only rate limits and server errors are worth retrying
+    return status == 429 or status >= 500
+
+
+def reset():
+    """Forget the latencies and outcomes recorded for every provider.
+
+    Called at the start of each run, so its statistics only cover that run.
+    """
+    for tracker in trackers.values():
+        tracker.reset()
+    for breaker in breakers.values():
+        breaker.reset()
+
+
+def start_stream(generator):
+    """Wait for the first item of a stream.
+
+    Used to hedge the time to the first token or chunk of a streamed response.
+
+    Args:
+        generator (generator): The stream.
+
+    Returns:
+        tuple: The first item (or None if the stream is empty), and the stream.
+    """
+    return next(generator, None), generator
+
+
+# The latency trackers of every provider, keyed by name
+trackers = {}
+
+# The circuit breakers of every provider, keyed by name
+breakers = {}
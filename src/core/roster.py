@@ -0,0 +1,166 @@
+from core import common
+
+
+class Roster:
+    """Keeps the drivers list in step with the drivers in the session.
+
+    iRacing only rewrites DriverInfo when the session info changes, which it
+    signals by bumping SessionInfoUpdate. The roster compares DriverInfo to
+    the drivers it already tracks only then, adding drivers who have joined
+    and retiring drivers who have left, rather than rebuilding every driver.
+    The details which never change, such as the display name, are worked out
+    once when a driver joins.
+    """
+
+    def __init__(self):
+        """Initialize the Roster class.
+
+        Attributes:
+            drivers (list): The tracked drivers, in race order.
+            by_idx (dict): The tracked drivers, keyed by CarIdx.
+            session_info_update (int): The SessionInfoUpdate last synced to.
+            joined (int): The number of drivers added after the first sync.
+            retired (int): The number of drivers retired.
+        """
+        self.drivers = []
+        self.by_idx = {}
+        self.session_info_update = None
+        self.joined = 0
+        self.retired = 0
+
+    def _create_driver(self, info, grid_position):
+        """Create the dictionary tracking one driver.
+
+        Args:
+            info (dict): The driver's entry in DriverInfo.
+            grid_position (int): The driver's grid position.
+
+        Returns:
+            dict: The driver's data.
+        """
+        # Work out the names once, since they never change
+        display_name = common.remove_numbers(info["UserName"])
+        words = display_name.split()
+        surname = words[-1] if words != [] else display_name
+
+        return {
+            "car_class": info["CarClassID"],
+            "car_name": info["CarScreenNameShort"],
+            "class_gap": None,
+            "class_name": info["CarClassShortName"] or "",
+            "class_position": grid_position,
+            "current_lap_time": 0,
+            "display_name": display_name,
+            "fastest_lap": None,
+            "gap_to_leader": None,
+            "grid_position": grid_position,
+            "idx": info["CarIdx"],
+            "in_pits": False,
+            "irating": info["IRating"],
+            "lap_distance": 0,
+            "lap_percent": 0,
+            "laps_completed": 0,
+            "laps_started": 0,
+            "lap_times": [],
+            "last_lap_time": None,
+            "license": info["LicString"],
+            "name": info["UserName"],
+            "number": info["CarNumberRaw"],
+            "on_track": False,
+            "position": grid_position,
+            "surname": surname,
+            "total_dist": 0
+        }
+
+    def _grid_positions(self):
+        """Get each car's qualifying position.
+
+        Returns:
+            dict: The qualifying positions, keyed by CarIdx.
+        """
+        positions = {}
+        for session in common.ir["SessionInfo"]["Sessions"]:
+            if session["SessionName"] == "QUALIFY":
+                for car in session["ResultsPositions"] or []:
+                    positions[car["CarIdx"]] = car["Position"]
+
+        return positions
+
+    def _session_drivers(self):
+        """Get the drivers currently in the session from DriverInfo.
+
+        Returns:
+            dict: The DriverInfo entries of connected drivers, keyed by
+                CarIdx.
+        """
+        drivers = {}
+        for info in common.ir["DriverInfo"]["Drivers"]:
+            # Skip the pace car and empty or disconnected slots
+            if info["CarIdx"] == 0 or not info["UserName"]:
+                continue
+            drivers[info["CarIdx"]] = info
+
+        return drivers
+
+    def sync(self):
+        """Bring the drivers list up to date with the session.
+
+        Does nothing unless the session info has changed since the last sync.
+
+        Returns:
+            bool: Whether or not any drivers joined or left.
+        """
+        # Only look at DriverInfo when iRacing has rewritten it
+        update = common.ir["SessionInfoUpdate"]
+        if update == self.session_info_update:
+            return False
+        first_sync = self.session_info_update is None
+        self.session_info_update = update
+
+        session = self._session_drivers()
+        changed = False
+
+        # Retire drivers who have left, or whose car now has a new driver
+        for idx, driver in list(self.by_idx.items()):
+            info = session.get(idx)
+            if info is None or info["UserName"] != driver["name"]:
+                del self.by_idx[idx]
+                self.retired += 1
+                changed = True
+
+        # Add drivers who have joined, starting them at the back of the grid
+        # if they didn't qualify
+        grid = None
+        for idx, info in session.items():
+            if idx in self.by_idx:
+                continue
+            if grid is None:
+                grid = self._grid_positions()
+            grid_position = grid.get(idx, len(self.by_idx) + 1)
+            self.by_idx[idx] = self._create_driver(info, grid_position)
+            if not first_sync:
+                self.joined += 1
+            changed = True
+
+        # Rebuild the drivers list from the roster, keeping the current order
+        if changed:
+            kept = [
+                d for d in self.drivers if self.by_idx.get(d["idx"]) is d
+            ]
+            kept_ids = set(id(d) for d in kept)
+            added = [d for d in self.by_idx.values() if id(d) not in kept_ids]
+            added.sort(key=lambda x: x["grid_position"])
+            self.drivers = kept + added
+
+        return changed
+
+    def summary(self):
+        """Describe how the roster changed.
+
+        Returns:
+            str: One line describing the roster.
+        """
+        return (
+            f"Roster: {len(self.by_idx)} drivers, {self.joined} joined, "
+            f"{self.retired} retired"
+        )
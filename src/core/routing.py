@@ -0,0 +1,96 @@
+import threading
+
+from core import common
+from core import resilience
+
+
+# The tasks which have their own route to the text provider
+TASKS = ("pbp", "color", "focus")
+
+
+class Route:
+    """The model, length and deadline used for one commentary task.
+
+    Each route has its own hedger, so its latency is tracked separately, and
+    keeps count of the tokens it has used. Routes to the same provider share
+    its circuit breaker.
+    """
+
+    def __init__(self, task, model, max_tokens, hedger):
+        """Initialize the Route class.
+
+        Args:
+            task (str): The name of the task.
+            model (str): The model to use.
+            max_tokens (int): The maximum number of tokens to generate.
+            hedger (Hedger): Applies the route's deadline to the provider.
+
+        Attributes:
+            task (str): The name of the task.
+            model (str): The model to use.
+            max_tokens (int): The maximum number of tokens to generate.
+            hedger (Hedger): Applies the route's deadline to the provider.
+            prompt_tokens (int): The number of prompt tokens used.
+            completion_tokens (int): The number of completion tokens used.
+        """
+        self.task = task
+        self.model = model
+        self.max_tokens = max_tokens
+        self.hedger = hedger
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.lock = threading.Lock()
+
+    def record_usage(self, prompt_tokens, completion_tokens):
+        """Record the tokens used by a call.
+
+        Args:
+            prompt_tokens (int): The number of prompt tokens used.
+            completion_tokens (int): The number of completion tokens used.
+        """
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def summary(self):
+        """Describe the tokens used by the route.
+
+        Returns:
+            str: One line describing the route's token usage.
+        """
+        return (
+            f"{self.task} ({self.model}): {self.hedger.tracker.calls} calls, "
+            f"{self.prompt_tokens} prompt tokens, "
+            f"{self.completion_tokens} completion tokens"
+        )
+
+
+def create_routes(probe=None):
+    """Create a Route for each task from the routing settings.
+
+    Args:
+        probe (function): A cheap call to the text provider, used to check if
+            it has recovered after its circuit opens.
+
+    Returns:
+        dict: The routes, keyed by task.
+    """
+    routing = common.settings["routing"]
+
+    routes = {}
+    for task in TASKS:
+        hedger = resilience.create_hedger(
+            f"text:{task}",
+            "text",
+            probe=probe,
+            deadline=float(routing[f"{task}_timeout"]),
+            provider="text"
+        )
+        routes[task] = Route(
+            task,
+            model=routing[f"{task}_model"],
+            max_tokens=int(routing[f"{task}_max_tokens"]),
+            hedger=hedger
+        )
+
+    return routes
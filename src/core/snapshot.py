@@ -0,0 +1,142 @@
+from types import MappingProxyType
+
+import numpy as np
+
+from core import common
+
+
+# The number of car slots in the iRacing SDK's CarIdx arrays
+MAX_CARS = 64
+
+# The iRacing SDK's track surface values
+OFF_TRACK = 0
+ON_TRACK = 3
+
+
+class Snapshot:
+    """The state of every tracked car at one moment, as arrays.
+
+    Built once per events tick, so every detector works from the same view of
+    the race. Each array has one entry per tracked car, in the order of the
+    drivers list (by position once the race has started).
+
+    A snapshot is never changed once built. The events thread publishes each
+    one as common.snapshot, so other threads can read the whole race from one
+    reference while the next update is worked out.
+    """
+
+    def __init__(self, drivers, session_time, on_pit_road, track_surface):
+        """Initialize the Snapshot class.
+
+        Args:
+            drivers (list): The drivers list.
+            session_time (float): The session time in seconds.
+            on_pit_road (list): Whether each car is on pit road, by CarIdx.
+            track_surface (list): The track surface of each car, by CarIdx.
+
+        Attributes:
+            drivers (tuple): A read-only copy of each driver's data.
+            session_time (float): The session time in seconds.
+            race_started (bool): Whether or not the race has started.
+            all_cars_started (bool): Whether or not all cars have started.
+            idx (ndarray): The CarIdx of each car.
+            number (ndarray): The car number of each car.
+            names (list): The name of each driver, without digits.
+            car_class (ndarray): The car class ID of each car.
+            class_names (list): The short name of each car's class.
+            multiclass (bool): Whether or not there is more than one class.
+            position (ndarray): The position of each car.
+            class_position (ndarray): The position of each car in its class.
+            class_gap (ndarray): The gap to the class leader of each car.
+            laps_completed (ndarray): The laps completed by each car.
+            lap_percent (ndarray): How far through the lap each car is.
+            total_dist (ndarray): The total distance covered by each car.
+            gap_to_leader (ndarray): The gap to the leader of each car.
+            last_lap_time (ndarray): The last lap time of each car, or NaN.
+            fastest_lap (ndarray): The fastest lap time of each car, or NaN.
+            in_pits (ndarray): Whether or not each car is in the pits.
+            on_pit_road (ndarray): Whether or not each car is on pit road.
+            track_surface (ndarray): The track surface under each car.
+        """
+        # Copy the drivers, so later updates can't change this snapshot
+        self.drivers = tuple(
+            MappingProxyType({**d, "lap_times": tuple(d["lap_times"])})
+            for d in drivers
+        )
+
+        self.session_time = session_time
+        self.race_started = common.race_started
+        self.all_cars_started = common.all_cars_started
+
+        # Identify each car
+        self.idx = np.array([d["idx"] for d in drivers], dtype=int)
+        self.number = np.array([d["number"] for d in drivers], dtype=int)
+        self.names = [d["display_name"] for d in drivers]
+
+        # Get each car's class
+        self.car_class = np.array([d["car_class"] for d in drivers], dtype=int)
+        self.class_names = [d["class_name"] for d in drivers]
+        self.multiclass = len(np.unique(self.car_class)) > 1
+
+        # Get each car's progress
+        self.position = self._array(drivers, "position")
+        self.class_position = self._array(drivers, "class_position")
+        self.class_gap = self._array(drivers, "class_gap")
+        self.laps_completed = self._array(drivers, "laps_completed")
+        self.lap_percent = self._array(drivers, "lap_percent")
+        self.total_dist = self._array(drivers, "total_dist")
+        self.gap_to_leader = self._array(drivers, "gap_to_leader")
+        self.last_lap_time = self._array(drivers, "last_lap_time")
+        self.fastest_lap = self._array(drivers, "fastest_lap")
+
+        # Get where each car is
+        self.in_pits = np.array([d["in_pits"] for d in drivers], dtype=bool)
+        self.on_pit_road = np.asarray(on_pit_road, dtype=bool)[self.idx]
+        self.track_surface = np.asarray(track_surface, dtype=int)[self.idx]
+
+    def _array(self, drivers, key):
+        """Collect one value of every driver into an array.
+
+        Args:
+            drivers (list): The drivers list.
+            key (str): The key of the value.
+
+        Returns:
+            ndarray: The values, with None as NaN.
+        """
+        values = [d[key] for d in drivers]
+        return np.array(
+            [np.nan if value is None else value for value in values],
+            dtype=float
+        )
+
+    def lookup(self, other, field):
+        """Get the values of another snapshot in this snapshot's car order.
+
+        Args:
+            other (Snapshot): The other snapshot, usually the previous one.
+            field (str): The name of the array to get.
+
+        Returns:
+            ndarray: The values, with NaN for cars not in the other snapshot.
+        """
+        values = np.full(MAX_CARS, np.nan)
+        values[other.idx] = getattr(other, field)
+        return values[self.idx]
+
+
+def take_snapshot(drivers):
+    """Take a snapshot of the drivers list and the iRacing SDK.
+
+    Args:
+        drivers (list): The drivers list.
+
+    Returns:
+        Snapshot: The snapshot.
+    """
+    return Snapshot(
+        drivers,
+        common.ir["SessionTime"],
+        common.ir["CarIdxOnPitRoad"],
+        common.ir["CarIdxTrackSurface"]
+    )
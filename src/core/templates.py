@@ -0,0 +1,311 @@
+import random
+
+from core import common
+from core import detectors
+
+
+# Phrase variations for each event type, with slots for the event's data
+TEMPLATES = {
+    "overtake": (
+        "{driver} gets past {overtaken} for P{position}.",
+        "{driver} makes the move on {overtaken}, and that's P{position}.",
+        "Through goes {driver}! {overtaken} drops behind, {driver} up to "
+            "P{position}.",
+        "{driver} takes P{position} from {overtaken}.",
+        "And {driver} is by {overtaken}, that's P{position} now."
+    ),
+    "stopped": (
+        "{driver} has stopped on track.",
+        "Trouble for {driver}, who is stopped on the circuit.",
+        "{driver} is stationary out there.",
+        "We've got a stopped car, it's {driver}."
+    ),
+    "incident": (
+        "There's been an incident involving {drivers}.",
+        "Trouble out there, {drivers} are caught up in it.",
+        "An incident on track, and {drivers} are all involved."
+    ),
+    "battle": (
+        "{drivers} are fighting it out for P{position}.",
+        "What a battle for P{position} between {drivers}.",
+        "{drivers} are nose to tail for P{position}."
+    ),
+    "battle intensifying": (
+        "The gap is closing between {drivers} for P{position}.",
+        "It's getting tighter between {drivers} for P{position}.",
+        "{drivers} are closer than ever in the fight for P{position}."
+    ),
+    "pit": (
+        "{driver} has {action} the pits.",
+        "And {driver} has {action} the pit lane.",
+        "A quick look at {driver}, who has {action} the pits."
+    ),
+    "off track": (
+        "{driver} has gone off track.",
+        "A moment for {driver}, off the circuit there.",
+        "{driver} runs wide and off the track."
+    ),
+    "fastest lap": (
+        "{driver} goes fastest of all with a {time}.",
+        "A new fastest lap for {driver}, a {time}.",
+        "{driver} sets the fastest lap of the race, a {time}."
+    ),
+    "personal best": (
+        "A personal best for {driver}, a {time}.",
+        "{driver} finds some pace, a {time} for a personal best.",
+        "{driver} improves with a {time}."
+    )
+}
+
+
+class TemplateEngine:
+    """Generates commentary for routine events from phrase templates.
+
+    The descriptions built when events are detected are already structured,
+    so routine events can be described by filling driver names and positions
+    into a phrase, without a network call. The same phrase is never used twice
+    in a row for an event type. Events without a template, like incidents
+    merged from several events, are described by their own description.
+    """
+
+    def __init__(self):
+        """Initialize the TemplateEngine class.
+
+        Attributes:
+            last_used (dict): The last phrase used, keyed by event type.
+            reported (set): The IDs of the events already reported, by a
+                template or by the LLM, which are still in the event history.
+        """
+        self.last_used = {}
+        self.reported = set()
+
+    def _fill(self, event):
+        """Fill a phrase for an event.
+
+        Args:
+            event (dict): The event to describe.
+
+        Returns:
+            str: The filled phrase, or the event's description if there is
+                no template for it.
+        """
+        # Fall back to the description for events without a template
+        if not self.can_describe(event):
+            return event["description"].rstrip(".") + "."
+
+        # Choose a phrase, avoiding the one used last time
+        type = self._template_type(event)
+        phrases = [
+            phrase for phrase in TEMPLATES[type]
+            if phrase != self.last_used.get(type)
+        ]
+        phrase = random.choice(phrases)
+        self.last_used[type] = phrase
+
+        # Refer to drivers by only their surname
+        slots = {}
+        for key, value in event["data"].items():
+            if isinstance(value, str):
+                value = self._surname(value)
+            elif isinstance(value, list):
+                value = detectors.join_names(
+                    [self._surname(name) for name in value]
+                )
+            slots[key] = value
+
+        return phrase.format(**slots)
+
+    def _ids(self, events):
+        """Get the IDs of some events and of the events merged into them.
+
+        Args:
+            events (list): The events.
+
+        Returns:
+            set: The IDs.
+        """
+        ids = set()
+        for event in events:
+            ids.add(event["id"])
+            ids.update(self._ids(event.get("events", [])))
+        return ids
+
+    def _surname(self, name):
+        """Get the surname from a driver's name.
+
+        Args:
+            name (str): The driver's name.
+
+        Returns:
+            str: The last word of the name.
+        """
+        return name.split()[-1] if name.split() else name
+
+    def _template_type(self, event):
+        """Get the templates to use for an event.
+
+        Args:
+            event (dict): The event.
+
+        Returns:
+            str: The key of the event's templates.
+        """
+        # Fastest laps which aren't the best of the race are personal bests
+        if event["type"] == "fastest lap" and not event["data"]["overall"]:
+            return "personal best"
+
+        # Battles reported again have their own phrases
+        if event["type"] == "battle":
+            if event["data"].get("stage") == "intensifying":
+                return "battle intensifying"
+
+        return event["type"]
+
+    def can_describe(self, event):
+        """Check if an event can be described by a template.
+
+        Args:
+            event (dict): The event to check.
+
+        Returns:
+            bool: True if there is a template for the event, False otherwise.
+        """
+        return event["type"] in TEMPLATES and event.get("data") is not None
+
+    def generate(self, events, limit=2):
+        """Generate commentary for the most recent events not yet described.
+
+        Args:
+            events (list): The events, most recent first.
+            limit (int): The maximum number of events to describe.
+
+        Returns:
+            str: The commentary, or an empty string if there is nothing new.
+        """
+        # Forget events which have left the event history
+        self.reported &= self._ids(events)
+
+        lines = []
+        for event in events:
+            # Stop once enough events have been described
+            if len(lines) == limit:
+                break
+
+            # Skip events that have already been reported
+            if event["id"] in self.reported:
+                continue
+
+            lines.append(self._fill(event))
+            self.mark_reported([event])
+
+        return " ".join(lines)
+
+    def mark_reported(self, events):
+        """Remember that some events have been reported, so they are never
+        described again.
+
+        Args:
+            events (list): The events reported.
+        """
+        self.reported |= self._ids(events)
+
+
+class CommentaryPolicy:
+    """Decides whether commentary is written from templates or by the LLM.
+
+    Routine events, like overtakes outside the top positions and stopped
+    cars, are described from templates. Anything else goes to the LLM, unless
+    templates are forced, the LLM's recent latency is over budget or its
+    circuit is open, in which case every event is described without it.
+    """
+
+    def __init__(self, engine, tracker, breaker=None, quality=None):
+        """Initialize the CommentaryPolicy class.
+
+        Args:
+            engine (TemplateEngine): The template engine.
+            tracker (LatencyTracker): The latency tracker of the LLM.
+            breaker (CircuitBreaker): The circuit breaker of the LLM.
+            quality (QualityController): May force template commentary when
+                commentary is behind the race.
+
+        Attributes:
+            engine (TemplateEngine): The template engine.
+            tracker (LatencyTracker): The latency tracker of the LLM.
+            breaker (CircuitBreaker): The circuit breaker of the LLM.
+            quality (QualityController): The quality controller.
+        """
+        self.engine = engine
+        self.tracker = tracker
+        self.breaker = breaker
+        self.quality = quality
+
+    def _is_routine(self, event):
+        """Check if an event is routine enough to always use a template.
+
+        Args:
+            event (dict): The event to check.
+
+        Returns:
+            bool: True if the event is routine, False otherwise.
+        """
+        top = int(common.settings["commentary"]["template_top_positions"])
+
+        # Overtakes for the top positions deserve the LLM
+        if event["type"] == "overtake":
+            return event["data"]["position"] > top
+
+        # Stopped cars only need to be reported
+        if event["type"] == "stopped":
+            return True
+
+        return False
+
+    def _over_budget(self):
+        """Check if the LLM's recent latency is over budget.
+
+        Returns:
+            bool: True if the LLM is too slow, False otherwise.
+        """
+        budget = float(common.settings["commentary"]["llm_latency_budget"])
+        latency = self.tracker.percentile(50)
+
+        return latency is not None and latency > budget
+
+    def choose(self, events, role):
+        """Choose how to write the commentary for some events.
+
+        Args:
+            events (list): The events to describe.
+            role (str): The role of the commentator.
+
+        Returns:
+            str: "template" or "llm".
+        """
+        mode = common.settings["commentary"]["template_mode"]
+
+        # The quality controller may override the mode
+        if self.quality is not None:
+            if self.quality.current()["template_mode"] is not None:
+                mode = self.quality.current()["template_mode"]
+
+        # Color commentary needs the LLM
+        if role != "play-by-play" or mode == "never":
+            return "llm"
+
+        # Keep away from the LLM if forced to, or if it is slow or down
+        # (events without a template are described by their description)
+        if mode == "always":
+            return "template"
+        if self._over_budget():
+            return "template"
+        if self.breaker is not None and self.breaker.is_open:
+            return "template"
+
+        # Otherwise, only use templates for a few routine events
+        if not all(self.engine.can_describe(event) for event in events):
+            return "llm"
+        if len(events) <= 2 and all(self._is_routine(e) for e in events):
+            return "template"
+
+        return "llm"
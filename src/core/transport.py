@@ -0,0 +1,224 @@
+import importlib.util
+import threading
+import time
+
+import httpx
+
+from core import common
+
+
+class TracedClient(httpx.Client):
+    """An HTTP client which reports requests that fail without a response.
+
+    Response hooks only run when a response arrives, so timeouts and
+    connection errors are caught as they leave send instead.
+    """
+
+    def __init__(self, on_error, **kwargs):
+        """Initialize the TracedClient class.
+
+        Args:
+            on_error (callable): Called with the request when it fails
+                without a response.
+            **kwargs: The arguments for httpx.Client.
+
+        Attributes:
+            on_error (callable): Called with each request which fails.
+        """
+        super().__init__(**kwargs)
+        self.on_error = on_error
+
+    def send(self, request, **kwargs):
+        """Send a request, reporting it if it fails without a response.
+
+        Args:
+            request (httpx.Request): The request to send.
+            **kwargs: The arguments for httpx.Client.send.
+
+        Returns:
+            httpx.Response: The response.
+        """
+        try:
+            return super().send(request, **kwargs)
+        except httpx.TransportError:
+            self.on_error(request)
+            raise
+
+
+class Transport:
+    """A pooled HTTP client shared by every provider.
+
+    Every request to OpenAI and ElevenLabs goes through the same client, so
+    connections are kept alive and reused instead of paying for a new TCP and
+    TLS handshake on every line of commentary. HTTP/2 is used if the h2
+    package is installed. Requests and new connections are counted per host.
+    """
+
+    def __init__(
+            self,
+            max_connections=10,
+            max_keepalive=10,
+            keepalive_expiry=60.,
+            timeout=30.,
+            connect_timeout=5.,
+            http2=True
+        ):
+        """Initialize the Transport class.
+
+        Args:
+            max_connections (int): The maximum number of open connections.
+            max_keepalive (int): The maximum number of idle connections kept
+                open for reuse.
+            keepalive_expiry (float): How long idle connections are kept open
+                in seconds.
+            timeout (float): The read, write and pool timeout in seconds.
+            connect_timeout (float): The connection timeout in seconds.
+            http2 (bool): Whether or not to use HTTP/2 when available.
+
+        Attributes:
+            client (httpx.Client): The pooled HTTP client.
+            stats (dict): The connection statistics, keyed by host.
+        """
+        # Only use HTTP/2 if its optional dependency is installed
+        if http2 and importlib.util.find_spec("h2") is None:
+            http2 = False
+
+        # Create the statistics
+        self.stats = {}
+        self.lock = threading.Lock()
+
+        # Create the client
+        self.client = TracedClient(
+            self._on_error,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            http2=http2,
+            event_hooks={
+                "request": [self._on_request],
+                "response": [self._on_response]
+            }
+        )
+
+    def _host_stats(self, host):
+        """Get the statistics for a host, creating them if needed.
+
+        Args:
+            host (str): The host name.
+
+        Returns:
+            dict: The statistics for the host.
+        """
+        if host not in self.stats:
+            self.stats[host] = {
+                "requests": 0,
+                "errors": 0,
+                "connections": 0,
+                "handshakes": 0,
+                "total_time": 0.
+            }
+        return self.stats[host]
+
+    def _on_error(self, request):
+        """Record a request which failed without a response.
+
+        Args:
+            request (httpx.Request): The request which failed.
+        """
+        with self.lock:
+            self._host_stats(request.url.host)["errors"] += 1
+
+    def _on_request(self, request):
+        """Record the start of a request.
+
+        Args:
+            request (httpx.Request): The request being sent.
+        """
+        host = request.url.host
+
+        def trace(event_name, info):
+            """Count new connections and TLS handshakes."""
+            with self.lock:
+                if event_name == "connection.connect_tcp.complete":
+                    self._host_stats(host)["connections"] += 1
+                elif event_name == "connection.start_tls.complete":
+                    self._host_stats(host)["handshakes"] += 1
+
+        # Trace the connection events of this request
+        request.extensions["trace"] = trace
+
+        # Keep the start time on the request itself, so it goes with it
+        request.extensions["started"] = time.time()
+
+        with self.lock:
+            self._host_stats(host)["requests"] += 1
+
+    def _on_response(self, response):
+        """Record the time taken to receive a response's headers.
+
+        Args:
+            response (httpx.Response): The response received.
+        """
+        host = response.request.url.host
+
+        with self.lock:
+            start = response.request.extensions.get("started")
+            if start is not None:
+                self._host_stats(host)["total_time"] += time.time() - start
+            if response.status_code >= 400:
+                self._host_stats(host)["errors"] += 1
+
+    def close(self):
+        """Close every open connection."""
+        self.client.close()
+
+    def summary(self):
+        """Describe the statistics of each host.
+
+        Returns:
+            list: One line of statistics for each host.
+        """
+        lines = []
+        with self.lock:
+            for host, stats in self.stats.items():
+                average = stats["total_time"] / max(stats["requests"], 1)
+                lines.append(
+                    f"{host}: {stats['requests']} requests, "
+                    f"{stats['connections']} connections, "
+                    f"{stats['handshakes']} handshakes, "
+                    f"{stats['errors']} errors, "
+                    f"{round(average, 3)} s average"
+                )
+        return lines
+
+    def warm_up(self, url, headers=None):
+        """Open a connection to a host before it is needed.
+
+        Args:
+            url (str): A URL on the host which is cheap to request.
+            headers (dict): Headers to send with the request.
+        """
+        self.client.get(url, headers=headers)
+
+
+def create_transport():
+    """Create a Transport from the settings.
+
+    Returns:
+        Transport: The transport.
+    """
+    # Get the transport settings
+    system = common.settings["system"]
+
+    # Create the transport
+    return Transport(
+        max_connections=int(system["http_max_connections"]),
+        max_keepalive=int(system["http_max_keepalive"]),
+        keepalive_expiry=float(system["http_keepalive_expiry"]),
+        timeout=float(system["http_timeout"]),
+        connect_timeout=float(system["http_connect_timeout"]),
+        http2=system["http2"] == "1"
+    )
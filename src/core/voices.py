@@ -0,0 +1,155 @@
+import json
+import os
+import threading
+import time
+
+from core import common
+from core import providers
+
+
+class VoiceRegistry:
+    """Resolves ElevenLabs voice names to voice IDs.
+
+    The list of voices is fetched once and saved to a file, so it does not need
+    to be fetched again every time a line of commentary is spoken or the app is
+    started. Once the saved list is older than its time to live, it is
+    refreshed in the background while the saved list continues to be used.
+    """
+
+    def __init__(self, file, ttl, provider):
+        """Initialize the VoiceRegistry class.
+
+        Args:
+            file (str): The path of the file to save the voices to.
+            ttl (float): How long the saved voices are valid for in seconds.
+            provider (SpeechProvider): The provider to fetch the voices from.
+
+        Attributes:
+            file (str): The path of the file the voices are saved to.
+            ttl (float): How long the saved voices are valid for in seconds.
+            provider (SpeechProvider): The provider the voices are fetched
+                from.
+            voices (dict): The voice IDs, keyed by voice name.
+            updated (float): The time the voices were last fetched.
+        """
+        self.file = file
+        self.ttl = ttl
+        self.provider = provider
+        self.voices = {}
+        self.updated = 0
+
+        # Prevent more than one refresh from running at the same time
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+        # Names which were still unknown after fetching the voices again
+        self.missing = set()
+
+        # Load the saved voices if there are any
+        if os.path.exists(file):
+            with open(file, "r") as f:
+                saved = json.load(f)
+            self.voices = saved["voices"]
+            self.updated = saved["updated"]
+
+    def _is_stale(self):
+        """Check if the saved voices have expired.
+
+        Returns:
+            bool: True if the voices need to be fetched again, False otherwise.
+        """
+        return time.time() - self.updated > self.ttl
+
+    def names(self):
+        """Get the names of all of the voices.
+
+        Fetches the voices first if none have been saved yet, otherwise starts
+        a background refresh if they have expired.
+
+        Returns:
+            list: The voice names.
+        """
+        if self.voices == {}:
+            self.refresh()
+        elif self._is_stale():
+            self.refresh_in_background()
+
+        return list(self.voices.keys())
+
+    def refresh(self):
+        """Fetch the voices from the provider and save them to the file."""
+        with self.lock:
+            # Fetch the voices
+            self.voices = self.provider.voices()
+            self.updated = time.time()
+
+            # Save the voices
+            folder = os.path.dirname(self.file)
+            if folder != "":
+                os.makedirs(folder, exist_ok=True)
+            with open(self.file, "w") as f:
+                json.dump(
+                    {"updated": self.updated, "voices": self.voices},
+                    f,
+                    indent=4
+                )
+
+    def refresh_in_background(self):
+        """Fetch the voices in a separate thread if not already doing so."""
+        # Don't start a second refresh
+        if self.refreshing:
+            return
+        self.refreshing = True
+
+        def run():
+            """Refresh the voices, ignoring network errors."""
+            try:
+                self.refresh()
+            except Exception:
+                pass
+            finally:
+                self.refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def resolve(self, name):
+        """Get the voice ID for a voice name.
+
+        If the name is unknown, the voices are fetched again (once per name)
+        in case it was added since they were saved.
+
+        Args:
+            name (str): The voice name.
+
+        Returns:
+            str: The voice ID, or the name itself if no voice has that name.
+        """
+        # Refresh in the background if the voices have expired
+        if self._is_stale():
+            self.refresh_in_background()
+
+        # Fetch the voices again if the name is unknown
+        if name not in self.voices and name not in self.missing:
+            self.refresh()
+            if name not in self.voices:
+                self.missing.add(name)
+
+        return self.voices.get(name, name)
+
+
+def create_voice_registry():
+    """Create a VoiceRegistry from the settings.
+
+    Returns:
+        VoiceRegistry: The voice registry.
+    """
+    # Get the registry settings
+    folder = common.settings["system"]["cache_dir"]
+    ttl = float(common.settings["system"]["voice_cache_ttl"])
+
+    # Create the registry
+    return VoiceRegistry(
+        os.path.join(folder, "voices.json"),
+        ttl,
+        providers.create_speech_provider()
+    )
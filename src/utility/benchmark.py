@@ -0,0 +1,216 @@
+"""
+This module benchmarks the commentary pipeline end to end against the local
+stand-in servers. Run it from the src directory with:
+
+    python -m utility.benchmark --help
+"""
+
+import argparse
+import configparser
+import os
+import tempfile
+import time
+
+from core import commentary
+from core import common
+from core import resilience
+from core import transport
+from core import voices
+from utility import defaults
+from utility import standins
+from utility import stats
+
+
+class Console:
+    """Stands in for the app's message box, recording when lines start."""
+
+    def __init__(self):
+        """Initialize the Console class.
+
+        Attributes:
+            first_message (float): The time the first message was added since
+                the last reset, or None if there hasn't been one.
+        """
+        self.first_message = None
+
+    def add_message(self, message):
+        """Record the time of the first message.
+
+        Args:
+            message (str): The message which would have been shown.
+        """
+        if self.first_message is None:
+            self.first_message = time.time()
+
+
+class Disconnected:
+    """Stands in for an iRacing SDK object which is not connected."""
+
+    is_initialized = False
+    is_connected = False
+
+
+def _configure(folder, text_url, speech_url, stream):
+    """Load the default settings, pointed at the stand-in servers.
+
+    Args:
+        folder (str): The folder to keep the settings, caches and audio in.
+        text_url (str): The URL of the text stand-in.
+        speech_url (str): The URL of the speech stand-in.
+        stream (bool): Whether or not to stream text and audio.
+    """
+    # Create the default settings
+    file = os.path.join(folder, "settings.ini")
+    defaults.create_settings_file(file)
+    common.settings = configparser.ConfigParser()
+    common.settings.read(file)
+
+    # Keep everything inside the benchmark folder
+    common.settings["general"]["iracing_path"] = folder
+    common.settings["system"]["cache_dir"] = os.path.join(folder, "cache")
+    os.makedirs(os.path.join(folder, "videos"))
+
+    # Point the providers at the stand-ins
+    common.settings["system"]["openai_base_url"] = text_url
+    common.settings["system"]["elevenlabs_base_url"] = speech_url
+
+    # Choose whether or not to stream
+    common.settings["system"]["stream_text"] = "1" if stream else "0"
+    common.settings["system"]["stream_audio"] = "1" if stream else "0"
+
+def _print_summary(name, values):
+    """Print a summary of some latencies.
+
+    Args:
+        name (str): What was measured.
+        values (list): The latencies in seconds.
+    """
+    summary = stats.summarise(values)
+    if summary["count"] == 0:
+        print(f"{name}: no samples")
+        return
+
+    print(
+        f"{name}: "
+        f"mean {summary['mean'] * 1000:.1f} ms, "
+        f"p50 {summary['p50'] * 1000:.1f} ms, "
+        f"p95 {summary['p95'] * 1000:.1f} ms, "
+        f"p99 {summary['p99'] * 1000:.1f} ms, "
+        f"max {summary['max'] * 1000:.1f} ms"
+    )
+
+def run(
+        iterations=20,
+        text_latency=standins.Latency(),
+        token_delay=0.,
+        speech_latency=standins.Latency(),
+        audio_rate=0.,
+        stream=True
+    ):
+    """Drive Commentary.generate against the stand-in servers.
+
+    Args:
+        iterations (int): The number of lines of commentary to generate.
+        text_latency (Latency): The text stand-in's time to first token.
+        token_delay (float): The text stand-in's delay between tokens.
+        speech_latency (Latency): The speech stand-in's time to first byte.
+        audio_rate (float): The seconds of audio per character of text.
+        stream (bool): Whether or not to stream text and audio.
+
+    Returns:
+        dict: The latency of each line, the time to its first audio, and the
+            total time taken.
+    """
+    # Start the stand-ins
+    text_server = standins.OpenAIStandIn(text_latency, token_delay)
+    speech_server = standins.ElevenLabsStandIn(speech_latency, audio_rate)
+    text_server.start()
+    speech_server.start()
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as folder:
+        # Set up the pipeline as the app would
+        _configure(folder, text_server.url, speech_server.url, stream)
+        common.app = Console()
+        common.ir = Disconnected()
+        common.snapshot = None
+        common.transport = transport.create_transport()
+        common.voices = voices.create_voice_registry()
+        pipeline = commentary.Commentary()
+
+        # Generate each line of commentary, timing it
+        latencies = []
+        first_audio = []
+        start = time.time()
+        for i in range(iterations):
+            event = {
+                "type": "overtake",
+                "description": f"Driver {i} overtook Driver {i + 1} for P1",
+                "lap_percent": 0.5,
+                "timestamp": time.time()
+            }
+
+            common.app.first_message = None
+            line_start = time.time()
+            pipeline.generate([event], "play-by-play", rec_start_time=start)
+            latencies.append(time.time() - line_start)
+            first_audio.append(common.app.first_message - line_start)
+        total = time.time() - start
+
+        # Close the connections before the folder is removed
+        common.transport.close()
+
+    # Stop the stand-ins
+    text_server.stop()
+    speech_server.stop()
+
+    return {
+        "latencies": latencies,
+        "first_audio": first_audio,
+        "total": total
+    }
+
+def main():
+    """Run the benchmark from the command line and print the results."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the commentary pipeline against local "
+            "stand-ins for the OpenAI and ElevenLabs APIs."
+    )
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--text-latency", type=float, default=0.5,
+        help="median time to first token in seconds")
+    parser.add_argument("--text-spread", type=float, default=0.3,
+        help="spread of the time to first token")
+    parser.add_argument("--token-delay", type=float, default=0.02,
+        help="delay between streamed tokens in seconds")
+    parser.add_argument("--speech-latency", type=float, default=0.3,
+        help="median time to first audio byte in seconds")
+    parser.add_argument("--speech-spread", type=float, default=0.3,
+        help="spread of the time to first audio byte")
+    parser.add_argument("--audio-rate", type=float, default=0.,
+        help="seconds of audio per character of text")
+    parser.add_argument("--no-stream", action="store_true",
+        help="wait for complete responses instead of streaming")
+    args = parser.parse_args()
+
+    results = run(
+        iterations=args.iterations,
+        text_latency=standins.Latency(args.text_latency, args.text_spread),
+        token_delay=args.token_delay,
+        speech_latency=standins.Latency(
+            args.speech_latency,
+            args.speech_spread
+        ),
+        audio_rate=args.audio_rate,
+        stream=not args.no_stream
+    )
+
+    # Print the results
+    _print_summary("Line latency", results["latencies"])
+    _print_summary("Time to first audio", results["first_audio"])
+    throughput = len(results["latencies"]) / results["total"]
+    print(f"Throughput: {throughput:.2f} lines/s")
+    for tracker in resilience.trackers.values():
+        print(tracker.summary())
+
+if __name__ == "__main__":
+    main()
@@ -26,44 +26,129 @@ def create_context_file(file_name):
 def create_settings_file(file_name):
     """
     Create a settings INI file with specified sections and keys if it doesn't
-    exist.
+    exist. If it does exist, any keys missing from it are added with their
+    default values, leaving existing values untouched.
 
     Args:
         file_name (str): The name of the INI file to create.
     """
-    if not os.path.exists(file_name):
-        # Initialize ConfigParser
-        config = ConfigParser()
+    # Initialize ConfigParser
+    config = ConfigParser()
 
-        # Set up keys section
-        config.add_section("keys")
-        config.set("keys", "openai_api_key", "")
-        config.set("keys", "elevenlabs_api_key", "")
+    # Set up keys section
+    config.add_section("keys")
+    config.set("keys", "openai_api_key", "")
+    config.set("keys", "elevenlabs_api_key", "")
 
-        # Set up iRacing section
-        config.add_section("general")
-        config.set(
-            "general", "iracing_path", "path/to/your/iRacing/folder"
-        )
-        config.set("general", "video_format", "mp4")
-        config.set("general", "video_framerate", "60")
-        config.set("general", "video_resolution", "1920x1080")
+    # Set up iRacing section
+    config.add_section("general")
+    config.set(
+        "general", "iracing_path", "path/to/your/iRacing/folder"
+    )
+    config.set("general", "video_format", "mp4")
+    config.set("general", "video_framerate", "60")
+    config.set("general", "video_resolution", "1920x1080")
+    config.set("general", "capture_range", "session")
+    config.set("general", "range_start", "0")
+    config.set("general", "range_end", "0")
 
-        # Set up commentary section
-        config.add_section("commentary")
-        config.set("commentary", "pbp_voice", "Harry")
-        config.set("commentary", "color_voice", "Elli")
-        config.set("commentary", "color_chance", "0.5")
-        config.set("commentary", "realistic_camera", "1")
-        config.set("commentary", "memory_limit", "10")
+    # Set up commentary section
+    config.add_section("commentary")
+    config.set("commentary", "pbp_voice", "Harry")
+    config.set("commentary", "color_voice", "Elli")
+    config.set("commentary", "color_chance", "0.5")
+    config.set("commentary", "realistic_camera", "1")
+    config.set("commentary", "min_shot_length", "4")
+    config.set("commentary", "max_shot_length", "15")
+    config.set("commentary", "memory_limit", "10")
+    config.set("commentary", "replay_deterministic", "0")
+    config.set("commentary", "template_mode", "auto")
+    config.set("commentary", "template_top_positions", "3")
+    config.set("commentary", "llm_latency_budget", "4")
+    config.set("commentary", "adaptive_quality", "1")
+    config.set("commentary", "target_latency", "5")
+    config.set("commentary", "max_backlog", "3")
+    config.set("commentary", "quality_min_step", "0")
+    config.set("commentary", "quality_max_step", "3")
 
-        # Set up system section
-        config.add_section("system")
-        config.set("system", "context_file", "context.json")
-        config.set("system", "director_update_freq", "1")
-        config.set("system", "events_update_freq", "1")
-        config.set("system", "event_hist_len", "25")
+    # Set up routing section
+    config.add_section("routing")
+    config.set("routing", "pbp_model", "gpt-4-turbo-preview")
+    config.set("routing", "pbp_max_tokens", "300")
+    config.set("routing", "pbp_timeout", "20")
+    config.set("routing", "color_model", "gpt-4-turbo-preview")
+    config.set("routing", "color_max_tokens", "300")
+    config.set("routing", "color_timeout", "20")
+    config.set("routing", "focus_model", "gpt-3.5-turbo")
+    config.set("routing", "focus_max_tokens", "20")
+    config.set("routing", "focus_timeout", "5")
+    config.set("routing", "fallback_model", "gpt-3.5-turbo")
 
-        # Write to file
-        with open(file_name, "w") as config_file:
-            config.write(config_file)
+    # Set up system section
+    config.add_section("system")
+    config.set("system", "context_file", "context.json")
+    config.set("system", "director_update_freq", "1")
+    config.set("system", "events_update_freq", "1")
+    config.set("system", "camera_update_freq", "4")
+    config.set("system", "replay_timeout", "5")
+    config.set("system", "capture_timeout", "10")
+    config.set("system", "event_hist_len", "25")
+    config.set("system", "coalesce_lap_window", "0.02")
+    config.set("system", "coalesce_time_window", "5")
+    config.set("system", "stopped_speed", "1")
+    config.set("system", "slow_speed", "10")
+    config.set("system", "incident_lap_window", "0.01")
+    config.set("system", "battle_gap", "1")
+    config.set("system", "battle_min_duration", "10")
+    config.set("system", "battle_report_interval", "30")
+    config.set("system", "personal_best_positions", "5")
+    config.set("system", "cache_dir", "cache")
+    config.set("system", "track_dir", "tracks")
+    config.set("system", "response_cache_size", "50")
+    config.set("system", "audio_cache_size", "200")
+    config.set("system", "stream_audio", "1")
+    config.set("system", "stream_text", "1")
+    config.set("system", "voice_cache_ttl", "86400")
+    config.set("system", "http_max_connections", "10")
+    config.set("system", "http_max_keepalive", "10")
+    config.set("system", "http_keepalive_expiry", "60")
+    config.set("system", "http_timeout", "30")
+    config.set("system", "http_connect_timeout", "5")
+    config.set("system", "http2", "1")
+    config.set("system", "text_deadline", "20")
+    config.set("system", "speech_deadline", "15")
+    config.set("system", "max_retries", "1")
+    config.set("system", "hedge_percentile", "95")
+    config.set("system", "hedge_min_samples", "10")
+    config.set("system", "breaker_error_rate", "0.5")
+    config.set("system", "breaker_latency", "10")
+    config.set("system", "breaker_min_calls", "4")
+    config.set("system", "breaker_probe_interval", "10")
+    config.set("system", "text_provider", "openai")
+    config.set("system", "openai_base_url", "https://api.openai.com/v1")
+    config.set("system", "speech_provider", "elevenlabs")
+    config.set(
+        "system", "elevenlabs_base_url", "https://api.elevenlabs.io/v1"
+    )
+
+    # If the file exists, its values replace the defaults
+    if os.path.exists(file_name):
+        # Remember the original contents to check if anything was added
+        with open(file_name, "r") as config_file:
+            original = config_file.read()
+        config.read_string(original)
+
+        # Only rewrite the file if keys were missing from it
+        existing = ConfigParser()
+        existing.read_string(original)
+        missing = False
+        for section in config.sections():
+            for key in config[section]:
+                if not existing.has_option(section, key):
+                    missing = True
+        if not missing:
+            return
+
+    # Write to file
+    with open(file_name, "w") as config_file:
+        config.write(config_file)
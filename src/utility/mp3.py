@@ -0,0 +1,148 @@
+"""
+This module contains helpers for working with MP3 audio without decoding it.
+"""
+
+# Bitrates in kbps, indexed by [MPEG version 1][layer][bitrate index]
+BITRATES = {
+    True: {
+        1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416,
+            448),
+        2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+        3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+    },
+    False: {
+        1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+        2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+        3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+    }
+}
+
+# Sample rates in Hz, indexed by [version bits][sample rate index]
+SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000)
+}
+
+
+class FrameCounter:
+    """Counts the duration of MP3 audio as it arrives.
+
+    Audio is fed in chunks of any size. Each complete frame header is parsed
+    to find the frame's length and number of samples, so the duration of the
+    audio is known as soon as the last chunk arrives, without re-reading the
+    file.
+    """
+
+    def __init__(self):
+        """Initialize the FrameCounter class.
+
+        Attributes:
+            duration (float): The duration of the complete frames in seconds.
+            frames (int): The number of complete frames.
+        """
+        self.duration = 0.
+        self.frames = 0
+
+        # Bytes which have not been parsed yet
+        self.buffer = b""
+
+        # Bytes of an ID3 tag which still need to be skipped
+        self.skip = 0
+
+        # Whether or not the start of the stream has been checked for a tag
+        self.started = False
+
+    def _parse_header(self, header):
+        """Parse an MP3 frame header.
+
+        Args:
+            header (bytes): The first four bytes of the frame.
+
+        Returns:
+            tuple: The frame length in bytes and the duration of the frame in
+                seconds, or None if the bytes are not a valid header.
+        """
+        # Check for the frame sync bits
+        if header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+            return None
+
+        # Get the version and layer
+        version = (header[1] >> 3) & 0x03
+        layer = 4 - ((header[1] >> 1) & 0x03)
+        if version == 1 or layer == 4:
+            return None
+        mpeg1 = version == 3
+
+        # Get the bitrate and sample rate
+        bitrate_index = header[2] >> 4
+        sample_rate_index = (header[2] >> 2) & 0x03
+        if bitrate_index in (0, 15) or sample_rate_index == 3:
+            return None
+        bitrate = BITRATES[mpeg1][layer][bitrate_index] * 1000
+        sample_rate = SAMPLE_RATES[version][sample_rate_index]
+        padding = (header[2] >> 1) & 0x01
+
+        # Calculate the frame length and the number of samples in the frame
+        if layer == 1:
+            samples = 384
+            length = (12 * bitrate // sample_rate + padding) * 4
+        elif layer == 2 or mpeg1:
+            samples = 1152
+            length = 144 * bitrate // sample_rate + padding
+        else:
+            samples = 576
+            length = 72 * bitrate // sample_rate + padding
+
+        return length, samples / sample_rate
+
+    def feed(self, chunk):
+        """Add a chunk of MP3 audio.
+
+        Args:
+            chunk (bytes): The next chunk of audio.
+        """
+        self.buffer += chunk
+
+        # Skip an ID3 tag at the start of the stream
+        if not self.started:
+            if len(self.buffer) < 10:
+                return
+            if self.buffer[:3] == b"ID3":
+                size = 0
+                for byte in self.buffer[6:10]:
+                    size = (size << 7) | (byte & 0x7F)
+                self.skip = size + 10
+            self.started = True
+
+        # Skip what remains of the tag
+        if self.skip > 0:
+            skipped = min(self.skip, len(self.buffer))
+            self.buffer = self.buffer[skipped:]
+            self.skip -= skipped
+
+        # Parse as many complete frames as possible
+        position = 0
+        while len(self.buffer) - position >= 4:
+            frame = self._parse_header(self.buffer[position:position + 4])
+
+            # If this isn't a frame header, search for the next one
+            if frame is None:
+                position += 1
+                continue
+
+            # Wait for more audio if the frame is incomplete
+            length, duration = frame
+            if len(self.buffer) - position < length:
+                break
+
+            # Count the frame unless it's a Xing/Info header with no audio
+            body = self.buffer[position:position + min(length, 64)]
+            if b"Xing" not in body and b"Info" not in body:
+                self.duration += duration
+                self.frames += 1
+
+            position += length
+
+        # Keep only the bytes which haven't been parsed
+        self.buffer = self.buffer[position:]
@@ -0,0 +1,338 @@
+"""
+This module contains local stand-in servers which mimic the OpenAI chat
+completions API and the ElevenLabs text-to-speech API. They respond with canned
+text and silent audio after a configurable delay, so the commentary pipeline
+can be measured without API keys or network access.
+"""
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import math
+import random
+import threading
+import time
+
+
+# A silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz, 1152 samples)
+SILENT_FRAME = bytes([0xFF, 0xFB, 0x90, 0x64]) + bytes(413)
+FRAME_DURATION = 1152 / 44100
+
+# The canned sentences the text stand-in builds its responses from
+SENTENCES = (
+    "They go side by side into the braking zone.",
+    "What a move that is!",
+    "The gap is coming down lap after lap.",
+    "He has had a look down the inside but can't make it stick.",
+    "That is a superb piece of racing.",
+    "The leader is managing the gap beautifully."
+)
+
+
+class Latency:
+    """A log-normal latency distribution.
+
+    Most samples are close to the median, with a long tail of slow responses
+    whose length is controlled by the spread, like a real API.
+    """
+
+    def __init__(self, median=0., spread=0.):
+        """Initialize the Latency class.
+
+        Args:
+            median (float): The median latency in seconds.
+            spread (float): The standard deviation of the log of the latency.
+                0 gives the median every time.
+        """
+        self.median = median
+        self.spread = spread
+
+    def sample(self):
+        """Get a random latency.
+
+        Returns:
+            float: The latency in seconds.
+        """
+        # A median of 0 means no delay at all
+        if self.median <= 0:
+            return 0.
+
+        return random.lognormvariate(math.log(self.median), self.spread)
+
+    def wait(self):
+        """Sleep for a random latency."""
+        time.sleep(self.sample())
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """A request handler with helpers for JSON and streamed responses."""
+
+    # Keep connections alive, like the real APIs
+    protocol_version = "HTTP/1.1"
+
+    def _end_chunked(self):
+        """Finish a chunked response."""
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _read_json(self):
+        """Read the JSON body of the request.
+
+        Returns:
+            dict: The body of the request.
+        """
+        length = int(self.headers.get("Content-Length", 0))
+        if length == 0:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _send_body(self, body, content_type):
+        """Send a complete response.
+
+        Args:
+            body (bytes): The body of the response.
+            content_type (str): The content type of the body.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data):
+        """Send a JSON response.
+
+        Args:
+            data (dict): The data to send.
+        """
+        self._send_body(json.dumps(data).encode(), "application/json")
+
+    def _start_chunked(self, content_type):
+        """Start a chunked response.
+
+        Args:
+            content_type (str): The content type of the body.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data):
+        """Send one chunk of a chunked response.
+
+        Args:
+            data (bytes): The chunk to send.
+        """
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        """Don't log every request."""
+        pass
+
+
+class OpenAIHandler(StandInHandler):
+    """Handles requests to the OpenAI stand-in."""
+
+    def do_GET(self):
+        """Respond to a request for the list of models."""
+        self._send_json({
+            "object": "list",
+            "data": [{
+                "id": "stand-in",
+                "object": "model",
+                "created": 0,
+                "owned_by": "stand-in"
+            }]
+        })
+
+    def do_POST(self):
+        """Respond to a chat completion request."""
+        standin = self.server.standin
+        body = self._read_json()
+
+        # Build the response and wait for the time to first token
+        text = standin.reply()
+        tokens = text.split(" ")
+        standin.latency.wait()
+
+        # Send the whole response at once if streaming wasn't requested
+        if not body.get("stream"):
+            prompt_tokens = len(json.dumps(body["messages"])) // 4
+            self._send_json({
+                "id": "chatcmpl-stand-in",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stand-in"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens)
+                }
+            })
+            return
+
+        # Otherwise, send one token at a time as server-sent events
+        self._start_chunked("text/event-stream")
+        for i, token in enumerate(tokens):
+            # Wait for the model to "write" the next token
+            if i > 0:
+                time.sleep(standin.token_delay)
+                token = " " + token
+
+            chunk = {
+                "id": "chatcmpl-stand-in",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stand-in"),
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": token},
+                    "finish_reason": None
+                }]
+            }
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._end_chunked()
+
+
+class ElevenLabsHandler(StandInHandler):
+    """Handles requests to the ElevenLabs stand-in."""
+
+    def do_GET(self):
+        """Respond to a request for the list of voices or models."""
+        if self.path.endswith("/voices"):
+            self._send_json({"voices": [
+                {"voice_id": "standinvoiceharry001", "name": "Harry"},
+                {"voice_id": "standinvoiceelli0001", "name": "Elli"}
+            ]})
+        else:
+            self._send_json([])
+
+    def do_POST(self):
+        """Respond to a text-to-speech request."""
+        standin = self.server.standin
+        body = self._read_json()
+
+        # Make silent audio of about the length the text would take to say
+        frames = round(len(body["text"]) * standin.audio_rate / FRAME_DURATION)
+        audio = SILENT_FRAME * max(frames, 1)
+
+        # Wait for the time to first byte
+        standin.latency.wait()
+
+        # Send the whole file at once if streaming wasn't requested
+        if not self.path.endswith("/stream"):
+            self._send_body(audio, "audio/mpeg")
+            return
+
+        # Otherwise, send the audio in chunks
+        self._start_chunked("audio/mpeg")
+        for i in range(0, len(audio), standin.chunk_size):
+            if i > 0:
+                time.sleep(standin.chunk_delay)
+            self._write_chunk(audio[i:i + standin.chunk_size])
+        self._end_chunked()
+
+
+class StandInServer:
+    """A stand-in server running in a background thread."""
+
+    def __init__(self, handler, latency=None):
+        """Initialize the StandInServer class.
+
+        Args:
+            handler (class): The request handler class.
+            latency (Latency): The delay before each response starts.
+
+        Attributes:
+            latency (Latency): The delay before each response starts.
+        """
+        self.latency = latency if latency is not None else Latency()
+
+        # Create the server on any free port
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.server.standin = self
+
+    @property
+    def url(self):
+        """str: The base URL of the stand-in API."""
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def start(self):
+        """Start serving requests in a background thread."""
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        """Stop serving requests."""
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class OpenAIStandIn(StandInServer):
+    """A stand-in for the OpenAI chat completions API."""
+
+    def __init__(self, latency=None, token_delay=0.):
+        """Initialize the OpenAIStandIn class.
+
+        Args:
+            latency (Latency): The delay before the first token.
+            token_delay (float): The delay between streamed tokens in seconds.
+
+        Attributes:
+            token_delay (float): The delay between streamed tokens in seconds.
+            requests (int): The number of responses built.
+        """
+        super().__init__(OpenAIHandler, latency)
+        self.token_delay = token_delay
+
+        # Count the responses so each one can be numbered
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def reply(self):
+        """Build a response made of two canned sentences.
+
+        Each response is numbered so that repeated requests are not served
+        from the response cache.
+
+        Returns:
+            str: The response.
+        """
+        with self.lock:
+            self.requests += 1
+            number = self.requests
+
+        first, second = random.sample(SENTENCES, 2)
+        return f"Line {number}. {first} {second}"
+
+
+class ElevenLabsStandIn(StandInServer):
+    """A stand-in for the ElevenLabs text-to-speech API."""
+
+    def __init__(
+            self,
+            latency=None,
+            audio_rate=0.,
+            chunk_size=4096,
+            chunk_delay=0.
+        ):
+        """Initialize the ElevenLabsStandIn class.
+
+        Args:
+            latency (Latency): The delay before the first chunk of audio.
+            audio_rate (float): The seconds of audio per character of text.
+            chunk_size (int): The size of each streamed chunk in bytes.
+            chunk_delay (float): The delay between streamed chunks in seconds.
+        """
+        super().__init__(ElevenLabsHandler, latency)
+        self.audio_rate = audio_rate
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
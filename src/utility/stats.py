@@ -0,0 +1,51 @@
+"""
+This module contains functions for summarising latency measurements.
+"""
+
+def percentile(values, percent):
+    """Get a percentile of a list of values.
+
+    Uses linear interpolation between the closest ranks.
+
+    Args:
+        values (list): The values.
+        percent (float): The percentile to get, from 0 to 100.
+
+    Returns:
+        float: The percentile, or None if there are no values.
+    """
+    # If there are no values, there is no percentile
+    if len(values) == 0:
+        return None
+
+    # Find the position of the percentile in the sorted values
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+
+    # Interpolate between the values either side of the position
+    fraction = position - lower
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * fraction
+
+def summarise(values):
+    """Summarise a list of latencies.
+
+    Args:
+        values (list): The latencies in seconds.
+
+    Returns:
+        dict: The count, mean, median, 95th and 99th percentiles and maximum.
+    """
+    # If there are no values, there is nothing to summarise
+    if len(values) == 0:
+        return {"count": 0}
+
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values)
+    }
@@ -0,0 +1,6 @@
+import os
+import sys
+
+
+# The application is run from the src directory, so import it from there
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
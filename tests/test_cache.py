@@ -0,0 +1,99 @@
+import os
+
+from core import cache
+
+
+def messages(gap, seconds_ago, previous="Great move!"):
+    """Build a prompt like the play-by-play prompt."""
+    return [
+        {"role": "system", "name": "gaps", "content": f"- A: +{gap}"},
+        {"role": "assistant", "name": "Play-By-Play", "content": previous},
+        {
+            "role": "user",
+            "content": f"- overtake - A overtook B - {seconds_ago} seconds ago"
+        }
+    ]
+
+
+def test_deterministic_key_ignores_timing(tmp_path):
+    responses = cache.ResponseCache(
+        str(tmp_path / "responses.db"),
+        1024,
+        deterministic=True
+    )
+
+    first = responses.key("model", messages(1.412, 0.532))
+    second = responses.key("model", messages(1.438, 1.904, "Lovely pass."))
+
+    assert first == second
+
+
+def test_deterministic_key_keeps_race_situation(tmp_path):
+    responses = cache.ResponseCache(
+        str(tmp_path / "responses.db"),
+        1024,
+        deterministic=True
+    )
+
+    close = responses.key("model", messages(0.4, 0.5))
+    far = responses.key("model", messages(12.4, 0.5))
+
+    assert close != far
+
+
+def test_key_is_exact_by_default(tmp_path):
+    responses = cache.ResponseCache(str(tmp_path / "responses.db"), 1024)
+
+    first = responses.key("model", messages(1.412, 0.532))
+    second = responses.key("model", messages(1.412, 0.533))
+
+    assert first != second
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    responses = cache.ResponseCache(str(tmp_path / "responses.db"), 10)
+
+    responses.put("model", messages(1, 1), "aaaaa")
+    responses.put("model", messages(2, 1), "bbbbb")
+    responses.get("model", messages(1, 1))
+    responses.put("model", messages(3, 1), "ccccc")
+
+    assert responses.get("model", messages(1, 1)) == "aaaaa"
+    assert responses.get("model", messages(2, 1)) is None
+    assert responses.get("model", messages(3, 1)) == "ccccc"
+
+
+def write_audio(folder, name, size):
+    """Write a fake audio file of a given size."""
+    path = folder / name
+    path.write_bytes(b"\xff" * size)
+    return str(path)
+
+
+def test_audio_cache_copies_cached_audio(tmp_path):
+    audio = cache.AudioCache(str(tmp_path / "audio"), 1000)
+    source = write_audio(tmp_path, "line.mp3", 100)
+    audio.put("Nice move", "Harry", "model", source, 2.5, 0.8)
+
+    target = str(tmp_path / "copy.mp3")
+    assert audio.get(" Nice   move ", "Harry", "model", target) == (2.5, 0.8)
+    assert open(target, "rb").read() == b"\xff" * 100
+    assert audio.get("Nice move", "Elli", "model", target) is None
+
+
+def test_audio_cache_evicts_least_recently_used_files(tmp_path):
+    audio = cache.AudioCache(str(tmp_path / "audio"), 250)
+    for text in ("one", "two"):
+        source = write_audio(tmp_path, f"{text}.mp3", 100)
+        audio.put(text, "Harry", "model", source, 1., 1.)
+    audio.get("one", "Harry", "model", str(tmp_path / "copy.mp3"))
+
+    source = write_audio(tmp_path, "three.mp3", 100)
+    audio.put("three", "Harry", "model", source, 1., 1.)
+
+    target = str(tmp_path / "copy.mp3")
+    assert audio.get("two", "Harry", "model", target) is None
+    assert not os.path.exists(audio._path(audio.key("two", "Harry", "model")))
+    assert audio.get("one", "Harry", "model", target) is not None
+    assert audio.get("three", "Harry", "model", target) is not None
+    assert (audio.hits, audio.misses) == (3, 1)
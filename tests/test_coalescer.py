@@ -0,0 +1,91 @@
+from core import coalescer
+
+
+def event(id, type, data, lap_percent, timestamp, focus=None, corner=None):
+    return {
+        "id": id,
+        "type": type,
+        "description": f"event {id}",
+        "lap_percent": lap_percent,
+        "corner": corner,
+        "focus": focus,
+        "data": data,
+        "timestamp": timestamp
+    }
+
+
+def test_pit_events_for_different_drivers_stay_separate():
+    events = [
+        event(2, "pit", {"driver": "Bob Ray", "action": "entered"}, 0.5, 3,
+              focus=2),
+        event(1, "pit", {"driver": "Ann Lee", "action": "entered"}, 0.1, 1,
+              focus=1)
+    ]
+
+    assert coalescer.Coalescer().coalesce(events) == events
+
+
+def test_fastest_laps_with_the_same_time_stay_separate():
+    events = [
+        event(2, "fastest lap",
+              {"driver": "Bob Ray", "time": "1:30.000", "overall": False},
+              0.5, 2, focus=2),
+        event(1, "fastest lap",
+              {"driver": "Ann Lee", "time": "1:30.000", "overall": True},
+              0.1, 1, focus=1)
+    ]
+
+    assert coalescer.Coalescer().coalesce(events) == events
+
+
+def test_events_close_on_track_and_in_time_are_merged():
+    events = [
+        event(3, "overtake",
+              {"driver": "Cat Poe", "overtaken": "Ann Lee", "position": 4},
+              0.51, 2, focus=3),
+        event(2, "stopped", {"driver": "Ann Lee"}, 0.5, 1, focus=1),
+        event(1, "off track", {"driver": "Dan Orr"}, 0.9, 1, focus=4)
+    ]
+
+    coalesced = coalescer.Coalescer().coalesce(events)
+
+    assert [e["id"] for e in coalesced] == [2, 1]
+    assert coalesced[0]["type"] == "incident"
+    assert coalesced[0]["focus"] == 1
+    assert coalesced[0]["events"] == events[:2]
+
+
+def test_events_for_the_same_driver_are_merged_across_the_lap():
+    events = [
+        event(2, "stopped", {"driver": "Ann Lee"}, 0.6, 4),
+        event(1, "off track", {"driver": "Ann Lee"}, 0.1, 1)
+    ]
+
+    coalesced = coalescer.Coalescer().coalesce(events)
+
+    assert len(coalesced) == 1
+    assert coalesced[0]["description"] == "event 2; event 1"
+
+
+def test_events_far_apart_in_time_are_not_merged():
+    events = [
+        event(2, "stopped", {"driver": "Ann Lee"}, 0.5, 20),
+        event(1, "stopped", {"driver": "Bob Ray"}, 0.5, 1, corner=3)
+    ]
+    events[0]["corner"] = 3
+
+    assert coalescer.Coalescer().coalesce(events) == events
+
+
+def test_events_are_merged_across_the_start_finish_line():
+    events = [
+        event(2, "overtake",
+              {"driver": "Cat Poe", "overtaken": "Bob Ray", "position": 2},
+              0.005, 2),
+        event(1, "stopped", {"driver": "Ann Lee"}, 0.995, 1)
+    ]
+
+    coalesced = coalescer.Coalescer().coalesce(events)
+
+    assert len(coalesced) == 1
+    assert coalesced[0]["id"] == 1
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from core import corners
+
+
+def test_looks_up_corners_including_across_the_line():
+    corner_map = corners.CornerMap([
+        {"name": "Big Bend", "start": 0.05, "end": 0.17},
+        {"name": "the Chicane", "start": 0.95, "end": 0.02}
+    ])
+
+    assert corner_map.lookup(0.1) == "Big Bend"
+    assert corner_map.lookup(0.17) == "Big Bend"
+    assert corner_map.lookup(0.5) is None
+    assert corner_map.lookup(0.97) == "the Chicane"
+    assert corner_map.lookup(0.01) == "the Chicane"
+    assert corner_map.lookup(0.03) is None
+    assert corner_map.lookup(None) is None
+
+
+def test_overlapping_corners_are_rejected():
+    with pytest.raises(ValueError):
+        corners.CornerMap([
+            {"name": "Turn 1", "start": 0.1, "end": 0.2},
+            {"name": "Turn 2", "start": 0.15, "end": 0.3}
+        ])
+
+
+def test_tracks_without_a_corner_map_have_none(tmp_path):
+    path = tmp_path / "123.json"
+    path.write_text(json.dumps({
+        "track": "Test",
+        "corners": [{"name": "Turn 1", "start": 0.1, "end": 0.2}]
+    }))
+
+    assert corners.load_corner_map(tmp_path, 123).lookup(0.15) == "Turn 1"
+    assert corners.load_corner_map(tmp_path, 456) is None
@@ -0,0 +1,27 @@
+from configparser import ConfigParser
+
+from utility import defaults
+
+
+def test_missing_settings_are_added_to_existing_file(tmp_path):
+    file = tmp_path / "settings.ini"
+    file.write_text("[commentary]\npbp_voice = Custom\n")
+
+    defaults.create_settings_file(str(file))
+
+    settings = ConfigParser()
+    settings.read(file)
+    assert settings["commentary"]["pbp_voice"] == "Custom"
+    assert settings["commentary"]["color_voice"] == "Elli"
+    assert settings.has_option("system", "cache_dir")
+
+
+def test_complete_settings_file_is_not_rewritten(tmp_path):
+    file = tmp_path / "settings.ini"
+    defaults.create_settings_file(str(file))
+    contents = file.read_text() + "; a comment\n"
+    file.write_text(contents)
+
+    defaults.create_settings_file(str(file))
+
+    assert file.read_text() == contents
@@ -0,0 +1,81 @@
+import pytest
+
+from core import common
+from core import detectors
+from core import snapshot
+
+
+@pytest.fixture(autouse=True)
+def race():
+    common.race_started = True
+    common.all_cars_started = True
+
+
+def driver(idx, name, position, class_gap=0., last=None, fastest=None):
+    return {
+        "idx": idx,
+        "number": idx * 10,
+        "display_name": name,
+        "position": position,
+        "class_position": position,
+        "class_gap": class_gap,
+        "car_class": 1,
+        "class_name": "GT3",
+        "laps_completed": 3,
+        "lap_percent": 0.5,
+        "total_dist": 3.5,
+        "gap_to_leader": class_gap,
+        "last_lap_time": last,
+        "fastest_lap": fastest,
+        "in_pits": False,
+        "lap_times": []
+    }
+
+
+def race_at(session_time, drivers):
+    return snapshot.Snapshot(
+        drivers, session_time, [False] * snapshot.MAX_CARS,
+        [snapshot.ON_TRACK] * snapshot.MAX_CARS
+    )
+
+
+def test_battles_say_whether_they_started_or_intensified():
+    detector = detectors.BattleDetector(gap=1, min_duration=10, interval=30)
+
+    def battle(session_time, gap):
+        current = race_at(
+            session_time,
+            [driver(1, "Ann Lee", 1), driver(2, "Bob Ray", 2, gap)]
+        )
+        return detector.detect(current, current)
+
+    assert battle(100, 0.8) == []
+    started = battle(110, 0.8)
+    assert [e["data"]["stage"] for e in started] == ["started"]
+    assert started[0]["data"]["drivers"] == ["Ann Lee", "Bob Ray"]
+
+    # Closer, but too soon to report again
+    assert battle(120, 0.3) == []
+
+    intensifying = battle(140, 0.3)
+    assert [e["data"]["stage"] for e in intensifying] == ["intensifying"]
+    assert intensifying[0]["focus"] == 20
+
+
+def test_fastest_laps_tell_overall_bests_from_personal_bests():
+    detector = detectors.FastestLapDetector()
+    previous = race_at(100, [
+        driver(1, "Ann Lee", 1, last=90, fastest=90),
+        driver(2, "Bob Ray", 2, last=91, fastest=91)
+    ])
+    current = race_at(101, [
+        driver(1, "Ann Lee", 1, last=89, fastest=89),
+        driver(2, "Bob Ray", 2, last=88, fastest=88)
+    ])
+
+    found = {
+        e["data"]["driver"]: e["data"]["overall"]
+        for e in detector.detect(current, previous)
+    }
+
+    assert found == {"Ann Lee": False, "Bob Ray": True}
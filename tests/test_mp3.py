@@ -0,0 +1,33 @@
+from utility import mp3
+
+
+# An MPEG 1 layer 3 frame header at 128 kbps and 44.1 kHz, 417 bytes long
+HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+FRAME = HEADER + bytes(413)
+
+
+def test_counts_frames_fed_in_small_chunks():
+    counter = mp3.FrameCounter()
+    audio = FRAME * 10
+    for start in range(0, len(audio), 100):
+        counter.feed(audio[start:start + 100])
+
+    assert counter.frames == 10
+    assert abs(counter.duration - 10 * 1152 / 44100) < 1e-9
+
+
+def test_skips_id3_tag_and_xing_header():
+    tag = b"ID3\x04\x00\x00\x00\x00\x00\x05" + bytes(5)
+    xing = HEADER + bytes(32) + b"Xing" + bytes(377)
+
+    counter = mp3.FrameCounter()
+    counter.feed(tag + xing + FRAME * 2)
+
+    assert counter.frames == 2
+
+
+def test_incomplete_frame_is_not_counted():
+    counter = mp3.FrameCounter()
+    counter.feed(FRAME + FRAME[:200])
+
+    assert counter.frames == 1
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+from core import providers
+
+
+class FakeStream:
+    """An openai Stream of chunks which records when it is closed."""
+
+    def __init__(self, texts):
+        self.chunks = [
+            SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=text))]
+            )
+            for text in texts
+        ]
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.closed = True
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+
+def text_provider(stream):
+    """Create an OpenAIText whose client returns a stream."""
+    provider = providers.OpenAIText.__new__(providers.OpenAIText)
+    create = lambda **kwargs: stream
+    provider.client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    )
+    return provider
+
+
+def test_finished_stream_is_closed_and_usage_reported():
+    stream = FakeStream(["Hello", "", " there"])
+    usage = []
+
+    text = text_provider(stream).stream(
+        "model",
+        [{"role": "user", "content": "hi"}],
+        10,
+        on_usage=lambda prompt, completion: usage.append(completion)
+    )
+
+    assert "".join(text) == "Hello there"
+    assert stream.closed
+    assert usage == [2]
+
+
+def test_abandoned_stream_is_closed():
+    stream = FakeStream(["Hello", " there"])
+
+    text = text_provider(stream).stream("model", [], 10)
+    assert next(text) == "Hello"
+    text.close()
+
+    assert stream.closed
@@ -0,0 +1,80 @@
+from types import SimpleNamespace
+
+import pytest
+
+from core import common
+from core import quality
+
+
+@pytest.fixture(autouse=True)
+def app():
+    common.app = SimpleNamespace(add_message=lambda message: None)
+
+
+def test_steps_down_only_once_a_step_has_been_judged():
+    controller = quality.QualityController(target_latency=5, min_samples=3)
+
+    controller.record(9, 0)
+    controller.record(9, 0)
+    assert controller.step == 0
+
+    controller.record(9, 0)
+    assert controller.step == 1
+    assert controller.step_downs == 1
+
+
+def test_steps_down_when_events_pile_up():
+    controller = quality.QualityController(max_backlog=3, min_samples=1)
+
+    controller.record(1, 4)
+
+    assert controller.step == 1
+
+
+def test_lowest_step_uses_the_fallback_model_and_templates():
+    controller = quality.QualityController(
+        min_samples=1,
+        fallback_model="fast-model"
+    )
+
+    for _ in range(10):
+        controller.record(9, 0)
+
+    assert controller.step == len(quality.STEPS) - 1
+    assert controller.current()["model"] == "fast-model"
+    assert controller.current()["template_mode"] == "always"
+
+
+def test_steps_up_after_a_full_window_of_headroom():
+    controller = quality.QualityController(
+        target_latency=5,
+        window=3,
+        min_samples=1
+    )
+    controller.record(9, 0)
+    assert controller.step == 1
+
+    controller.record(1, 0)
+    controller.record(1, 0)
+    assert controller.step == 1
+
+    controller.record(1, 0)
+    assert controller.step == 0
+    assert controller.step_ups == 1
+
+
+def test_stays_within_the_allowed_steps():
+    controller = quality.QualityController(
+        min_step=1,
+        max_step=2,
+        min_samples=1
+    )
+    assert controller.step == 1
+
+    for _ in range(10):
+        controller.record(9, 0)
+    assert controller.step == 2
+
+    disabled = quality.QualityController(enabled=False, min_samples=1)
+    disabled.record(9, 9)
+    assert disabled.step == 0
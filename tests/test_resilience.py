@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from core import resilience
+
+
+def test_retries_only_temporary_errors():
+    tracker = resilience.LatencyTracker("test")
+    hedger = resilience.Hedger(tracker, deadline=1., retries=2)
+    calls = []
+
+    def fail(error):
+        calls.append(error)
+        raise error
+
+    with pytest.raises(TimeoutError):
+        hedger.call(lambda: fail(TimeoutError()))
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(ValueError):
+        hedger.call(lambda: fail(ValueError()))
+    assert len(calls) == 1
+    assert (tracker.retries, tracker.errors) == (2, 2)
+
+
+def test_attempt_past_deadline_times_out():
+    tracker = resilience.LatencyTracker("test")
+    hedger = resilience.Hedger(tracker, deadline=0.05, retries=0)
+
+    with pytest.raises(TimeoutError):
+        hedger.call(lambda: time.sleep(0.5))
+    assert tracker.timeouts == 1
+
+
+def test_slow_request_is_hedged_and_loser_discarded():
+    tracker = resilience.LatencyTracker("test")
+    for _ in range(10):
+        tracker.record(0.01)
+    hedger = resilience.Hedger(tracker, deadline=2., min_samples=10)
+
+    # The first request is slow, the duplicate is fast
+    requests = []
+    discarded = []
+    finished = threading.Event()
+
+    def request():
+        requests.append(None)
+        if len(requests) == 1:
+            time.sleep(0.3)
+            return "slow"
+        return "fast"
+
+    def discard(result):
+        discarded.append(result)
+        finished.set()
+
+    assert hedger.call(request, discard=discard) == "fast"
+    assert finished.wait(2.)
+    assert discarded == ["slow"]
+    assert (tracker.hedges, tracker.hedge_wins) == (1, 1)
+
+
+def test_no_hedging_without_enough_latencies():
+    tracker = resilience.LatencyTracker("test")
+    hedger = resilience.Hedger(tracker, deadline=1., min_samples=10)
+
+    assert hedger.call(lambda: "done") == "done"
+    assert tracker.hedges == 0
+    assert tracker.percentile(95, 10) is None
+
+
+def test_breaker_opens_on_errors_and_closes_after_probe():
+    probed = threading.Event()
+
+    def probe():
+        probed.set()
+
+    breaker = resilience.CircuitBreaker(
+        "test",
+        error_rate=0.5,
+        min_calls=2,
+        probe_interval=0.05,
+        probe=probe
+    )
+    hedger = resilience.Hedger(
+        resilience.LatencyTracker("test"),
+        deadline=1.,
+        retries=0,
+        breaker=breaker
+    )
+
+    def fail():
+        raise ValueError()
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            hedger.call(fail)
+    assert breaker.is_open
+
+    # Calls are refused while the circuit is open
+    with pytest.raises(resilience.CircuitOpenError):
+        hedger.call(lambda: "done")
+    assert breaker.refused == 1
+
+    # The circuit closes once the probe succeeds
+    assert probed.wait(1.)
+    deadline = time.time() + 1.
+    while breaker.is_open and time.time() < deadline:
+        time.sleep(0.01)
+    assert not breaker.is_open
+    assert hedger.call(lambda: "done") == "done"
+
+
+def test_breaker_opens_when_too_slow():
+    breaker = resilience.CircuitBreaker(
+        "test",
+        latency=1.,
+        min_calls=2,
+        probe_interval=60.
+    )
+    breaker.record(True, 2.)
+    assert not breaker.is_open
+    breaker.record(True, 3.)
+    assert breaker.is_open
+
+
+def test_reset_forgets_counters():
+    tracker = resilience.LatencyTracker("test")
+    tracker.record(1.)
+    tracker.count("calls")
+    tracker.reset()
+
+    assert tracker.calls == 0
+    assert tracker.percentile(50) is None
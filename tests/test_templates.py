@@ -0,0 +1,141 @@
+from configparser import ConfigParser
+
+import pytest
+
+from core import common
+from core import templates
+
+
+@pytest.fixture(autouse=True)
+def settings():
+    common.settings = ConfigParser()
+    common.settings.read_dict({
+        "commentary": {
+            "template_mode": "auto",
+            "template_top_positions": "3",
+            "llm_latency_budget": "4"
+        }
+    })
+
+
+def overtake(id, position=5):
+    return {
+        "id": id,
+        "type": "overtake",
+        "description": "A overtook B",
+        "data": {"driver": "Ann Lee", "overtaken": "Bob Ray",
+                 "position": position}
+    }
+
+
+def test_engine_describes_each_event_once():
+    engine = templates.TemplateEngine()
+    events = [overtake(1)]
+
+    assert "Lee" in engine.generate(events)
+    assert engine.generate(events) == ""
+
+
+def test_events_covered_by_the_llm_are_not_repeated():
+    engine = templates.TemplateEngine()
+    incident = {
+        "id": 1,
+        "type": "incident",
+        "description": "",
+        "data": None,
+        "events": [overtake(1), overtake(2)]
+    }
+    engine.mark_reported([incident])
+
+    assert engine.generate([overtake(2), overtake(1)]) == ""
+
+
+def test_reported_ids_are_trimmed_to_the_event_history():
+    engine = templates.TemplateEngine()
+    engine.generate([overtake(1)])
+    engine.generate([overtake(2)])
+
+    assert engine.reported == {2}
+
+
+def test_policy_uses_templates_for_routine_events():
+    class Tracker:
+        def percentile(self, percent):
+            return None
+
+    policy = templates.CommentaryPolicy(templates.TemplateEngine(), Tracker())
+    stopped = {
+        "id": 3,
+        "type": "stopped",
+        "description": "",
+        "data": {"driver": "Ann Lee"}
+    }
+
+    assert policy.choose([overtake(1)], "play-by-play") == "template"
+    assert policy.choose([stopped], "play-by-play") == "template"
+    assert policy.choose([overtake(1, position=1)], "play-by-play") == "llm"
+
+
+def test_always_mode_never_uses_the_llm():
+    class Tracker:
+        def percentile(self, percent):
+            return None
+
+    common.settings["commentary"]["template_mode"] = "always"
+    engine = templates.TemplateEngine()
+    policy = templates.CommentaryPolicy(engine, Tracker())
+    scramble = {
+        "id": 4,
+        "type": "position scramble",
+        "description": "Several cars swapped places",
+        "data": None,
+        "events": [overtake(1), overtake(2)]
+    }
+    pit = {
+        "id": 5,
+        "type": "pit",
+        "description": "Ann Lee entered the pits",
+        "data": {"driver": "Ann Lee", "action": "entered"}
+    }
+
+    assert policy.choose([scramble, pit], "play-by-play") == "template"
+    commentary = engine.generate([pit, scramble])
+
+    assert "Lee" in commentary and "entered" in commentary
+    assert commentary.endswith("Several cars swapped places.")
+    assert engine.reported == {1, 2, 4, 5}
+
+
+def test_templates_join_names_and_pick_fastest_lap_phrases():
+    engine = templates.TemplateEngine()
+    battle = {
+        "id": 1,
+        "type": "battle",
+        "description": "",
+        "data": {"drivers": ["Ann Lee", "Bob Ray"], "position": 4,
+                 "gap": 0.5}
+    }
+    personal = {
+        "id": 2,
+        "type": "fastest lap",
+        "description": "",
+        "data": {"driver": "Ann Lee", "time": "1:32.456", "overall": False}
+    }
+
+    assert "Lee and Ray" in engine.generate([battle])
+    assert "1:32.456" in engine.generate([personal])
+    assert "personal best" in engine.last_used
+
+
+def test_intensifying_battles_have_their_own_phrases():
+    engine = templates.TemplateEngine()
+    battle = {
+        "id": 1,
+        "type": "battle",
+        "description": "",
+        "data": {"drivers": ["Ann Lee", "Bob Ray"], "position": 4,
+                 "gap": 0.2, "stage": "intensifying"}
+    }
+
+    assert "Lee and Ray" in engine.generate([battle])
+    assert list(engine.last_used) == ["battle intensifying"]